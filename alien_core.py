@@ -0,0 +1,287 @@
+import random
+from hires_timing import elapsed_ms
+
+# Alien Defense game logic shared by the pygame front end (game.py) and the
+# headless simulator (alien_sim.py). Times are in milliseconds from whatever
+# clock the caller uses; nothing in here touches the display.
+
+WIDTH, HEIGHT = 800, 600
+FPS = 60
+STEP_MS = 1000 / FPS  # fixed simulation step; alien speeds are pixels per step
+MAX_STEPS_PER_FRAME = 8  # catch-up limit after a long frame
+ALIEN_SIZE = 50
+GO_PROBABILITY = 0.7
+EXPLOSION_MS = 250
+
+# Speed control
+START_ALIEN_SPEED = 2
+START_SPAWN_DELAY = 1000
+min_spawn_delay = 200
+max_alien_speed = 6
+difficulty_interval = 5000  # every 5 seconds
+
+# Timing
+game_duration = 60  # seconds
+
+
+# Spatial hash cell size; at least ALIEN_SIZE so an alien touches at most 4 cells
+HASH_CELL = 64
+
+
+# Alien Class
+class Alien:
+    __slots__ = ("kind", "x", "y", "prev_y", "spawn_time", "onset_ns", "responded", "exploding",
+                 "explode_time", "serial", "index", "cells", "top_row", "bottom_row")
+
+    def __init__(self):
+        self.cells = ()
+        self.top_row = self.bottom_row = None
+
+    def reset(self, kind, x, spawn_time, serial, y=-60):
+        self.kind = kind
+        self.x = x
+        self.y = y
+        self.prev_y = y  # position before the last step, for interpolated drawing
+        self.spawn_time = spawn_time
+        self.onset_ns = None  # perf_counter_ns of the first flip that showed this alien
+        self.responded = False
+        self.exploding = False
+        self.explode_time = 0
+        self.serial = serial  # spawn order, breaks ties between overlapping aliens
+        self.index = -1  # position in AlienWorld.aliens
+        return self
+
+    def update(self, speed):
+        self.prev_y = self.y
+        if not self.exploding:
+            self.y += speed
+
+    def render_y(self, alpha=1.0):
+        """Position `alpha` of the way from the previous step to the current one"""
+        return self.prev_y + (self.y - self.prev_y) * alpha
+
+    def visible(self, alpha=1.0):
+        """True once any part of the alien is inside the window"""
+        return self.render_y(alpha) + ALIEN_SIZE > 0
+
+    def collidepoint(self, px, py, alpha=1.0):
+        # Same edges as pygame.Rect.collidepoint on the integer rect
+        top = int(self.render_y(alpha))
+        return self.x <= px < self.x + ALIEN_SIZE and top <= py < top + ALIEN_SIZE
+
+    def trigger_explosion(self, now):
+        self.exploding = True
+        self.explode_time = now
+
+
+class AlienPool:
+    """Free list of Alien records so spawning doesn't allocate"""
+    def __init__(self):
+        self._free = []
+
+    def acquire(self, kind, x, spawn_time, serial, y=-60):
+        alien = self._free.pop() if self._free else Alien()
+        return alien.reset(kind, x, spawn_time, serial, y)
+
+    def release(self, alien):
+        self._free.append(alien)
+
+
+class SpatialHash:
+    """Uniform grid of buckets for point hit-tests against aliens.
+
+    Each alien is bucketed by the span from its previous to its current
+    position, so it can be found wherever it is drawn in between.
+    """
+    def __init__(self, cell=HASH_CELL):
+        self.cell = cell
+        self.buckets = {}
+
+    def insert(self, alien):
+        c = self.cell
+        alien.top_row = int(min(alien.prev_y, alien.y)) // c
+        alien.bottom_row = (int(alien.y) + ALIEN_SIZE - 1) // c
+        alien.cells = tuple((cx, cy)
+                            for cy in range(alien.top_row, alien.bottom_row + 1)
+                            for cx in range(alien.x // c, (alien.x + ALIEN_SIZE - 1) // c + 1))
+        for key in alien.cells:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                self.buckets[key] = bucket = set()
+            bucket.add(alien)
+
+    def remove(self, alien):
+        for key in alien.cells:
+            bucket = self.buckets[key]
+            bucket.discard(alien)
+            if not bucket:
+                del self.buckets[key]
+        alien.cells = ()
+
+    def move(self, alien):
+        """Re-bucket an alien after it moved; cheap when it stays in the same cells"""
+        c = self.cell
+        if (int(min(alien.prev_y, alien.y)) // c != alien.top_row
+                or (int(alien.y) + ALIEN_SIZE - 1) // c != alien.bottom_row):
+            self.remove(alien)
+            self.insert(alien)
+
+    def query(self, px, py):
+        return self.buckets.get((px // self.cell, py // self.cell), ())
+
+
+class AlienWorld:
+    """Aliens, score and the difficulty ramp for one Alien Defense session.
+
+    `on_response(alien, action, correct, rt, response_ns)` is called for every
+    shot and every alien that leaves the screen unanswered. Alien records are
+    pooled and removed by swapping with the last entry, so `aliens` is not in
+    spawn order; `serial` is.
+
+    The world advances in fixed STEP_MS steps via step(), so motion, spawns and
+    the difficulty ramp depend only on the step count, never on how long
+    frames take to render. `alpha` is how far the renderer is between the
+    last two steps; hit-tests and onsets use the interpolated positions.
+    """
+    def __init__(self, start_time=0, rng=None, on_response=None):
+        self.rng = rng or random.Random()
+        self.on_response = on_response
+        self.start_time = start_time
+        self.score = 0
+        self.hits = 0
+        self.misses = 0
+        self.aliens = []
+        self.pool = AlienPool()
+        self.grid = SpatialHash()
+        self.spawned = 0
+        self.next_spawn_time = 0
+        self.alien_speed = START_ALIEN_SPEED
+        self.spawn_delay = START_SPAWN_DELAY
+        self.difficulty_timer = 0
+        self.steps = 0
+        self.time = start_time  # simulation time in ms
+        self.alpha = 1.0
+
+    def _report(self, alien, action, correct, rt=None, response_ns=None):
+        if self.on_response:
+            self.on_response(alien, action, correct, rt, response_ns)
+
+    def _add(self, kind, x, now, y=-60):
+        alien = self.pool.acquire(kind, x, now, self.spawned, y)
+        self.spawned += 1
+        alien.index = len(self.aliens)
+        self.aliens.append(alien)
+        self.grid.insert(alien)
+        return alien
+
+    def _remove(self, alien):
+        # Swap-remove: move the last alien into this slot
+        last = self.aliens.pop()
+        if last is not alien:
+            self.aliens[alien.index] = last
+            last.index = alien.index
+        self.grid.remove(alien)
+        self.pool.release(alien)
+
+    def finished(self):
+        return (self.time - self.start_time) / 1000 > game_duration
+
+    def step(self):
+        """Advance the simulation by one fixed STEP_MS"""
+        self.steps += 1
+        self.time = self.start_time + self.steps * STEP_MS
+        self.update_difficulty(self.time)
+        self.spawn_due(self.time)
+        self.update(self.time)
+
+    def update_difficulty(self, now):
+        # Increase difficulty every 5 seconds
+        if now - self.difficulty_timer > difficulty_interval:
+            self.difficulty_timer = now
+            if self.spawn_delay > min_spawn_delay:
+                self.spawn_delay = max(self.spawn_delay - 150, min_spawn_delay)
+            if self.alien_speed < max_alien_speed:
+                self.alien_speed = min(self.alien_speed + 0.7, max_alien_speed)
+
+    def alien_at(self, mx, my, response_ns=None):
+        """Earliest-spawned shootable alien under (mx, my), or None.
+
+        With `response_ns`, aliens whose onset flip came after it don't
+        count: the click was stamped before they were on screen.
+        """
+        target = None
+        for alien in self.grid.query(mx, my):
+            if (not alien.responded and alien.onset_ns is not None
+                    and (response_ns is None or alien.onset_ns <= response_ns)
+                    and alien.collidepoint(mx, my, self.alpha)
+                    and (target is None or alien.serial < target.serial)):
+                target = alien
+        return target
+
+    def shoot(self, mx, my, response_ns):
+        """Resolve a click at (mx, my); returns the alien hit, or None"""
+        alien = self.alien_at(mx, my, response_ns)
+        if alien is None:
+            return None
+
+        rt = elapsed_ms(alien.onset_ns, response_ns)
+        alien.responded = True
+        alien.trigger_explosion(self.time)
+        if alien.kind == "go":
+            self.score += 10
+            self.hits += 1
+            self._report(alien, "Shoot", True, rt, response_ns)
+        else:
+            self.score -= 5
+            self.misses += 1
+            self._report(alien, "Shoot", False, rt, response_ns)
+        return alien
+
+    def spawn_due(self, now):
+        """Spawn a new alien if the spawn timer has run out; returns it, or None"""
+        if now < self.next_spawn_time:
+            return None
+        kind = "go" if self.rng.random() < GO_PROBABILITY else "nogo"
+        alien = self._add(kind, self.rng.randint(100, WIDTH - 100), now)
+        self.next_spawn_time = now + self.spawn_delay
+        return alien
+
+    def fill_to(self, count, now):
+        """Stress mode: top the field up to `count` aliens scattered over the screen"""
+        while len(self.aliens) < count:
+            kind = "go" if self.rng.random() < GO_PROBABILITY else "nogo"
+            self._add(kind, self.rng.randint(0, WIDTH - ALIEN_SIZE), now,
+                      self.rng.randint(-60, HEIGHT - ALIEN_SIZE))
+
+    def update(self, now):
+        """Move aliens, then retire the ones that left the screen or finished exploding"""
+        speed = self.alien_speed
+        grid = self.grid
+        aliens = self.aliens
+        # Walk backwards so swap-remove only moves aliens that were already visited
+        for i in range(len(aliens) - 1, -1, -1):
+            alien = aliens[i]
+            alien.update(speed)
+
+            if not alien.responded and alien.y > HEIGHT:
+                alien.responded = True
+                if alien.kind == "go":
+                    self._report(alien, "No Shot", False)
+                    self.misses += 1
+                else:
+                    self._report(alien, "No Shot", True)
+                self._remove(alien)
+            elif alien.exploding and now - alien.explode_time > EXPLOSION_MS:
+                self._remove(alien)
+            elif not alien.exploding:
+                grid.move(alien)
+
+    def mark_onsets(self, flip_ns):
+        """Record `flip_ns` as onset for aliens shown for the first time; returns them"""
+        shown = []
+        for alien in self.aliens:
+            # Onset is the first flip where any part of the alien is on screen
+            if alien.onset_ns is None and alien.visible(self.alpha):
+                alien.onset_ns = flip_ns
+                shown.append(alien)
+        return shown
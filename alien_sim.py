@@ -0,0 +1,119 @@
+import random
+import statistics
+from alien_core import STEP_MS, AlienWorld, ALIEN_SIZE
+from nback_core import PREMATURE_RT_MS, LATE_RT_MS
+
+# Headless Alien Defense engine: runs alien_core on a virtual frame clock with
+# a synthetic shooter instead of a window and a mouse.
+
+
+class ShooterResponder:
+    """Shoots go aliens with `hit_rate` and no-go aliens with `commission_rate`.
+
+    RTs are normal with an optional exponential tail, measured from the frame
+    the alien first appears.
+    """
+    def __init__(self, hit_rate=0.85, commission_rate=0.2, rt_mean=450, rt_sd=100, tau=0, min_rt=100):
+        self.hit_rate = hit_rate
+        self.commission_rate = commission_rate
+        self.rt_mean = rt_mean
+        self.rt_sd = rt_sd
+        self.tau = tau
+        self.min_rt = min_rt
+
+    def respond(self, alien, world, rng):
+        p_shoot = self.hit_rate if alien.kind == "go" else self.commission_rate
+        if rng.random() >= p_shoot:
+            return None
+        rt = max(self.min_rt, rng.gauss(self.rt_mean, self.rt_sd))
+        if self.tau:
+            rt += rng.expovariate(1 / self.tau)
+        return rt
+
+
+RESPONDERS = {
+    "shooter": lambda: ShooterResponder(),
+    "impulsive": lambda: ShooterResponder(commission_rate=0.5, rt_mean=260, rt_sd=80),
+    "sluggish": lambda: ShooterResponder(hit_rate=0.7, rt_mean=700, rt_sd=200, tau=300),
+}
+
+
+def run_session(responder, seed=0, frame_ms=STEP_MS, keep_rows=True,
+                premature_threshold=PREMATURE_RT_MS, late_threshold=LATE_RT_MS):
+    """Play one full Alien Defense session headlessly and return its results.
+
+    The world advances in the same fixed steps as the live game; `frame_ms`
+    is the simulated render interval, which only affects when clicks and
+    onsets are observed, never how the aliens move.
+    """
+    rng = random.Random(seed)
+    rows = []
+
+    def record(alien, action, correct, rt, response_ns):
+        rows.append((alien.kind, action, correct, rt))
+
+    world = AlienWorld(rng=random.Random(rng.getrandbits(64)), on_response=record)
+    shots = []  # (time_ms, alien, serial); records are pooled, serial tells them apart
+    accumulator = 0.0
+    now = 0.0
+
+    while True:
+        now += frame_ms
+        if world.finished():
+            break
+
+        # Clicks that landed during the last frame, aimed at the alien's centre as drawn
+        due = [shot for shot in shots if shot[0] <= now]
+        if due:
+            shots = [shot for shot in shots if shot[0] > now]
+            for shot_time, alien, serial in due:
+                if alien.serial == serial and alien.cells:
+                    cx = alien.x + ALIEN_SIZE // 2
+                    cy = int(alien.render_y(world.alpha)) + ALIEN_SIZE // 2
+                    world.shoot(cx, cy, int(shot_time * 1_000_000))
+
+        accumulator += frame_ms
+        while accumulator >= STEP_MS:
+            world.step()
+            accumulator -= STEP_MS
+        world.alpha = accumulator / STEP_MS
+
+        for alien in world.mark_onsets(int(now * 1_000_000)):
+            rt = responder.respond(alien, world, rng)
+            if rt is not None:
+                shots.append((now + rt, alien, alien.serial))
+
+    return summarize_session(world, rows, seed, premature_threshold, late_threshold, keep_rows)
+
+
+def summarize_session(world, rows, seed=None, premature_threshold=PREMATURE_RT_MS,
+                      late_threshold=LATE_RT_MS, keep_rows=True):
+    """Session-level results in a flat dict"""
+    rts = [rt for kind, action, correct, rt in rows if rt is not None]
+    go_rows = [row for row in rows if row[0] == "go"]
+    nogo_rows = [row for row in rows if row[0] != "go"]
+    return {
+        'session_id': f"sim_{seed}",
+        'seed': seed,
+        'trials': len(rows),
+        'score': world.score,
+        'hits': sum(1 for kind, action, correct, rt in go_rows if correct),
+        'omissions': sum(1 for kind, action, correct, rt in go_rows if not correct),
+        'commissions': sum(1 for kind, action, correct, rt in nogo_rows if not correct),
+        'correct_withholds': sum(1 for kind, action, correct, rt in nogo_rows if correct),
+        'accuracy': sum(1 for row in rows if row[2]) / len(rows) if rows else 0,
+        'rt_mean': statistics.fmean(rts) if rts else None,
+        'rt_sd': statistics.stdev(rts) if len(rts) > 1 else None,
+        'premature_responses': sum(1 for rt in rts if rt < premature_threshold),
+        'late_responses': sum(1 for rt in rts if rt > late_threshold),
+        'rows': rows if keep_rows else None,
+    }
+
+
+if __name__ == "__main__":
+    import time
+    start = time.perf_counter()
+    result = run_session(RESPONDERS["shooter"](), seed=1)
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"{result['trials']} aliens, score {result['score']}, "
+          f"accuracy {result['accuracy']:.0%} in {elapsed:.1f} ms")
@@ -0,0 +1,339 @@
+import os
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import csv
+import gc
+import itertools
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from statistics import NormalDist
+
+import numpy as np
+
+import log_segments
+from nback_core import NBACK_LOG_FILE, PREMATURE_RT_MS, LATE_RT_MS
+from trial_logger import LOG_ENCODING
+
+# Per-session metrics for both games' logs, computed column-wise with NumPy:
+#   python analytics.py nback
+#   python analytics.py alien --file adhd_log.csv --workers 8 --out alien_sessions.csv
+# Logs are parsed in chunks of rows into NumPy columns; big files are split
+# into byte ranges and parsed by a process pool. Every metric is then a
+# grouped bincount over the whole column, never a loop over trials. Logs that
+# have been rotated are read across their segments (see log_segments.py).
+
+ALIEN_LOG_FILE = "adhd_log.csv"
+CHUNK_ROWS = 50_000
+PARALLEL_MIN_BYTES = 8 * 1024 * 1024  # below this a process pool costs more than it saves
+SESSION_GAP_S = 30  # legacy adhd_log rows further apart than this start a new session
+
+# Columns each analysis needs and how to convert them
+NBACK_COLUMNS = {
+    "Session": "str", "IsMatch": "bool", "UserPressed": "bool", "Correct": "bool", "RT": "float",
+    "PrematureResponse": "bool", "LateResponse": "bool", "AttentionLapse": "bool",
+    "ImpulsivityScore": "float",
+}
+ALIEN_COLUMNS = {
+    "Timestamp": "str", "Stimulus": "str", "Action": "str", "Reaction_Time_ms": "float",
+    "Session": "str",
+}
+
+
+def _convert(values, kind):
+    if kind == "str":
+        return np.array(values, dtype=str)
+    # Object arrays compare and parse element-wise in C, much faster than fixed-width strings
+    array = np.array(values, dtype=object)
+    if kind == "bool":
+        return array == "Yes"
+    array[array == ""] = "nan"
+    return array.astype(np.float64)
+
+
+def _columns_from_rows(rows, header, columns):
+    """Turn parsed CSV rows into {name: array}; rows older than the header are padded"""
+    width = len(header)
+    if rows and min(map(len, rows)) < width:
+        rows = [row if len(row) >= width else row + [""] * (width - len(row)) for row in rows]
+    fields = list(zip(*rows)) if rows else [()] * width
+    result = {}
+    for name, kind in columns.items():
+        values = fields[header.index(name)] if name in header else [""] * len(rows)
+        result[name] = _convert(values, kind)
+    return result
+
+
+@contextmanager
+def gc_paused():
+    """Parsing builds hundreds of thousands of small lists that can't form
+    cycles; without this the cyclic GC rescans them over and over."""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def read_header(path):
+    with open(path, newline='') as f:
+        return next(csv.reader(f), [])
+
+
+def _log_files(path):
+    """The log's rotated segments and the active file, or just `path` if it was never rotated"""
+    return log_segments.segment_files(path) or [path]
+
+
+def iter_chunks(path, columns, chunk_rows=CHUNK_ROWS):
+    """Yield {name: array} for successive blocks of `chunk_rows` rows, across rotated segments"""
+    for file in _log_files(path):
+        with log_segments.open_text(file) as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if header is None:
+                continue
+            while True:
+                with gc_paused():
+                    rows = list(itertools.islice(reader, chunk_rows))
+                    if not rows:
+                        break
+                    chunk = _columns_from_rows(rows, header, columns)
+                yield chunk
+
+
+def _byte_ranges(path, parts):
+    """Split the data part of a CSV into `parts` byte ranges"""
+    with open(path, 'rb') as f:
+        f.readline()
+        data_start = f.tell()
+    size = os.path.getsize(path)
+    bounds = [data_start + (size - data_start) * i // parts for i in range(parts + 1)]
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def _load_range(job):
+    """Worker: parse the lines that start inside [start, end), or a whole (compressed) segment"""
+    path, start, end, header, columns = job
+    if start is None:
+        return _concat(list(iter_chunks(path, columns)), columns)
+    lines = []
+    with open(path, 'rb') as f:
+        # Finish the line that straddles `start`; a line beginning exactly at `start` is kept
+        f.seek(start - 1)
+        pos = start - 1 + len(f.readline())
+        while pos < end:
+            line = f.readline()
+            if not line:
+                break
+            pos += len(line)
+            lines.append(line.decode(LOG_ENCODING, errors='replace'))  # as CSVSink encoded it
+    with gc_paused():
+        return _columns_from_rows(list(csv.reader(lines)), header, columns)
+
+
+def _concat(chunks, columns):
+    if not chunks:
+        return {name: _convert([], kind) for name, kind in columns.items()}
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in columns}
+
+
+def load_log(path, columns, chunk_rows=CHUNK_ROWS, workers=0):
+    """Load the needed columns of a log as {name: array}, in file order.
+
+    workers=0 picks a process pool for files over PARALLEL_MIN_BYTES and
+    parses smaller ones in this process; workers=1 never starts a pool.
+    """
+    files = _log_files(path)
+    if workers == 0:
+        size = sum(os.path.getsize(file) for file in files)
+        workers = os.cpu_count() if size >= PARALLEL_MIN_BYTES else 1
+    if workers <= 1:
+        return _concat(list(iter_chunks(path, columns, chunk_rows)), columns)
+
+    jobs = []
+    for file in files:
+        if file.endswith(tuple(log_segments.EXTENSIONS.values())):
+            jobs.append((file, None, None, None, columns))
+        else:
+            header = read_header(file)
+            jobs += [(file, start, end, header, columns) for start, end in _byte_ranges(file, workers * 4)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return _concat(list(pool.map(_load_range, jobs)), columns)
+
+
+def infer_sessions(sessions, timestamps, gap_s=SESSION_GAP_S):
+    """Fill in blank Session values from timestamp gaps.
+
+    adhd_log.csv rows written before the Session column existed have no
+    session; consecutive blank rows less than `gap_s` seconds apart are taken
+    to be one session, labelled legacy_<first timestamp>.
+    """
+    missing = sessions == ""
+    if not missing.any():
+        return sessions
+    seconds = timestamps.astype("datetime64[s]").astype(np.int64)
+    gaps = np.diff(seconds)
+    starts = np.ones(len(sessions), dtype=bool)
+    starts[1:] = (gaps > gap_s) | (gaps < 0) | ~missing[:-1]
+    run = np.cumsum(starts) - 1
+    start_times = np.datetime_as_string(timestamps[starts].astype("datetime64[s]"))
+    labels = np.char.add("legacy_", np.char.translate(start_times, str.maketrans("T", "_", "-:")))
+    sessions = sessions.astype(object)
+    sessions[missing] = labels[run[missing]]
+    return sessions.astype(str)
+
+
+def group_sessions(sessions):
+    """(names, codes): session names in order of first appearance and each row's index into them"""
+    names, first, codes = np.unique(sessions, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return names[order], rank[codes.ravel()]
+
+
+def grouped_rt(codes, rt, groups):
+    """Per-group count, mean, SD and coefficient of variation of the non-NaN RTs"""
+    valid = ~np.isnan(rt)
+    c, x = codes[valid], rt[valid]
+    count = np.bincount(c, minlength=groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.bincount(c, x, minlength=groups) / count
+        squares = np.bincount(c, (x - mean[c]) ** 2, minlength=groups)
+        sd = np.where(count > 1, np.sqrt(squares / (count - 1)), np.nan)
+        cv = sd / mean
+    return count, mean, sd, cv
+
+
+_norm_ppf = np.vectorize(NormalDist().inv_cdf, otypes=[float])
+
+
+def signal_detection(hits, misses, false_alarms, correct_rejections):
+    """Hit rate, false-alarm rate, d′ and criterion c per group.
+
+    d′ and c use the log-linear correction (add 0.5 to each count and 1 to
+    each total) so perfect or empty cells still give finite values.
+    """
+    signal = hits + misses
+    noise = false_alarms + correct_rejections
+    with np.errstate(invalid='ignore', divide='ignore'):
+        hit_rate = hits / signal
+        fa_rate = false_alarms / noise
+    z_hit = _norm_ppf((hits + 0.5) / (signal + 1))
+    z_fa = _norm_ppf((false_alarms + 0.5) / (noise + 1))
+    return hit_rate, fa_rate, z_hit - z_fa, -(z_hit + z_fa) / 2
+
+
+def _counts(codes, masks, groups):
+    return [np.bincount(codes[mask], minlength=groups) for mask in masks]
+
+
+def nback_metrics(columns):
+    """Per-session metrics for nback_sessions.csv columns, as {name: array}"""
+    names, codes = group_sessions(columns["Session"])
+    groups = len(names)
+    target, pressed = columns["IsMatch"], columns["UserPressed"]
+    hits, misses, false_alarms, correct_rejections = _counts(
+        codes, [target & pressed, target & ~pressed, ~target & pressed, ~target & ~pressed], groups)
+    trials = np.bincount(codes, minlength=groups)
+    correct, premature, late, lapses = _counts(
+        codes, [columns["Correct"], columns["PrematureResponse"], columns["LateResponse"],
+                columns["AttentionLapse"]], groups)
+    hit_rate, fa_rate, d_prime, criterion = signal_detection(hits, misses, false_alarms, correct_rejections)
+    rt_count, rt_mean, rt_sd, rt_cv = grouped_rt(codes, columns["RT"], groups)
+    impulsivity = np.bincount(codes, np.nan_to_num(columns["ImpulsivityScore"]), minlength=groups)
+    return {
+        'session': names, 'trials': trials, 'hits': hits, 'misses': misses,
+        'false_alarms': false_alarms, 'correct_rejections': correct_rejections,
+        'accuracy': correct / trials, 'hit_rate': hit_rate, 'fa_rate': fa_rate,
+        'd_prime': d_prime, 'criterion': criterion, 'rt_count': rt_count, 'rt_mean': rt_mean,
+        'rt_sd': rt_sd, 'rt_cv': rt_cv, 'premature_responses': premature,
+        'late_responses': late, 'attention_lapses': lapses, 'impulsivity_score': impulsivity,
+    }
+
+
+def alien_metrics(columns, session_gap_s=SESSION_GAP_S,
+                  premature_threshold=PREMATURE_RT_MS, late_threshold=LATE_RT_MS):
+    """Per-session metrics for adhd_log.csv columns, as {name: array}.
+
+    Go aliens are the signal: shooting one is a hit, letting it pass an
+    omission; shooting a no-go alien is a commission (false alarm).
+    """
+    sessions = infer_sessions(columns["Session"], columns["Timestamp"], session_gap_s)
+    names, codes = group_sessions(sessions)
+    groups = len(names)
+    go, shot = columns["Stimulus"] == "Go", columns["Action"] == "Shoot"
+    hits, omissions, commissions, withholds = _counts(
+        codes, [go & shot, go & ~shot, ~go & shot, ~go & ~shot], groups)
+    trials = np.bincount(codes, minlength=groups)
+    rt = np.where(shot, columns["Reaction_Time_ms"], np.nan)
+    with np.errstate(invalid='ignore'):
+        premature, late = _counts(codes, [rt < premature_threshold, rt > late_threshold], groups)
+    hit_rate, fa_rate, d_prime, criterion = signal_detection(hits, omissions, commissions, withholds)
+    rt_count, rt_mean, rt_sd, rt_cv = grouped_rt(codes, rt, groups)
+    return {
+        'session': names, 'trials': trials, 'hits': hits, 'omissions': omissions,
+        'commissions': commissions, 'correct_withholds': withholds,
+        'accuracy': (hits + withholds) / trials, 'hit_rate': hit_rate, 'fa_rate': fa_rate,
+        'd_prime': d_prime, 'criterion': criterion, 'rt_count': rt_count, 'rt_mean': rt_mean,
+        'rt_sd': rt_sd, 'rt_cv': rt_cv, 'premature_responses': premature, 'late_responses': late,
+    }
+
+
+def write_metrics(metrics, out):
+    """Write {name: array} as one CSV row per session; NaN becomes an empty field"""
+    names = list(metrics)
+    writer = csv.writer(out)
+    writer.writerow(names)
+    columns = []
+    for name in names:
+        values = metrics[name]
+        if values.dtype.kind == 'f':
+            values = np.where(np.isnan(values), "", np.round(values, 4).astype(str))
+        columns.append(values.tolist())
+    writer.writerows(zip(*columns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-session metrics from the game logs")
+    parser.add_argument("game", choices=["nback", "alien"])
+    parser.add_argument("--file", default=None, help="log to read (default: the game's own log)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="parsing processes (default: all cores for large files, else 1)")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--session-gap", type=float, default=SESSION_GAP_S,
+                        help="alien only: seconds between legacy rows that start a new session")
+    parser.add_argument("--premature-ms", type=float, default=PREMATURE_RT_MS, help="alien only")
+    parser.add_argument("--late-ms", type=float, default=LATE_RT_MS, help="alien only")
+    parser.add_argument("--out", default="-", help="per-session CSV output (default: stdout)")
+    args = parser.parse_args(argv)
+
+    path = args.file or (NBACK_LOG_FILE if args.game == "nback" else ALIEN_LOG_FILE)
+    start = time.perf_counter()
+    if args.game == "nback":
+        columns = load_log(path, NBACK_COLUMNS, args.chunk_rows, args.workers)
+        metrics = nback_metrics(columns)
+    else:
+        columns = load_log(path, ALIEN_COLUMNS, args.chunk_rows, args.workers)
+        metrics = alien_metrics(columns, args.session_gap, args.premature_ms, args.late_ms)
+    elapsed = time.perf_counter() - start
+
+    out = sys.stdout if args.out == "-" else open(args.out, "w", newline="")
+    try:
+        write_metrics(metrics, out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    rows = len(next(iter(columns.values())))
+    print(f"{rows} trials, {len(metrics['session'])} sessions from {path} in {elapsed:.2f}s",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
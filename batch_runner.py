@@ -0,0 +1,127 @@
+import os
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import csv
+import itertools
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import alien_sim
+import nback_sim
+from nback_core import PREMATURE_RT_MS, LATE_RT_MS
+
+# Fans simulated sessions of either game out over a process pool, e.g.
+#   python batch_runner.py nback --sessions 5000 --premature-ms 150 200 250 --late-ms 1500 1800
+#   python batch_runner.py alien --sessions 500 --responder impulsive --out alien_runs.csv
+
+SUMMARY_FIELDS = {
+    "nback": ["trials", "score", "hits", "misses", "false_alarms", "correct_rejections",
+              "accuracy", "rt_mean", "rt_sd", "rt_p50", "rt_p90", "premature_responses",
+              "late_responses", "attention_lapses"],
+    "alien": ["trials", "score", "hits", "omissions", "commissions", "correct_withholds",
+              "accuracy", "rt_mean", "rt_sd", "premature_responses", "late_responses"],
+}
+
+
+def session_seed(base_seed, index):
+    """Deterministic per-session seed, independent of worker count and run order"""
+    return random.Random(f"{base_seed}:{index}").getrandbits(32)
+
+
+def run_job(job):
+    """Run one simulated session in a worker process"""
+    game, responder_name, params, index, seed = job
+    if game == "nback":
+        responder = nback_sim.RESPONDERS[responder_name]()
+        result = nback_sim.run_session(responder, seed, keep_rows=False, **params)
+    else:
+        responder = alien_sim.RESPONDERS[responder_name]()
+        result = alien_sim.run_session(responder, seed, keep_rows=False, **params)
+    row = {"session": index, "seed": seed, **params}
+    row.update((field, result[field]) for field in SUMMARY_FIELDS[game])
+    return row
+
+
+def build_jobs(args):
+    """One job per (parameter combination, session); sessions reuse seeds across combinations"""
+    sweep = {
+        "premature_threshold": args.premature_ms,
+        "late_threshold": args.late_ms,
+    }
+    if args.game == "nback":
+        sweep["n_back"] = args.n_back
+        sweep["trial_count"] = [args.trials]
+
+    names = list(sweep)
+    for values in itertools.product(*(sweep[name] for name in names)):
+        params = dict(zip(names, values))
+        for index in range(args.sessions):
+            yield (args.game, args.responder, params, index, session_seed(args.seed, index))
+
+
+def print_sweep_summary(rows, param_names, out):
+    """Mean of the key metrics per parameter combination"""
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(row[name] for name in param_names), []).append(row)
+
+    print("  ".join(param_names) + "  sessions  premature  late  accuracy", file=out)
+    for key in sorted(groups):
+        group = groups[key]
+        premature = statistics.fmean(row["premature_responses"] for row in group)
+        late = statistics.fmean(row["late_responses"] for row in group)
+        accuracy = statistics.fmean(row["accuracy"] for row in group)
+        values = "  ".join(str(value) for value in key)
+        print(f"{values}  {len(group)}  {premature:.2f}  {late:.2f}  {accuracy:.1%}", file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run simulated game sessions in parallel")
+    parser.add_argument("game", choices=["nback", "alien"])
+    parser.add_argument("--sessions", type=int, default=1000, help="sessions per parameter combination")
+    parser.add_argument("--seed", type=int, default=0, help="base seed for the whole run")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes (default: all cores)")
+    parser.add_argument("--responder", default=None, help="synthetic responder name")
+    parser.add_argument("--premature-ms", type=float, nargs="+", default=[PREMATURE_RT_MS])
+    parser.add_argument("--late-ms", type=float, nargs="+", default=[LATE_RT_MS])
+    parser.add_argument("--n-back", type=int, nargs="+", default=[1], help="N-Back only")
+    parser.add_argument("--trials", type=int, default=30, help="N-Back trials per session")
+    parser.add_argument("--out", default="-", help="per-session CSV output (default: stdout)")
+    args = parser.parse_args(argv)
+
+    responders = nback_sim.RESPONDERS if args.game == "nback" else alien_sim.RESPONDERS
+    if args.responder is None:
+        args.responder = next(iter(responders))
+    if args.responder not in responders:
+        parser.error(f"unknown responder {args.responder!r}, choose from {', '.join(responders)}")
+
+    jobs = list(build_jobs(args))
+    workers = args.workers or os.cpu_count()
+    chunksize = max(1, len(jobs) // (workers * 8))
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        rows = list(pool.map(run_job, jobs, chunksize=chunksize))
+    elapsed = time.perf_counter() - start
+
+    param_names = list(jobs[0][2]) if jobs else []
+    out = sys.stdout if args.out == "-" else open(args.out, "w", newline="")
+    try:
+        if rows:
+            writer = csv.DictWriter(out, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print(f"{len(rows)} {args.game} sessions on {workers} workers in {elapsed:.2f}s", file=sys.stderr)
+    print_sweep_summary(rows, param_names, sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+import os
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import csv
+import hashlib
+import json
+import math
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import analytics
+
+try:
+    from scipy.special import log_ndtr
+except ImportError:  # scipy is optional; math.erfc is exact but slower
+    log_ndtr = None
+
+# Ex-Gaussian fits (mu, sigma, tau) of reaction times per session, e.g.
+#   python exgauss.py nback
+#   python exgauss.py alien --participants participants.csv --out alien_fits.csv
+# Fits are maximum likelihood. Each batch of sessions is fitted together by
+# one Nelder-Mead run whose simplex steps are NumPy operations over the whole
+# batch, batches go to a process pool, and finished fits are cached on disk
+# keyed by a hash of the RTs so re-running over a growing log only fits the
+# new sessions.
+
+FIT_VERSION = "exgauss-nm-1"  # part of the cache key; bump when the fit changes
+CACHE_FILE = "exgauss_cache.json"
+MIN_RTS = 10  # sessions with fewer RTs are reported without a fit
+MIN_SD_MS = 0.01  # likewise sessions whose RTs (logged to 0.1 ms) all but coincide
+BATCH_SESSIONS = 128
+MAX_ITER = 600
+XTOL = 1e-4  # simplex size, in mu/sd units and log sigma/log tau
+FTOL = 1e-7  # negative log-likelihood spread across the simplex
+PARALLEL_MIN_SESSIONS = 4 * BATCH_SESSIONS
+FIT_FIELDS = ["n", "mu", "sigma", "tau", "nll", "iterations", "converged"]
+
+_LOG_SQRT_2PI = 0.5 * math.log(2 * math.pi)
+_erfc = np.frompyfunc(math.erfc, 1, 1)
+
+
+def _log_ndtr(z):
+    """log of the standard normal CDF, accurate far into the lower tail"""
+    if log_ndtr is not None:
+        return log_ndtr(z)
+    tail = z < -20
+    direct = np.log(0.5 * _erfc(-np.where(tail, 0.0, z) / math.sqrt(2)).astype(np.float64))
+    zt = np.where(tail, z, -20.0)
+    z2 = zt * zt
+    asymptotic = -0.5 * z2 - np.log(-zt) - _LOG_SQRT_2PI + np.log1p(-1 / z2 + 3 / z2 ** 2 - 15 / z2 ** 3)
+    return np.where(tail, asymptotic, direct)
+
+
+def exgauss_logpdf(x, mu, sigma, tau):
+    """Ex-Gaussian log density; broadcasts over all arguments"""
+    return (-np.log(tau) + (mu - x) / tau + sigma ** 2 / (2 * tau ** 2)
+            + _log_ndtr((x - mu) / sigma - sigma / tau))
+
+
+def moment_estimates(rts):
+    """Starting (mu, sigma, tau) from the mean, SD and skewness"""
+    mean = rts.mean()
+    sd = rts.std(ddof=1)
+    skew = ((rts - mean) ** 3).mean() / sd ** 3 if sd > 0 else 0.0
+    # tau from skewness, kept inside the range a fit can start from
+    tau = sd * (skew / 2) ** (1 / 3) if skew > 0 else 0.2 * sd
+    tau = min(max(tau, 0.1 * sd), 0.9 * sd)
+    sigma = math.sqrt(max(sd ** 2 - tau ** 2, (0.1 * sd) ** 2))
+    return mean - tau, sigma, tau
+
+
+def _fittable(rts):
+    """Enough RTs with enough spread: identical RTs have no ex-Gaussian fit (sigma = tau = 0)"""
+    return len(rts) >= MIN_RTS and rts.std(ddof=1) > MIN_SD_MS
+
+
+def _batch_nll(params, x, mask):
+    """Negative log-likelihood of each row's RTs; params[:, :] = mu, log sigma, log tau"""
+    mu = params[:, 0:1]
+    sigma = np.exp(params[:, 1:2])
+    tau = np.exp(params[:, 2:3])
+    with np.errstate(all='ignore'):
+        logpdf = exgauss_logpdf(x, mu, sigma, tau)
+    nll = -np.where(mask, logpdf, 0.0).sum(axis=1)
+    return np.where(np.isfinite(nll), nll, np.inf)
+
+
+def fit_batch(samples):
+    """Fit every RT array in `samples`; returns one result dict per array.
+
+    Arrays are padded into a (sessions, max_n) matrix and all simplexes
+    advance together. Each iteration scores the reflection, expansion and
+    both contractions for every session in four vectorized likelihood
+    calls and picks per session with np.where; finished sessions stay put.
+    """
+    results = [None] * len(samples)
+    fit_index = [i for i, rts in enumerate(samples) if _fittable(rts)]
+    for i, rts in enumerate(samples):
+        if not _fittable(rts):
+            results[i] = {"n": len(rts), "mu": None, "sigma": None, "tau": None,
+                          "nll": None, "iterations": 0, "converged": False}
+    if not fit_index:
+        return results
+
+    width = max(len(samples[i]) for i in fit_index)
+    x = np.zeros((len(fit_index), width))
+    mask = np.zeros((len(fit_index), width), dtype=bool)
+    starts = np.empty((len(fit_index), 3))
+    scale = np.empty(len(fit_index))
+    for row, i in enumerate(fit_index):
+        rts = samples[i]
+        x[row, :len(rts)] = rts
+        mask[row, :len(rts)] = True
+        mu, sigma, tau = moment_estimates(rts)
+        starts[row] = mu, math.log(sigma), math.log(tau)
+        scale[row] = rts.std(ddof=1)
+
+    # Work in units where mu moves on the same scale as log sigma and log tau
+    starts[:, 0] /= scale
+    x_scaled = x / scale[:, None]
+
+    def objective(params, rows):
+        shifted = params.copy()
+        shifted[:, 1:] -= np.log(scale[rows])[:, None]
+        return _batch_nll(shifted, x_scaled[rows], mask[rows])
+
+    best, nll, iterations, converged = _nelder_mead(objective, starts, np.array([0.2, 0.2, 0.2]))
+
+    # Back to milliseconds; the likelihood gains n * log(scale) from the change of units
+    for row, i in enumerate(fit_index):
+        n = len(samples[i])
+        results[i] = {
+            "n": n,
+            "mu": float(best[row, 0] * scale[row]),
+            "sigma": float(math.exp(best[row, 1])),
+            "tau": float(math.exp(best[row, 2])),
+            "nll": float(nll[row] + n * math.log(scale[row])),
+            "iterations": int(iterations[row]),
+            "converged": bool(converged[row]),
+        }
+    return results
+
+
+def _nelder_mead(f, x0, step, max_iter=MAX_ITER, xtol=XTOL, ftol=FTOL):
+    """Batched Nelder-Mead: minimizes f(params[rows], rows) independently per row of x0"""
+    batch, dims = x0.shape
+    all_rows = np.arange(batch)
+    simplex = np.repeat(x0[:, None, :], dims + 1, axis=1)
+    for d in range(dims):
+        simplex[:, d + 1, d] += step[d]
+    values = np.stack([f(simplex[:, j], all_rows) for j in range(dims + 1)], axis=1)
+    iterations = np.zeros(batch, dtype=int)
+    done = np.zeros(batch, dtype=bool)
+
+    for _ in range(max_iter):
+        order = np.argsort(values, axis=1)
+        simplex = np.take_along_axis(simplex, order[:, :, None], axis=1)
+        values = np.take_along_axis(values, order, axis=1)
+        size = np.abs(simplex[:, 1:] - simplex[:, :1]).max(axis=(1, 2))
+        done |= (size <= xtol) & (values[:, -1] - values[:, 0] <= ftol)
+        rows = np.flatnonzero(~done)
+        if not len(rows):
+            break
+        iterations[rows] += 1
+
+        s, v = simplex[rows], values[rows]
+        worst = s[:, -1]
+        centroid = s[:, :-1].mean(axis=1)
+        reflected = 2 * centroid - worst
+        expanded = 3 * centroid - 2 * worst
+        outside = 1.5 * centroid - 0.5 * worst
+        inside = 0.5 * (centroid + worst)
+        fr, fe = f(reflected, rows), f(expanded, rows)
+        fo, fi = f(outside, rows), f(inside, rows)
+
+        f_best, f_second, f_worst = v[:, 0], v[:, -2], v[:, -1]
+        use_expanded = (fr < f_best) & (fe < fr)
+        use_reflected = ~use_expanded & (fr < f_second)
+        use_outside = (fr >= f_second) & (fr < f_worst) & (fo <= fr)
+        use_inside = (fr >= f_worst) & (fi < f_worst)
+        shrink = ~(use_expanded | use_reflected | use_outside | use_inside)
+
+        new_point = np.select([use_expanded[:, None], use_reflected[:, None], use_outside[:, None]],
+                              [expanded, reflected, outside], inside)
+        new_value = np.select([use_expanded, use_reflected, use_outside], [fe, fr, fo], fi)
+        s[:, -1] = np.where(shrink[:, None], worst, new_point)
+        v[:, -1] = np.where(shrink, f_worst, new_value)
+
+        if shrink.any():
+            k = np.flatnonzero(shrink)
+            s[k, 1:] = s[k, :1] + 0.5 * (s[k, 1:] - s[k, :1])
+            for j in range(1, dims + 1):
+                v[k, j] = f(s[k, j], rows[k])
+        simplex[rows], values[rows] = s, v
+
+    order = np.argmin(values, axis=1)
+    return simplex[all_rows, order], values[all_rows, order], iterations, done
+
+
+def data_key(rts):
+    """Cache key for one RT sample: independent of row order"""
+    digest = hashlib.sha256(FIT_VERSION.encode())
+    digest.update(np.sort(np.asarray(rts, dtype=np.float64)).tobytes())
+    return digest.hexdigest()
+
+
+def load_cache(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(path, cache):
+    tmp_name = path + ".tmp"
+    with open(tmp_name, 'w') as f:
+        json.dump(cache, f)
+    os.replace(tmp_name, path)
+
+
+def fit_samples(samples, workers=0, cache=None):
+    """Fit a list of RT arrays, reusing and filling `cache` ({data_key: result})"""
+    keys = [data_key(rts) for rts in samples]
+    results = [cache.get(key) if cache is not None else None for key in keys]
+    todo = [i for i, result in enumerate(results) if result is None]
+
+    # Similar lengths share a batch so padding stays small
+    todo.sort(key=lambda i: len(samples[i]))
+    batches = [todo[i:i + BATCH_SESSIONS] for i in range(0, len(todo), BATCH_SESSIONS)]
+    jobs = [[samples[i] for i in batch] for batch in batches]
+    if workers == 0:
+        workers = os.cpu_count() if len(todo) >= PARALLEL_MIN_SESSIONS else 1
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            fitted = list(pool.map(fit_batch, jobs))
+    else:
+        fitted = [fit_batch(job) for job in jobs]
+
+    for batch, batch_results in zip(batches, fitted):
+        for i, result in zip(batch, batch_results):
+            results[i] = result
+            if cache is not None:
+                cache[keys[i]] = result
+    return results
+
+
+def session_rts(path, game, workers=0, session_gap_s=analytics.SESSION_GAP_S):
+    """(session names, [RT array per session]) from a game log; RTs <= 0 are dropped"""
+    if game == "nback":
+        columns = analytics.load_log(path, analytics.NBACK_COLUMNS, workers=workers)
+        sessions, rt = columns["Session"], columns["RT"]
+    else:
+        columns = analytics.load_log(path, analytics.ALIEN_COLUMNS, workers=workers)
+        sessions = analytics.infer_sessions(columns["Session"], columns["Timestamp"], session_gap_s)
+        rt = np.where(columns["Action"] == "Shoot", columns["Reaction_Time_ms"], np.nan)
+
+    names, codes = analytics.group_sessions(sessions)
+    with np.errstate(invalid='ignore'):
+        valid = rt > 0
+    order = np.argsort(codes[valid], kind='stable')
+    counts = np.bincount(codes[valid], minlength=len(names))
+    return names, np.split(rt[valid][order], np.cumsum(counts)[:-1])
+
+
+def read_participants(path):
+    """{session: participant} from a CSV with Session and Participant columns"""
+    with open(path, newline='') as f:
+        return {row["Session"]: row["Participant"] for row in csv.DictReader(f)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ex-Gaussian RT fits per session and participant")
+    parser.add_argument("game", choices=["nback", "alien"])
+    parser.add_argument("--file", default=None, help="log to read (default: the game's own log)")
+    parser.add_argument("--participants", default=None,
+                        help="CSV mapping Session to Participant; adds one pooled fit per participant")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="processes (default: all cores when there are many sessions)")
+    parser.add_argument("--cache", default=None, help=f"fit cache (default: {CACHE_FILE} beside the log)")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--out", default="-", help="CSV output (default: stdout)")
+    args = parser.parse_args(argv)
+
+    path = args.file or (analytics.NBACK_LOG_FILE if args.game == "nback" else analytics.ALIEN_LOG_FILE)
+    cache_path = args.cache or os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_FILE)
+    cache = None if args.no_cache else load_cache(cache_path)
+    cached_before = len(cache) if cache is not None else 0
+
+    start = time.perf_counter()
+    names, samples = session_rts(path, args.game, args.workers)
+    labels = [("session", name) for name in names]
+    if args.participants:
+        participants = read_participants(args.participants)
+        pooled = {}
+        for name, rts in zip(names, samples):
+            if name in participants:
+                pooled.setdefault(participants[name], []).append(rts)
+        for participant, parts in pooled.items():
+            labels.append(("participant", participant))
+            samples.append(np.concatenate(parts))
+    results = fit_samples(samples, args.workers, cache)
+    elapsed = time.perf_counter() - start
+
+    if cache is not None and len(cache) != cached_before:
+        save_cache(cache_path, cache)
+
+    out = sys.stdout if args.out == "-" else open(args.out, "w", newline="")
+    try:
+        writer = csv.writer(out)
+        writer.writerow(["level", "id"] + FIT_FIELDS)
+        for (level, name), result in zip(labels, results):
+            writer.writerow([level, name] + ["" if result[field] is None else
+                                             round(result[field], 3) if isinstance(result[field], float)
+                                             else result[field] for field in FIT_FIELDS])
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    fitted = len(cache) - cached_before if cache is not None else len(results)
+    print(f"{len(results)} fits ({fitted} new) from {path} in {elapsed:.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import csv
+import os
+import time
+from collections import deque
+import pygame
+from text_cache import glyph_atlas
+from trial_logger import ensure_csv_header
+
+# Per-stage frame timing for both games. Turn it on with ADHD_PROFILE=1 or
+# toggle it in game with F3. While it is on, every instrumented stage is timed
+# with perf_counter_ns, a rolling p50/p95/p99 table can be drawn over the game,
+# and frame and stage times are binned into a per-session histogram.
+
+PROFILE_ENV = "ADHD_PROFILE"
+TOGGLE_KEY = pygame.K_F3
+HISTOGRAM_FILE = "frame_time_histogram.csv"
+HISTOGRAM_HEADER = ["Session", "Game", "Stage", "BucketMs", "Count"]
+HISTOGRAM_MAX_MS = 100  # 1 ms buckets; slower frames land in the last one
+FRAME_STAGE = "frame"
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, time.perf_counter_ns() - self.start)
+        return False
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+class FrameProfiler:
+    """Times named stages of the main loop and keeps rolling per-stage statistics.
+
+    Stages are inclusive: a draw function that calls another instrumented
+    draw function counts the inner one's time too. A stage hit several times
+    in one frame is summed into a single sample for that frame.
+    """
+    def __init__(self, enabled=None, window=300, refresh_ms=250):
+        if enabled is None:
+            enabled = os.environ.get(PROFILE_ENV, "0") not in ("", "0")
+        self.enabled = enabled
+        self.window = window
+        self.refresh_ms = refresh_ms
+        self.samples = {}  # stage -> deque of per-frame ns totals
+        self.histograms = {}  # stage -> {bucket_ms: count}
+        self._frame = {}
+        self._last_frame_ns = None
+        self._table = []
+        self._table_time = 0
+        self._font = None
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self._last_frame_ns = None
+        self._frame = {}
+
+    def stage(self, name):
+        """Context manager timing one stage; free when profiling is off"""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def timed(self, func):
+        """Decorator timing every call to `func` as a stage named after it"""
+        name = func.__name__
+
+        def wrapper(*args, **kwargs):
+            if not self.enabled:
+                return func(*args, **kwargs)
+            with _Stage(self, name):
+                return func(*args, **kwargs)
+        wrapper.__name__ = name
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+
+    def add(self, name, ns):
+        self._frame[name] = self._frame.get(name, 0) + ns
+
+    def end_frame(self):
+        """Close the current frame; call once per loop iteration"""
+        if not self.enabled:
+            return
+        now = time.perf_counter_ns()
+        if self._last_frame_ns is not None:
+            self._frame[FRAME_STAGE] = now - self._last_frame_ns
+        self._last_frame_ns = now
+
+        for name, ns in self._frame.items():
+            samples = self.samples.get(name)
+            if samples is None:
+                samples = self.samples[name] = deque(maxlen=self.window)
+            samples.append(ns)
+            bucket = min(int(ns // 1_000_000), HISTOGRAM_MAX_MS)
+            histogram = self.histograms.setdefault(name, {})
+            histogram[bucket] = histogram.get(bucket, 0) + 1
+        self._frame = {}
+
+    def stats(self):
+        """[(stage, p50_ms, p95_ms, p99_ms)] over the rolling window, frame first"""
+        rows = []
+        for name in sorted(self.samples, key=lambda n: (n != FRAME_STAGE, n)):
+            values = sorted(self.samples[name])
+            rows.append((name,) + tuple(percentile(values, q) / 1_000_000 for q in (0.5, 0.95, 0.99)))
+        return rows
+
+    def draw_overlay(self, surface, pos=None):
+        """Draw the p50/p95/p99 table; returns the covered Rect, or None when off"""
+        if not self.enabled or not self.samples:
+            return None
+        if self._font is None:
+            self._font = pygame.font.SysFont('consolas', 14)
+
+        now = pygame.time.get_ticks()
+        if not self._table or now - self._table_time >= self.refresh_ms:
+            self._table = [f"{'stage':<24}{'p50':>7}{'p95':>7}{'p99':>7}"]
+            self._table += [f"{name[:24]:<24}{p50:7.2f}{p95:7.2f}{p99:7.2f}"
+                            for name, p50, p95, p99 in self.stats()]
+            self._table_time = now
+
+        atlas = glyph_atlas(self._font, (255, 255, 255))
+        line_height = atlas.height
+        width = max(atlas.size(line)[0] for line in self._table) + 12
+        height = line_height * len(self._table) + 8
+        if pos is None:
+            pos = (surface.get_width() - width - 8, 8)
+        box = pygame.Rect(pos, (width, height))
+        surface.fill((0, 0, 0), box)
+        for i, line in enumerate(self._table):
+            atlas.draw(surface, line, (box.x + 6, box.y + 4 + i * line_height))
+        return box
+
+    def write_histogram(self, log_filename, session_id, game):
+        """Append this session's histograms to HISTOGRAM_FILE beside `log_filename`"""
+        if not self.histograms:
+            return
+        path = os.path.join(os.path.dirname(os.path.abspath(log_filename)), HISTOGRAM_FILE)
+        ensure_csv_header(path, HISTOGRAM_HEADER)
+        with open(path, 'a', newline='') as f:
+            writer = csv.writer(f)
+            for name in sorted(self.histograms):
+                for bucket, count in sorted(self.histograms[name].items()):
+                    writer.writerow([session_id, game, name, bucket, count])
@@ -1,11 +1,25 @@
 import pygame
 import random
-import csv
+import os
+import argparse
+import statistics
+import time
 from datetime import datetime
+from trial_logger import CSVSink, TrialLogger, make_sink
+from hires_timing import FrameTimer
+from input_capture import start_capture
+from text_cache import glyph_atlas
+from frame_profiler import FrameProfiler, TOGGLE_KEY
+from trace_events import TraceRecorder
+from alien_core import WIDTH, HEIGHT, FPS, STEP_MS, MAX_STEPS_PER_FRAME, AlienWorld
+
+parser = argparse.ArgumentParser(description="Alien Defense Simulator")
+parser.add_argument("--stress", type=int, default=0, metavar="N",
+                    help="keep N aliens on screen and report frame times instead of logging trials")
+args = parser.parse_args()
 
 # Initialize Pygame
 pygame.init()
-WIDTH, HEIGHT = 800, 600
 win = pygame.display.set_mode((WIDTH, HEIGHT))
 pygame.display.set_caption("Alien Defense Simulator")
 
@@ -40,174 +54,218 @@ EXPLOSION = create_alien(YELLOW)
 CROSSHAIR = pygame.Surface((25, 25), pygame.SRCALPHA)
 pygame.draw.circle(CROSSHAIR, WHITE, (12, 12), 10, 2)
 
-# Background stars
+# Background stars, pre-rendered once
 stars = [(random.randint(0, WIDTH), random.randint(0, HEIGHT)) for _ in range(80)]
+BACKGROUND = pygame.Surface((WIDTH, HEIGHT)).convert()
+BACKGROUND.fill((5, 5, 30))
+for x, y in stars:
+    pygame.draw.circle(BACKGROUND, WHITE, (x, y), 1)
 
-# Game Variables
-FPS = 60
-clock = pygame.time.Clock()
-score = 0
-hits = 0
-misses = 0
-aliens = []
-next_spawn_time = 0
-
-# Speed control
-alien_speed = 2
-spawn_delay = 1000
-min_spawn_delay = 200
-max_alien_speed = 6
-difficulty_timer = 0
-difficulty_interval = 5000  # every 5 seconds
-
-# Timing
-game_duration = 60  # seconds
-start_time = pygame.time.get_ticks()
+# Dirty-rect mode only repaints and updates the areas that changed each frame;
+# set ALIEN_DIRTY_RECTS=0 to redraw the full window instead
+DIRTY_RECTS = os.environ.get("ALIEN_DIRTY_RECTS", "1") != "0"
+MAX_DIRTY_RECTS = 200  # past this many sprites a full repaint is cheaper
 
-import os
+# Span trace dumped at exit, ADHD_TRACE=1 to turn on
+tracer = TraceRecorder()
 
+# Logging - rows are queued here and written in batches by a background thread.
+# Stress runs are benchmarks with no responses, so they leave the log alone.
 filename = "adhd_log.csv"
-write_header = not os.path.exists(filename)
-
-if write_header:
-    with open(filename, 'w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(["Timestamp", "Stimulus", "Action", "Correct", "Reaction_Time_ms"])
-
-
-# Alien Class
-class Alien:
-    def __init__(self, kind):
-        self.kind = kind
-        self.image = RED_ALIEN if kind == "go" else GREEN_ALIEN
-        self.x = random.randint(100, WIDTH - 100)
-        self.y = -60
-        self.spawn_time = pygame.time.get_ticks()
-        self.responded = False
-        self.exploding = False
-        self.explode_time = 0
-        self.rect = self.image.get_rect(topleft=(self.x, self.y))
-
-    def update(self):
-        if not self.exploding:
-            self.y += alien_speed
-            self.rect.y = self.y
-
-    def draw(self, win):
-        if self.exploding:
-            win.blit(EXPLOSION, (self.x, self.y))
-        else:
-            win.blit(self.image, (self.x, self.y))
-
-    def trigger_explosion(self):
-        self.exploding = True
-        self.explode_time = pygame.time.get_ticks()
+frame_stats_filename = "adhd_frame_stats.csv"
+session_id = datetime.now().strftime('%Y%m%d_%H%M%S')
+logger = None if args.stress else TrialLogger(make_sink(filename, [
+    "Timestamp", "Stimulus", "Action", "Correct", "Reaction_Time_ms", "Onset_ns", "Response_ns",
+    "Session"
+], "alien"), tracer=tracer)
+FRAME_STATS_HEADER = [
+    "Session", "Frames", "Steps", "DroppedFrames", "CatchUpSteps", "DiscardedMs",
+    "MeanFrameMs", "MaxFrameMs"
+]
+
+# Stage timing, ADHD_PROFILE=1 or F3 to turn on
+profiler = FrameProfiler()
 
 # Helper Functions
+@profiler.timed
 def draw_background():
-    win.fill((5, 5, 30))
-    for x, y in stars:
-        pygame.draw.circle(win, WHITE, (x, y), 1)
+    win.blit(BACKGROUND, (0, 0))
+
+def restore_background(rects):
+    for rect in rects:
+        win.blit(BACKGROUND, rect, rect)
+
+@profiler.timed
+def draw_aliens():
+    return [draw_alien(alien) for alien in world.aliens]
 
+def draw_alien(alien):
+    pos = (alien.x, alien.render_y(world.alpha))
+    if alien.exploding:
+        return win.blit(EXPLOSION, pos)
+    else:
+        return win.blit(RED_ALIEN if alien.kind == "go" else GREEN_ALIEN, pos)
+
+@profiler.timed
 def draw_scoreboard():
-    info = f"Score: {score} | Hits: {hits} | Misses: {misses}"
-    text = font.render(info, True, WHITE)
-    win.blit(text, (10, 10))
+    info = f"Score: {world.score} | Hits: {world.hits} | Misses: {world.misses}"
+    return glyph_atlas(font, WHITE).draw(win, info, (10, 10))
 
+@profiler.timed
 def draw_crosshair():
     mx, my = pygame.mouse.get_pos()
-    win.blit(CROSSHAIR, (mx - 12, my - 12))
-
-def log_response(alien, action, correct, rt):
-    with open(filename, 'a', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow([
-            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "Go" if alien.kind == "go" else "No-Go",
-            action,
-            "Yes" if correct else "No",
-            rt if rt is not None else ""
-        ])
+    return win.blit(CROSSHAIR, (mx - 12, my - 12))
+
+@profiler.timed
+def log_response(alien, action, correct, rt, response_ns=None):
+    logger.log([
+        datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "Go" if alien.kind == "go" else "No-Go",
+        action,
+        "Yes" if correct else "No",
+        rt if rt is not None else "",
+        alien.onset_ns if alien.onset_ns is not None else "",
+        response_ns if response_ns is not None else "",
+        session_id
+    ])
+
+def log_frame_stats():
+    sink = CSVSink(frame_stats_filename, FRAME_STATS_HEADER)
+    sink.open()
+    sink.write_rows([[
+        session_id, frames, world.steps, dropped_frames, catch_up_steps, round(discarded_ms, 1),
+        round(total_frame_ms / frames, 2) if frames else 0, round(max_frame_ms, 2)
+    ]])
+    sink.close()
 
 # Game Loop
 run = True
 pygame.mouse.set_visible(False)
+capture = start_capture()
+timer = FrameTimer(capture=capture)
+world = AlienWorld(on_response=None if args.stress else log_response)
+frame_times = []  # ms per frame, stress mode only
+dirty_rects = []  # areas drawn over the background last frame
+full_redraw = True
+
+# Fixed-timestep bookkeeping: real time is banked in the accumulator and spent
+# in STEP_MS simulation steps, rendering interpolates between the last two
+accumulator = 0.0
+frames = 0
+total_frame_ms = 0.0
+max_frame_ms = 0.0
+dropped_frames = 0  # display refreshes missed because a frame ran long
+catch_up_steps = 0  # extra simulation steps run to make up for long frames
+discarded_ms = 0.0  # real time thrown away past MAX_STEPS_PER_FRAME
+frame_start_ns = time.perf_counter_ns()
+tracer.phase("playing")
 
 while run:
-    clock.tick(FPS)
-    now = pygame.time.get_ticks()
-    elapsed_sec = (now - start_time) / 1000
+    with profiler.stage("wait"):
+        frame_ms = timer.wait_frame(FPS)
+    profiler.end_frame()
+    if frames:
+        frame_end_ns = time.perf_counter_ns()
+        tracer.complete("frame", frame_start_ns, frame_end_ns, "frame",
+                        {"frame": frames, "aliens": len(world.aliens)})
+        frame_start_ns = frame_end_ns
+    if args.stress:
+        frame_times.append(frame_ms)
+    if frames:
+        total_frame_ms += frame_ms
+        max_frame_ms = max(max_frame_ms, frame_ms)
+        dropped_frames += max(0, round(frame_ms / STEP_MS) - 1)
+    frames += 1
 
     # End after game_duration
-    if elapsed_sec > game_duration:
+    if world.finished():
+        if logger:
+            logger.complete_session(session_id)
         run = False
         continue
 
-    # Increase difficulty every 5 seconds
-    if now - difficulty_timer > difficulty_interval:
-        difficulty_timer = now
-        if spawn_delay > min_spawn_delay:
-            spawn_delay = max(spawn_delay - 150, min_spawn_delay)
-        if alien_speed < max_alien_speed:
-            alien_speed = min(alien_speed + 0.7, max_alien_speed)
-
-    for event in pygame.event.get():
+    # Clicks are resolved against the positions on screen
+    with profiler.stage("events"):
+        events = timer.get_events()
+    for event, event_ns in events:
         if event.type == pygame.QUIT:
             run = False
 
+        if event.type == pygame.WINDOWEXPOSED:
+            full_redraw = True
+
+        if event.type == pygame.KEYDOWN and event.key == TOGGLE_KEY:
+            profiler.toggle()
+            full_redraw = True
+
         if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-            mx, my = pygame.mouse.get_pos()
-            for alien in aliens:
-                if not alien.responded and alien.rect.collidepoint(mx, my):
-                    rt = now - alien.spawn_time
-                    alien.responded = True
-                    alien.trigger_explosion()
-                    if alien.kind == "go":
-                        score += 10
-                        hits += 1
-                        log_response(alien, "Shoot", True, rt)
-                    else:
-                        score -= 5
-                        misses += 1
-                        log_response(alien, "Shoot", False, rt)
-                    if shoot_sound:
-                        shoot_sound.play()
-                    break
-
-    # Spawn new alien
-    if now >= next_spawn_time:
-        kind = "go" if random.random() < 0.7 else "nogo"
-        aliens.append(Alien(kind))
-        next_spawn_time = now + spawn_delay
-
-    # Update aliens
-    for alien in aliens:
-        alien.update()
-
-    # Remove expired or finished aliens
-    for alien in aliens[:]:
-        if not alien.responded and alien.y > HEIGHT:
-            alien.responded = True
-            if alien.kind == "go":
-                log_response(alien, "No Shot", False, None)
-                misses += 1
-            else:
-                log_response(alien, "No Shot", True, None)
-            aliens.remove(alien)
-        elif alien.exploding and now - alien.explode_time > 250:
-            aliens.remove(alien)
+            mx, my = event.pos
+            with tracer.span("shoot", "trial"):
+                hit = world.shoot(mx, my, event_ns)
+            if hit and shoot_sound:
+                shoot_sound.play()
+
+    # Step the simulation: difficulty ramp, spawns, motion and expiry
+    accumulator += frame_ms
+    steps = 0
+    with profiler.stage("update"), tracer.span("update", "sim"):
+        while accumulator >= STEP_MS and steps < MAX_STEPS_PER_FRAME:
+            world.step()
+            accumulator -= STEP_MS
+            steps += 1
+    catch_up_steps += max(0, steps - 1)
+    if accumulator >= STEP_MS:
+        discarded_ms += accumulator - accumulator % STEP_MS
+        accumulator %= STEP_MS
+    world.alpha = accumulator / STEP_MS
+    if args.stress:
+        world.fill_to(args.stress, world.time)
 
     # Drawing
-    draw_background()
-    for alien in aliens:
-        alien.draw(win)
-    draw_scoreboard()
-    draw_crosshair()
-    pygame.display.update()
+    if len(world.aliens) > MAX_DIRTY_RECTS:
+        full_redraw = True
+    if DIRTY_RECTS and not full_redraw:
+        restore_background(dirty_rects)
+    else:
+        draw_background()
+    drawn = draw_aliens()
+    drawn.append(draw_scoreboard())
+    drawn.append(draw_crosshair())
+    with profiler.stage("overlay"):
+        overlay_rect = profiler.draw_overlay(win)
+    if overlay_rect:
+        drawn.append(overlay_rect)
+
+    with profiler.stage("flip"), tracer.span("flip", "display"):
+        if DIRTY_RECTS and not full_redraw:
+            # Old positions need the background shown again, new ones the sprites
+            flip_ns = timer.flip(dirty_rects + drawn)
+        else:
+            flip_ns = timer.flip()
+            full_redraw = False
+    dirty_rects = drawn
+    world.mark_onsets(flip_ns)
+
+# Flush remaining log rows before the game over screen
+tracer.phase("game_over")
+if capture:
+    capture.stop()
+if logger:
+    logger.close()
+tracer.dump(filename, session_id, "alien_defense")
+if not args.stress:
+    log_frame_stats()
+    profiler.write_histogram(filename, session_id, "alien_defense")
+
+if args.stress and len(frame_times) > 1:
+    frame_times = sorted(frame_times[1:])
+    p95 = frame_times[int(len(frame_times) * 0.95)]
+    print(f"stress: {args.stress} aliens, {len(frame_times)} frames, "
+          f"mean {statistics.fmean(frame_times):.2f} ms, p95 {p95:.2f} ms, max {frame_times[-1]:.2f} ms")
 
 # Game Over Screen
 win.fill((0, 0, 0))
-end_text = font.render(f"Game Over! Final Score: {score}", True, YELLOW)
+end_text = font.render(f"Game Over! Final Score: {world.score}", True, YELLOW)
 win.blit(end_text, (WIDTH // 2 - end_text.get_width() // 2, HEIGHT // 2))
 pygame.display.update()
 pygame.time.delay(4000)
@@ -1,14 +1,31 @@
-import pygame
-import random
-import csv
-from datetime import datetime
-import statistics
 import os
+import pygame
+import time
+from hires_timing import FrameTimer, PresentationScheduler
+from input_capture import start_capture
+from nback_sequence import CACHE_FILE as SEQUENCE_CACHE_FILE, SequenceCache
+from trial_logger import TrialLogger, make_sink
+from text_cache import render_text, glyph_atlas
+from frame_profiler import FrameProfiler, TOGGLE_KEY
+from trace_events import TraceRecorder
+from nback_core import (
+    BLACK, WHITE, LIGHT_GRAY, DARK_GRAY, GREEN, RED, BLUE, YELLOW, PURPLE, ACCENT, SURFACE, BORDER,
+    GRID_SIZE, NBACK_LOG_HEADER, GameState, Stimulus, handle_response, record_offset, update_trial_phase
+)
 
 # Initialize
 pygame.init()
 WIDTH, HEIGHT = 1200, 800
-win = pygame.display.set_mode((WIDTH, HEIGHT))
+# ADHD_VSYNC=1 asks SDL to sync flips to the display refresh; not every
+# driver can, so fall back to a plain window
+win = None
+if os.environ.get("ADHD_VSYNC") == "1":
+    try:
+        win = pygame.display.set_mode((WIDTH, HEIGHT), pygame.SCALED, vsync=1)
+    except pygame.error:
+        win = None
+if win is None:
+    win = pygame.display.set_mode((WIDTH, HEIGHT))
 pygame.display.set_caption("N-Back Challenge")
 
 font_big = pygame.font.SysFont('Arial', 72, bold=True)
@@ -16,143 +33,259 @@ font_medium = pygame.font.SysFont('Arial', 36, bold=True)
 font_small = pygame.font.SysFont('Arial', 28)
 font_tiny = pygame.font.SysFont('Arial', 20)
 
-# Modern Color Palette
-BLACK = (15, 15, 23)
-WHITE = (255, 255, 255)
-GRAY = (100, 116, 139)
-LIGHT_GRAY = (148, 163, 184)
-DARK_GRAY = (30, 41, 59)
-GREEN = (34, 197, 94)
-RED = (239, 68, 68)
-BLUE = (59, 130, 246)
-YELLOW = (251, 191, 36)
-PURPLE = (147, 51, 234)
-ACCENT = (16, 185, 129)
-SURFACE = (30, 41, 59)
-BORDER = (71, 85, 105)
+# Stage timing, ADHD_PROFILE=1 or F3 to turn on
+profiler = FrameProfiler()
+# Span trace dumped at exit, ADHD_TRACE=1 to turn on
+tracer = TraceRecorder()
 
 # Grid Configuration
-GRID_SIZE = 3
 CELL_SIZE = 140
 GRID_START_X = WIDTH // 2 - (GRID_SIZE * CELL_SIZE) // 2 - 200
 GRID_START_Y = HEIGHT // 2 - (GRID_SIZE * CELL_SIZE) // 2
 
-# Game Configuration
-LETTERS = [chr(i) for i in range(65, 75)]  # A-J
-stimulus_duration = 2000  # 2 seconds
-inter_stimulus_interval = 500  # 0.5 second break
-reaction_window = 1500
-trial_count = 30
-n_back = 1
-
-# Game State
-class GameState:
-    def __init__(self):
-        self.stimuli = []
-        self.score = 0
-        self.hits = 0
-        self.misses = 0
-        self.false_alarms = 0
-        self.correct_rejections = 0
-        self.trial = 0
-        self.current_stimulus = None
-        self.feedback_text = ""
-        self.feedback_color = WHITE
-        self.feedback_time = 0
-        self.game_phase = "instructions"  # instructions, practice, playing, break, finished
-        self.phase_start_time = 0
-        self.practice_trials = []
-        self.practice_index = 0
-        
-        # CSV Logging - Single file that keeps appending
-        self.filename = "nback_sessions.csv"
-        
-        # Create header only if file doesn't exist
-        if not os.path.exists(self.filename):
-            with open(self.filename, 'w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow([
-                    "Session", "Trial", "Letter", "Position", "IsMatch", "UserPressed", 
-                    "Correct", "RT", "Score", "Timestamp", "ResponseType", "Difficulty", 
-                    "TrialType", "PrevTrialCorrect", "ConsecutiveErrors", "RTVariability",
-                    "PrematureResponse", "LateResponse", "AttentionLapse", "ImpulsivityScore",
-                    "WorkingMemoryLoad", "DistractorPresent", "StimulusDuration", "InterTrialInterval"
-                ])
-        
-        # Generate session ID
-        self.session_id = datetime.now().strftime('%Y%m%d_%H%M%S')
-        
-        # Additional ADHD research metrics
-        self.reaction_times = []
-        self.consecutive_errors = 0
-        self.attention_lapses = 0
-        self.premature_responses = 0
-        self.late_responses = 0
-
-class Stimulus:
-    def __init__(self, letter, position, is_match, trial_num):
-        self.letter = letter
-        self.position = position
-        self.is_match = is_match
-        self.trial_num = trial_num
-        self.shown_time = pygame.time.get_ticks()
-        self.responded = False
-        self.reaction_time = None
-        self.correct = None
-        self.user_pressed = False
-        self.explanation = ""  # For practice mode
-
 def draw_rounded_rect(surface, color, rect, radius=15):
     """Draw a rounded rectangle"""
     pygame.draw.rect(surface, color, rect, border_radius=radius)
 
+# Static layer cache - the grid, previous trial card and info panel only change
+# when the trial, the score or the counters do, so they are rendered once into
+# Surfaces and re-blitted every frame.
+GRID_LAYER_POS = (GRID_START_X - 20, GRID_START_Y - 20)
+CELL_VARIANT_MARGIN = 4  # room for the glow outline around a highlighted cell
+CARD_X, CARD_Y = 50, 50
+CARD_WIDTH, CARD_HEIGHT = 200, 160
+CARD_LAYER_POS = (CARD_X - 40, CARD_Y)  # text and the mini grid overflow the card
+PANEL_X = GRID_START_X + GRID_SIZE * CELL_SIZE + 80
+PANEL_Y = 80
+PANEL_WIDTH = 300
+PANEL_LAYER_POS = (PANEL_X - 20, PANEL_Y - 20)
+STAT_LABELS = ["Hits", "Misses", "False Alarms", "Correct Rejections"]
+
+class LayerCache:
+    """Pre-rendered Surfaces for the parts of the play screen that rarely change"""
+    def __init__(self):
+        self.grid_base = None
+        self.cell_variants = {}  # (state, col, row) -> Surface
+        self.cards = {}  # (letter, position) -> Surface
+        self.panel_static = None
+        self.panel = None
+        self.panel_key = None
+
+    def get_grid_base(self):
+        """Grid background with all nine cells idle"""
+        if self.grid_base is None:
+            size = GRID_SIZE * CELL_SIZE + 40
+            surf = pygame.Surface((size, size), pygame.SRCALPHA)
+            grid_bg = pygame.Rect(0, 0, size, size)
+            draw_rounded_rect(surf, SURFACE, grid_bg, 20)
+            pygame.draw.rect(surf, BORDER, grid_bg, 3, border_radius=20)
+            for row in range(GRID_SIZE):
+                for col in range(GRID_SIZE):
+                    rect = pygame.Rect(col * CELL_SIZE + 30, row * CELL_SIZE + 30, CELL_SIZE - 20, CELL_SIZE - 20)
+                    draw_rounded_rect(surf, DARK_GRAY, rect, 12)
+                    pygame.draw.rect(surf, BORDER, rect, 2, border_radius=12)
+            self.grid_base = surf
+        return self.grid_base
+
+    def get_cell(self, state, col, row):
+        """One cell in state "active", "correct" or "wrong", drawn over its grid background"""
+        key = (state, col, row)
+        surf = self.cell_variants.get(key)
+        if surf is None:
+            m = CELL_VARIANT_MARGIN
+            region = pygame.Rect(col * CELL_SIZE + 30 - m, row * CELL_SIZE + 30 - m,
+                                 CELL_SIZE - 20 + 2 * m, CELL_SIZE - 20 + 2 * m)
+            surf = pygame.Surface(region.size)
+            surf.blit(self.get_grid_base(), (0, 0), region)
+            rect = pygame.Rect(m, m, CELL_SIZE - 20, CELL_SIZE - 20)
+            if state == "active":
+                draw_rounded_rect(surf, ACCENT, rect, 12)
+                # Subtle shadow
+                shadow_rect = rect.move(2, 2)
+                draw_rounded_rect(surf, (0, 0, 0, 30), shadow_rect, 12)
+            else:
+                cell_color = GREEN if state == "correct" else RED
+                draw_rounded_rect(surf, cell_color, rect, 12)
+                # Add glow effect
+                glow_rect = pygame.Rect(m - 3, m - 3, CELL_SIZE - 14, CELL_SIZE - 14)
+                pygame.draw.rect(surf, cell_color, glow_rect, 4, border_radius=15)
+            self.cell_variants[key] = surf
+        return surf
+
+    def get_card(self, letter, position):
+        """Previous trial card for one letter/position pair"""
+        key = (letter, position)
+        surf = self.cards.get(key)
+        if surf is None:
+            surf = pygame.Surface((CARD_WIDTH + 80, CARD_HEIGHT + 30), pygame.SRCALPHA)
+            card_x = CARD_X - CARD_LAYER_POS[0]
+            card_y = CARD_Y - CARD_LAYER_POS[1]
+
+            # Card background
+            card_rect = pygame.Rect(card_x, card_y, CARD_WIDTH, CARD_HEIGHT)
+            draw_rounded_rect(surf, SURFACE, card_rect, 15)
+            pygame.draw.rect(surf, BORDER, card_rect, 2, border_radius=15)
+
+            # Header
+            header_rect = pygame.Rect(card_x, card_y, CARD_WIDTH, 35)
+            draw_rounded_rect(surf, BLUE, header_rect, 15)
+            header_text = font_small.render("Previous Trial", True, WHITE)
+            header_text_rect = header_text.get_rect(center=(card_x + CARD_WIDTH//2, card_y + 17))
+            surf.blit(header_text, header_text_rect)
+
+            # Letter display
+            letter_y = card_y + 50
+            letter_text = font_big.render(f"'{letter}'", True, WHITE)
+            letter_rect = letter_text.get_rect(center=(card_x + CARD_WIDTH//2, letter_y + 25))
+            surf.blit(letter_text, letter_rect)
+
+            # Position info
+            pos_text = font_small.render(f"Position: ({position[0]}, {position[1]})", True, LIGHT_GRAY)
+            pos_rect = pos_text.get_rect(center=(card_x + CARD_WIDTH//2, letter_y + 60))
+            surf.blit(pos_text, pos_rect)
+
+            # Mini grid
+            mini_size = 12
+            mini_x = card_x + CARD_WIDTH//2 - (GRID_SIZE * mini_size)//2
+            mini_y = letter_y + 85
+
+            for row in range(GRID_SIZE):
+                for col in range(GRID_SIZE):
+                    mini_rect = pygame.Rect(mini_x + col * mini_size + col * 2,
+                                          mini_y + row * mini_size + row * 2, mini_size, mini_size)
+                    if (col, row) == position:
+                        draw_rounded_rect(surf, ACCENT, mini_rect, 3)
+                    else:
+                        draw_rounded_rect(surf, DARK_GRAY, mini_rect, 3)
+                    pygame.draw.rect(surf, BORDER, mini_rect, 1, border_radius=3)
+            self.cards[key] = surf
+        return surf
+
+    def get_panel_static(self):
+        """Info panel chrome: background, title, section headings, labels and guide"""
+        if self.panel_static is None:
+            # The quick guide box hangs below the panel background
+            surf = pygame.Surface((PANEL_WIDTH + 40, 560), pygame.SRCALPHA)
+            panel_x = PANEL_X - PANEL_LAYER_POS[0]
+            panel_y = PANEL_Y - PANEL_LAYER_POS[1]
+            panel_width = PANEL_WIDTH
+
+            # Main panel background
+            panel_bg = pygame.Rect(panel_x - 20, panel_y - 20, panel_width + 40, 500)
+            draw_rounded_rect(surf, SURFACE, panel_bg, 15)
+            pygame.draw.rect(surf, BORDER, panel_bg, 2, border_radius=15)
+
+            # Title with gradient background
+            title_bg = pygame.Rect(panel_x - 10, panel_y - 10, panel_width + 20, 50)
+            draw_rounded_rect(surf, PURPLE, title_bg, 12)
+            title = font_medium.render("N-Back Challenge", True, WHITE)
+            title_rect = title.get_rect(center=(panel_x + panel_width//2, panel_y + 15))
+            surf.blit(title, title_rect)
+
+            # Progress bar track
+            progress_y = panel_y + 70
+            prog_bar_rect = pygame.Rect(panel_x, progress_y + 30, panel_width - 20, 8)
+            draw_rounded_rect(surf, DARK_GRAY, prog_bar_rect, 4)
+
+            # Statistics section
+            stats_y = progress_y + 150
+            stats_title = font_small.render("Performance", True, ACCENT)
+            surf.blit(stats_title, (panel_x, stats_y))
+            for i, label in enumerate(STAT_LABELS):
+                label_text = font_tiny.render(f"{label}:", True, LIGHT_GRAY)
+                surf.blit(label_text, (panel_x, stats_y + 30 + i * 30))
+
+            # Instructions section
+            inst_y = stats_y + 180
+            inst_bg = pygame.Rect(panel_x, inst_y, panel_width - 20, 120)
+            draw_rounded_rect(surf, DARK_GRAY, inst_bg, 10)
+
+            inst_title = font_small.render("Quick Guide", True, BLUE)
+            surf.blit(inst_title, (panel_x + 10, inst_y + 10))
+
+            instructions = [
+                "• Press SPACE for match",
+                "• Both letter & position",
+                "  must match previous",
+                "• +10 hit, -5 miss/alarm"
+            ]
+
+            for i, line in enumerate(instructions):
+                text = font_tiny.render(line, True, LIGHT_GRAY)
+                surf.blit(text, (panel_x + 10, inst_y + 40 + i * 20))
+            self.panel_static = surf
+        return self.panel_static
+
+    def get_panel(self, game_state):
+        """Full info panel, re-rendered only when the trial, score or a counter changes"""
+        key = (game_state.trial, game_state.trial_count, game_state.score, game_state.hits,
+               game_state.misses, game_state.false_alarms, game_state.correct_rejections)
+        if key != self.panel_key:
+            surf = self.get_panel_static().copy()
+            panel_x = PANEL_X - PANEL_LAYER_POS[0]
+            panel_y = PANEL_Y - PANEL_LAYER_POS[1]
+            panel_width = PANEL_WIDTH
+
+            # Progress section
+            progress_y = panel_y + 70
+            progress_text = font_small.render(f"Trial {game_state.trial + 1} of {game_state.trial_count}", True, WHITE)
+            surf.blit(progress_text, (panel_x, progress_y))
+
+            progress_fill = int((panel_width - 20) * (game_state.trial + 1) / game_state.trial_count)
+            if progress_fill > 0:
+                fill_rect = pygame.Rect(panel_x, progress_y + 30, progress_fill, 8)
+                draw_rounded_rect(surf, ACCENT, fill_rect, 4)
+
+            # Score section
+            score_y = progress_y + 70
+            score_bg = pygame.Rect(panel_x, score_y, panel_width - 20, 50)
+            draw_rounded_rect(surf, YELLOW if game_state.score >= 0 else RED, score_bg, 10)
+            score_atlas = glyph_atlas(font_medium, BLACK)
+            score_str = f"Score: {game_state.score}"
+            score_rect = score_atlas.get_rect(score_str, center=(panel_x + (panel_width - 20)//2, score_y + 25))
+            score_atlas.draw(surf, score_str, score_rect.topleft)
+
+            # Statistic values
+            stats_y = score_y + 80
+            values = [
+                (game_state.hits, GREEN),
+                (game_state.misses, RED),
+                (game_state.false_alarms, RED),
+                (game_state.correct_rejections, GREEN)
+            ]
+            for i, (value, color) in enumerate(values):
+                glyph_atlas(font_tiny, color).draw(surf, str(value), (panel_x + 150, stats_y + 30 + i * 30))
+
+            self.panel = surf
+            self.panel_key = key
+        return self.panel
+
+layers = LayerCache()
+
+@profiler.timed
 def draw_grid(stimulus=None, highlight_correct=False):
     """Draw the 3x3 grid with modern design"""
-    # Draw grid background
-    grid_bg = pygame.Rect(GRID_START_X - 20, GRID_START_Y - 20, 
-                         GRID_SIZE * CELL_SIZE + 40, GRID_SIZE * CELL_SIZE + 40)
-    draw_rounded_rect(win, SURFACE, grid_bg, 20)
-    pygame.draw.rect(win, BORDER, grid_bg, 3, border_radius=20)
-    
-    for row in range(GRID_SIZE):
-        for col in range(GRID_SIZE):
-            x = GRID_START_X + col * CELL_SIZE + 10
-            y = GRID_START_Y + row * CELL_SIZE + 10
-            rect = pygame.Rect(x, y, CELL_SIZE - 20, CELL_SIZE - 20)
-            
-            # Cell styling
-            if stimulus and stimulus.position == (col, row):
-                if highlight_correct:
-                    cell_color = GREEN if stimulus.correct else RED
-                    draw_rounded_rect(win, cell_color, rect, 12)
-                    # Add glow effect
-                    glow_rect = pygame.Rect(x - 3, y - 3, CELL_SIZE - 14, CELL_SIZE - 14)
-                    pygame.draw.rect(win, cell_color, glow_rect, 4, border_radius=15)
-                else:
-                    draw_rounded_rect(win, ACCENT, rect, 12)
-                    # Subtle shadow
-                    shadow_rect = pygame.Rect(x + 2, y + 2, CELL_SIZE - 20, CELL_SIZE - 20)
-                    draw_rounded_rect(win, (0, 0, 0, 30), shadow_rect, 12)
-            else:
-                draw_rounded_rect(win, DARK_GRAY, rect, 12)
-                pygame.draw.rect(win, BORDER, rect, 2, border_radius=12)
-    
-    # Draw the letter with shadow effect
+    win.blit(layers.get_grid_base(), GRID_LAYER_POS)
+
+    # Draw the highlighted cell and the letter with shadow effect
     if stimulus:
         x, y = stimulus.position
+        if highlight_correct:
+            state = "correct" if stimulus.correct else "wrong"
+        else:
+            state = "active"
+        m = CELL_VARIANT_MARGIN
+        win.blit(layers.get_cell(state, x, y),
+                 (GRID_START_X + x * CELL_SIZE + 10 - m, GRID_START_Y + y * CELL_SIZE + 10 - m))
+
         cx = GRID_START_X + x * CELL_SIZE + CELL_SIZE // 2
         cy = GRID_START_Y + y * CELL_SIZE + CELL_SIZE // 2
-        
-        # Shadow
-        shadow_text = font_big.render(stimulus.letter, True, BLACK)
-        shadow_rect = shadow_text.get_rect(center=(cx + 3, cy + 3))
-        win.blit(shadow_text, shadow_rect)
-        
-        # Main text
-        text = font_big.render(stimulus.letter, True, WHITE)
-        text_rect = text.get_rect(center=(cx, cy))
-        win.blit(text, text_rect)
+        shadow_text = render_text(font_big, stimulus.letter, BLACK)
+        text = render_text(font_big, stimulus.letter, WHITE)
+        win.blit(shadow_text, shadow_text.get_rect(center=(cx + 3, cy + 3)))
+        win.blit(text, text.get_rect(center=(cx, cy)))
 
+@profiler.timed
 def draw_timer_bar(current_time, phase_start_time, duration):
     """Draw a modern timer bar"""
     elapsed = current_time - phase_start_time
@@ -192,139 +325,25 @@ def draw_timer_bar(current_time, phase_start_time, duration):
     
     # Time text with background
     time_left = remaining / 1000.0
-    time_text = font_small.render(f"{time_left:.1f}s", True, WHITE)
     text_bg = pygame.Rect(bar_x + bar_width - 80, bar_y + 30, 75, 35)
     draw_rounded_rect(win, SURFACE, text_bg, 8)
-    win.blit(time_text, (bar_x + bar_width - 75, bar_y + 35))
+    glyph_atlas(font_small, WHITE).draw(win, f"{time_left:.1f}s", (bar_x + bar_width - 75, bar_y + 35))
 
+@profiler.timed
 def draw_previous_trial_reference(game_state):
     """Show previous trial in a modern card design"""
     if game_state.trial > 0 and len(game_state.stimuli) > 0:
         prev_index = max(0, len(game_state.stimuli) - 2)
         if prev_index >= 0 and prev_index < len(game_state.stimuli):
             prev_stimulus = game_state.stimuli[prev_index]
-            
-            # Card position and size
-            card_x = 50
-            card_y = 50
-            card_width = 200
-            card_height = 160
-            
-            # Card background
-            card_rect = pygame.Rect(card_x, card_y, card_width, card_height)
-            draw_rounded_rect(win, SURFACE, card_rect, 15)
-            pygame.draw.rect(win, BORDER, card_rect, 2, border_radius=15)
-            
-            # Header
-            header_rect = pygame.Rect(card_x, card_y, card_width, 35)
-            draw_rounded_rect(win, BLUE, header_rect, 15)
-            header_text = font_small.render("Previous Trial", True, WHITE)
-            header_text_rect = header_text.get_rect(center=(card_x + card_width//2, card_y + 17))
-            win.blit(header_text, header_text_rect)
-            
-            # Letter display
-            letter_y = card_y + 50
-            letter_text = font_big.render(f"'{prev_stimulus.letter}'", True, WHITE)
-            letter_rect = letter_text.get_rect(center=(card_x + card_width//2, letter_y + 25))
-            win.blit(letter_text, letter_rect)
-            
-            # Position info
-            pos_text = font_small.render(f"Position: ({prev_stimulus.position[0]}, {prev_stimulus.position[1]})", True, LIGHT_GRAY)
-            pos_rect = pos_text.get_rect(center=(card_x + card_width//2, letter_y + 60))
-            win.blit(pos_text, pos_rect)
-            
-            # Mini grid
-            mini_size = 12
-            mini_x = card_x + card_width//2 - (GRID_SIZE * mini_size)//2
-            mini_y = letter_y + 85
-            
-            for row in range(GRID_SIZE):
-                for col in range(GRID_SIZE):
-                    mini_rect = pygame.Rect(mini_x + col * mini_size + col * 2, 
-                                          mini_y + row * mini_size + row * 2, mini_size, mini_size)
-                    if (col, row) == prev_stimulus.position:
-                        draw_rounded_rect(win, ACCENT, mini_rect, 3)
-                    else:
-                        draw_rounded_rect(win, DARK_GRAY, mini_rect, 3)
-                    pygame.draw.rect(win, BORDER, mini_rect, 1, border_radius=3)
+            win.blit(layers.get_card(prev_stimulus.letter, prev_stimulus.position), CARD_LAYER_POS)
 
+@profiler.timed
 def draw_info_panel(game_state):
     """Draw the modern information panel"""
-    panel_x = GRID_START_X + GRID_SIZE * CELL_SIZE + 80
-    panel_y = 80
-    panel_width = 300
-    
-    # Main panel background
-    panel_bg = pygame.Rect(panel_x - 20, panel_y - 20, panel_width + 40, 500)
-    draw_rounded_rect(win, SURFACE, panel_bg, 15)
-    pygame.draw.rect(win, BORDER, panel_bg, 2, border_radius=15)
-    
-    # Title with gradient background
-    title_bg = pygame.Rect(panel_x - 10, panel_y - 10, panel_width + 20, 50)
-    draw_rounded_rect(win, PURPLE, title_bg, 12)
-    title = font_medium.render("N-Back Challenge", True, WHITE)
-    title_rect = title.get_rect(center=(panel_x + panel_width//2, panel_y + 15))
-    win.blit(title, title_rect)
-    
-    # Progress section
-    progress_y = panel_y + 70
-    progress_text = font_small.render(f"Trial {game_state.trial + 1} of {trial_count}", True, WHITE)
-    win.blit(progress_text, (panel_x, progress_y))
-    
-    # Progress bar
-    prog_bar_rect = pygame.Rect(panel_x, progress_y + 30, panel_width - 20, 8)
-    draw_rounded_rect(win, DARK_GRAY, prog_bar_rect, 4)
-    progress_fill = int((panel_width - 20) * (game_state.trial + 1) / trial_count)
-    if progress_fill > 0:
-        fill_rect = pygame.Rect(panel_x, progress_y + 30, progress_fill, 8)
-        draw_rounded_rect(win, ACCENT, fill_rect, 4)
-    
-    # Score section
-    score_y = progress_y + 70
-    score_bg = pygame.Rect(panel_x, score_y, panel_width - 20, 50)
-    draw_rounded_rect(win, YELLOW if game_state.score >= 0 else RED, score_bg, 10)
-    score_text = font_medium.render(f"Score: {game_state.score}", True, BLACK)
-    score_rect = score_text.get_rect(center=(panel_x + (panel_width - 20)//2, score_y + 25))
-    win.blit(score_text, score_rect)
-    
-    # Statistics section
-    stats_y = score_y + 80
-    stats_title = font_small.render("Performance", True, ACCENT)
-    win.blit(stats_title, (panel_x, stats_y))
-    
-    stats = [
-        ("Hits", game_state.hits, GREEN),
-        ("Misses", game_state.misses, RED),
-        ("False Alarms", game_state.false_alarms, RED),
-        ("Correct Rejections", game_state.correct_rejections, GREEN)
-    ]
-    
-    for i, (label, value, color) in enumerate(stats):
-        y_pos = stats_y + 30 + i * 30
-        label_text = font_tiny.render(f"{label}:", True, LIGHT_GRAY)
-        value_text = font_tiny.render(str(value), True, color)
-        win.blit(label_text, (panel_x, y_pos))
-        win.blit(value_text, (panel_x + 150, y_pos))
-    
-    # Instructions section
-    inst_y = stats_y + 180
-    inst_bg = pygame.Rect(panel_x, inst_y, panel_width - 20, 120)
-    draw_rounded_rect(win, DARK_GRAY, inst_bg, 10)
-    
-    inst_title = font_small.render("Quick Guide", True, BLUE)
-    win.blit(inst_title, (panel_x + 10, inst_y + 10))
-    
-    instructions = [
-        "• Press SPACE for match",
-        "• Both letter & position",
-        "  must match previous",
-        "• +10 hit, -5 miss/alarm"
-    ]
-    
-    for i, line in enumerate(instructions):
-        text = font_tiny.render(line, True, LIGHT_GRAY)
-        win.blit(text, (panel_x + 10, inst_y + 40 + i * 20))
+    win.blit(layers.get_panel(game_state), PANEL_LAYER_POS)
 
+@profiler.timed
 def draw_feedback(game_state):
     """Draw modern feedback with animations"""
     if game_state.feedback_text and pygame.time.get_ticks() - game_state.feedback_time < 1200:
@@ -343,21 +362,38 @@ def draw_feedback(game_state):
         pygame.draw.rect(win, game_state.feedback_color, bubble_rect, 3, border_radius=15)
         
         # Feedback text
-        feedback_surface = font_tiny.render(game_state.feedback_text, True, game_state.feedback_color)
+        feedback_surface = render_text(font_tiny, game_state.feedback_text, game_state.feedback_color)
         feedback_rect = feedback_surface.get_rect(center=(bubble_x + bubble_width//2, bubble_y + bubble_height//2))
         win.blit(feedback_surface, feedback_rect)
 
+@profiler.timed
+def draw_break_screen(game_state):
+    """Break between trials: the last stimulus with its answer highlighted"""
+    win.fill(BLACK)
+    
+    # Show "Processing..." or break message
+    break_text = render_text(font_medium, "", YELLOW)
+    break_rect = break_text.get_rect(center=(WIDTH//2 - 75, HEIGHT//2))
+    win.blit(break_text, break_rect)
+    
+    # Show what just happened
+    if len(game_state.stimuli) > 0:
+        draw_grid(game_state.stimuli[-1], highlight_correct=True)
+    
+    draw_info_panel(game_state)
+    draw_feedback(game_state)
+
 def draw_instructions():
     """Draw the initial instructions screen"""
     win.fill(BLACK)
     
-    title = font_big.render("N-Back Memory Challenge", True, BLUE)
+    title = render_text(font_big, "N-Back Memory Challenge", BLUE)
     title_rect = title.get_rect(center=(WIDTH//2, 80))
     win.blit(title, title_rect)
     
     # Main rule in big text
-    rule = font_medium.render("RULE: Press SPACE only when BOTH letter AND position", True, YELLOW)
-    rule2 = font_medium.render("match the trial shown 1 step back", True, YELLOW)
+    rule = render_text(font_medium, "RULE: Press SPACE only when BOTH letter AND position", YELLOW)
+    rule2 = render_text(font_medium, "match the trial shown 1 step back", YELLOW)
     rule_rect = rule.get_rect(center=(WIDTH//2, 130))
     rule2_rect = rule2.get_rect(center=(WIDTH//2, 160))
     win.blit(rule, rule_rect)
@@ -398,7 +434,7 @@ def draw_instructions():
         else:
             color = WHITE
             
-        text = font_small.render(line, True, color)
+        text = render_text(font_small, line, color)
         text_rect = text.get_rect(center=(WIDTH//2, y))
         win.blit(text, text_rect)
         y += 25
@@ -416,10 +452,11 @@ def setup_practice_mode(game_state):
     
     game_state.practice_trials = []
     for i, (letter, pos, is_match, explanation) in enumerate(practice_data):
-        stimulus = Stimulus(letter, pos, is_match, i)
+        stimulus = Stimulus(letter, pos, is_match, i, game_state.clock())
         stimulus.explanation = explanation
         game_state.practice_trials.append(stimulus)
 
+@profiler.timed
 def draw_practice_screen(game_state):
     """Draw the practice mode screen with explanations"""
     win.fill(BLACK)
@@ -431,7 +468,7 @@ def draw_practice_screen(game_state):
         draw_grid(current)
         
         # Draw trial information
-        trial_text = font_medium.render(f"Practice Trial {game_state.practice_index + 1} of {len(game_state.practice_trials)}", True, BLUE)
+        trial_text = render_text(font_medium, f"Practice Trial {game_state.practice_index + 1} of {len(game_state.practice_trials)}", BLUE)
         win.blit(trial_text, (50, 50))
         
         # Draw explanation
@@ -456,209 +493,27 @@ def draw_practice_screen(game_state):
             else:
                 color = WHITE
             
-            text = font_small.render(line, True, color)
+            text = render_text(font_small, line, color)
             win.blit(text, (50, y))
             y += 30
         
         # Instructions
         instruction_text = "Press SPACE if you think this is a match, or any other key to continue"
-        instruction = font_tiny.render(instruction_text, True, YELLOW)
+        instruction = render_text(font_tiny, instruction_text, YELLOW)
         win.blit(instruction, (50, HEIGHT - 50))
     
     else:
         # Practice complete
         win.fill(BLACK)
-        complete_text = font_big.render("Practice Complete!", True, GREEN)
+        complete_text = render_text(font_big, "Practice Complete!", GREEN)
         complete_rect = complete_text.get_rect(center=(WIDTH//2, HEIGHT//2 - 50))
         win.blit(complete_text, complete_rect)
         
-        ready_text = font_medium.render("Ready for the real game? Press ENTER to start!", True, WHITE)
+        ready_text = render_text(font_medium, "Ready for the real game? Press ENTER to start!", WHITE)
         ready_rect = ready_text.get_rect(center=(WIDTH//2, HEIGHT//2 + 20))
         win.blit(ready_text, ready_rect)
 
-def generate_trial(game_state):
-    """Generate the next trial stimulus"""
-    trial_index = game_state.trial
-    
-    # For the first trial, or if we want a non-match
-    if trial_index < n_back or random.random() > 0.4:  # 40% match rate
-        # Generate a non-match
-        letter = random.choice(LETTERS)
-        position = (random.randint(0, 2), random.randint(0, 2))
-        
-        # Make sure it's actually different from the n-back stimulus
-        if trial_index >= n_back:
-            past_stimulus = game_state.stimuli[trial_index - n_back]
-            while letter == past_stimulus.letter and position == past_stimulus.position:
-                letter = random.choice(LETTERS)
-                position = (random.randint(0, 2), random.randint(0, 2))
-        
-        return Stimulus(letter, position, False, trial_index)
-    else:
-        # Generate a match
-        past_stimulus = game_state.stimuli[trial_index - n_back]
-        return Stimulus(past_stimulus.letter, past_stimulus.position, True, trial_index)
-
-def calculate_adhd_metrics(game_state, stimulus):
-    """Calculate ADHD-specific behavioral metrics"""
-    
-    # Response classification
-    if stimulus.user_pressed and stimulus.is_match:
-        response_type = "Hit"
-    elif stimulus.user_pressed and not stimulus.is_match:
-        response_type = "FalseAlarm"
-    elif not stimulus.user_pressed and stimulus.is_match:
-        response_type = "Miss"
-    else:
-        response_type = "CorrectRejection"
-    
-    # RT-based classifications
-    premature = False
-    late_response = False
-    attention_lapse = False
-    
-    if stimulus.reaction_time:
-        if stimulus.reaction_time < 200:  # Too fast - impulsive
-            premature = True
-            game_state.premature_responses += 1
-        elif stimulus.reaction_time > 1800:  # Very slow
-            late_response = True
-            game_state.late_responses += 1
-        
-        game_state.reaction_times.append(stimulus.reaction_time)
-    
-    # Attention lapse detection (no response to target)
-    if stimulus.is_match and not stimulus.user_pressed:
-        attention_lapse = True
-        game_state.attention_lapses += 1
-    
-    # Consecutive errors tracking
-    if not stimulus.correct:
-        game_state.consecutive_errors += 1
-    else:
-        game_state.consecutive_errors = 0
-    
-    # RT Variability (using last 5 trials)
-    rt_variability = 0
-    if len(game_state.reaction_times) >= 3:
-        recent_rts = [rt for rt in game_state.reaction_times[-5:] if rt is not None]
-        if len(recent_rts) >= 3:
-            rt_variability = statistics.stdev(recent_rts)
-    
-    # Working memory load (distance from target)
-    wm_load = min(game_state.trial + 1, n_back)
-    
-    # Trial difficulty (based on similarity to n-back stimulus)
-    difficulty = "Easy"
-    if game_state.trial >= n_back:
-        past_stimulus = game_state.stimuli[game_state.trial - n_back]
-        if stimulus.letter == past_stimulus.letter and stimulus.position != past_stimulus.position:
-            difficulty = "Hard"  # Same letter, different position
-        elif stimulus.letter != past_stimulus.letter and stimulus.position == past_stimulus.position:
-            difficulty = "Medium"  # Different letter, same position
-    
-    # Impulsivity score (based on premature responses and false alarms)
-    impulsivity_score = 0
-    if premature:
-        impulsivity_score += 2
-    if response_type == "FalseAlarm":
-        impulsivity_score += 1
-    
-    # Previous trial correctness
-    prev_correct = True
-    if len(game_state.stimuli) > 1:
-        prev_correct = game_state.stimuli[-2].correct
-    
-    return {
-        'response_type': response_type,
-        'difficulty': difficulty,
-        'trial_type': "Target" if stimulus.is_match else "NonTarget",
-        'prev_correct': prev_correct,
-        'consecutive_errors': game_state.consecutive_errors,
-        'rt_variability': round(rt_variability, 2),
-        'premature': premature,
-        'late_response': late_response,
-        'attention_lapse': attention_lapse,
-        'impulsivity_score': impulsivity_score,
-        'wm_load': wm_load,
-        'distractor_present': False,  # Can be expanded later
-        'stimulus_duration': stimulus_duration,
-        'inter_trial_interval': inter_stimulus_interval
-    }
-
-def handle_response(game_state, pressed_space):
-    """Handle user response and update score"""
-    stimulus = game_state.current_stimulus
-    stimulus.user_pressed = pressed_space
-    stimulus.responded = True
-    
-    if pressed_space:
-        stimulus.reaction_time = pygame.time.get_ticks() - stimulus.shown_time
-    
-    # Determine correctness
-    if stimulus.is_match and pressed_space:
-        # Hit
-        stimulus.correct = True
-        game_state.hits += 1
-        game_state.score += 10
-        game_state.feedback_text = "HIT! +10"
-        game_state.feedback_color = GREEN
-    elif stimulus.is_match and not pressed_space:
-        # Miss
-        stimulus.correct = False
-        game_state.misses += 1
-        game_state.score -= 5
-        game_state.feedback_text = "MISS! -5"
-        game_state.feedback_color = RED
-    elif not stimulus.is_match and pressed_space:
-        # False Alarm
-        stimulus.correct = False
-        game_state.false_alarms += 1
-        game_state.score -= 5
-        game_state.feedback_text = "FALSE ALARM! -5"
-        game_state.feedback_color = RED
-    else:
-        # Correct Rejection
-        stimulus.correct = True
-        game_state.correct_rejections += 1
-        game_state.feedback_text = "CORRECT!"
-        game_state.feedback_color = GREEN
-    
-    game_state.feedback_time = pygame.time.get_ticks()
-    
-    # Calculate ADHD metrics
-    metrics = calculate_adhd_metrics(game_state, stimulus)
-    
-    # Log to CSV - append to single file
-    with open(game_state.filename, 'a', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow([
-            game_state.session_id,
-            game_state.trial + 1,
-            stimulus.letter,
-            f"({stimulus.position[0]},{stimulus.position[1]})",
-            "Yes" if stimulus.is_match else "No",
-            "Yes" if stimulus.user_pressed else "No",
-            "Yes" if stimulus.correct else "No",
-            stimulus.reaction_time if stimulus.reaction_time else "",
-            game_state.score,
-            datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            metrics['response_type'],
-            metrics['difficulty'],
-            metrics['trial_type'],
-            "Yes" if metrics['prev_correct'] else "No",
-            metrics['consecutive_errors'],
-            metrics['rt_variability'],
-            "Yes" if metrics['premature'] else "No",
-            "Yes" if metrics['late_response'] else "No",
-            "Yes" if metrics['attention_lapse'] else "No",
-            metrics['impulsivity_score'],
-            metrics['wm_load'],
-            "Yes" if metrics['distractor_present'] else "No",
-            metrics['stimulus_duration'],
-            metrics['inter_trial_interval']
-        ])
-
+@profiler.timed
 def draw_final_summary(game_state):
     """Draw the final results screen"""
     win.fill(BLACK)
@@ -667,7 +522,7 @@ def draw_final_summary(game_state):
     total_responses = game_state.hits + game_state.misses + game_state.false_alarms + game_state.correct_rejections
     accuracy = (game_state.hits + game_state.correct_rejections) / total_responses * 100 if total_responses > 0 else 0
     
-    title = font_big.render("Game Complete!", True, BLUE)
+    title = render_text(font_big, "Game Complete!", BLUE)
     title_rect = title.get_rect(center=(WIDTH//2, 100))
     win.blit(title, title_rect)
     
@@ -696,23 +551,42 @@ def draw_final_summary(game_state):
         else:
             color = WHITE
             
-        text = font_medium.render(line, True, color)
+        text = render_text(font_medium, line, color)
         text_rect = text.get_rect(center=(WIDTH//2, y))
         win.blit(text, text_rect)
         y += 40
 
 def main():
-    game_state = GameState()
-    clock = pygame.time.Clock()
+    game_state = GameState(clock=pygame.time.get_ticks)
+    game_state.logger = TrialLogger(make_sink(game_state.filename, NBACK_LOG_HEADER, "nback"),
+                                    tracer=tracer)
+    game_state.tracer = tracer
+    game_state.sequence_cache = SequenceCache(
+        os.path.join(os.path.dirname(os.path.abspath(game_state.filename)), SEQUENCE_CACHE_FILE))
+    capture = start_capture()
+    timer = FrameTimer(capture=capture)
+    scheduler = PresentationScheduler(timer)
+    game_state.presentation = scheduler
+    game_state.log_at_offset = True
     running = True
+    frame = 0
+    frame_start_ns = time.perf_counter_ns()
     
     while running:
         current_time = pygame.time.get_ticks()
+        stimulus_drawn = False
+        stimulus_ended = False
+        tracer.phase(game_state.game_phase)
         
-        for event in pygame.event.get():
+        with profiler.stage("events"):
+            events = timer.get_events()
+        for event, event_ns in events:
             if event.type == pygame.QUIT:
                 running = False
             
+            elif event.type == pygame.KEYDOWN and event.key == TOGGLE_KEY:
+                profiler.toggle()
+            
             elif event.type == pygame.KEYDOWN:
                 if game_state.game_phase == "instructions":
                     if event.key == pygame.K_RETURN:
@@ -748,7 +622,8 @@ def main():
                 
                 elif game_state.game_phase == "playing" and event.key == pygame.K_SPACE:
                     if game_state.current_stimulus and not game_state.current_stimulus.responded:
-                        handle_response(game_state, True)
+                        with profiler.stage("handle_response"), tracer.span("handle_response", "trial"):
+                            handle_response(game_state, True, event_ns)
                 
                 elif game_state.game_phase == "finished" and event.key == pygame.K_ESCAPE:
                     running = False
@@ -762,61 +637,58 @@ def main():
             draw_feedback(game_state)
         
         elif game_state.game_phase == "playing":
-            if game_state.trial >= trial_count:
-                game_state.game_phase = "finished"
-            
-            elif game_state.current_stimulus is None:
-                # Start new trial
-                game_state.current_stimulus = generate_trial(game_state)
-                game_state.stimuli.append(game_state.current_stimulus)
-                game_state.phase_start_time = current_time
-            
-            elif current_time - game_state.phase_start_time >= stimulus_duration:
-                # Time up for current stimulus
-                if not game_state.current_stimulus.responded:
-                    handle_response(game_state, False)
-                
-                # Move to break phase
-                game_state.game_phase = "break"
-                game_state.phase_start_time = current_time
-            
-            else:
+            with profiler.stage("update_trial_phase"):
+                step = update_trial_phase(game_state, current_time)
+            if step == "finished":
+                game_state.logger.complete_session(game_state.session_id)
+            if step == "ended":
+                # Take the stimulus down on this frame's flip, not the next one
+                draw_break_screen(game_state)
+                stimulus_ended = True
+            if step is None:
                 # Draw current trial
                 win.fill(BLACK)
                 draw_grid(game_state.current_stimulus)
-                draw_timer_bar(current_time, game_state.phase_start_time, stimulus_duration)
+                draw_timer_bar(current_time, game_state.phase_start_time, game_state.stimulus_duration)
                 draw_previous_trial_reference(game_state)
                 draw_info_panel(game_state)
                 draw_feedback(game_state)
+                stimulus_drawn = True
         
         elif game_state.game_phase == "break":
-            if current_time - game_state.phase_start_time >= inter_stimulus_interval:
-                # Break over, prepare next trial
-                game_state.trial += 1
-                game_state.current_stimulus = None
-                game_state.game_phase = "playing"
-            else:
-                # Show break screen with feedback
-                win.fill(BLACK)
-                
-                # Show "Processing..." or break message
-                break_text = font_medium.render("", True, YELLOW)
-                break_rect = break_text.get_rect(center=(WIDTH//2 - 75, HEIGHT//2))
-                win.blit(break_text, break_rect)
-                
-                # Show what just happened
-                if len(game_state.stimuli) > 0:
-                    draw_grid(game_state.stimuli[-1], highlight_correct=True)
-                
-                draw_info_panel(game_state)
-                draw_feedback(game_state)
+            with profiler.stage("update_trial_phase"):
+                step = update_trial_phase(game_state, current_time)
+            if step is None:
+                draw_break_screen(game_state)
         
         elif game_state.game_phase == "finished":
             draw_final_summary(game_state)
         
-        pygame.display.flip()
-        clock.tick(60)
-    
+        with profiler.stage("overlay"):
+            profiler.draw_overlay(win)
+        tracer.phase(game_state.game_phase)
+        # Draw, then wait out the frame, then flip, so flips land on the frame grid
+        with profiler.stage("wait"):
+            scheduler.wait_flip()
+        with profiler.stage("flip"), tracer.span("flip", "display"):
+            flip_ns = timer.flip()
+        if stimulus_drawn and game_state.current_stimulus.onset_ns is None:
+            scheduler.onset(game_state.current_stimulus, flip_ns, game_state.stimulus_duration)
+        if stimulus_ended:
+            record_offset(game_state, game_state.stimuli[-1], flip_ns)
+        profiler.end_frame()
+        frame_end_ns = time.perf_counter_ns()
+        tracer.complete("frame", frame_start_ns, frame_end_ns, "frame", {"frame": frame})
+        frame += 1
+        frame_start_ns = frame_end_ns
+    
+    if game_state.stimuli and game_state.stimuli[-1].pending_row is not None:
+        record_offset(game_state, game_state.stimuli[-1], None)  # quit while it was on screen
+    if capture:
+        capture.stop()
+    game_state.logger.close()
+    tracer.dump(game_state.filename, game_state.session_id, "nback")
+    profiler.write_histogram(game_state.filename, game_state.session_id, "nback")
     pygame.quit()
 
 if __name__ == "__main__":
@@ -0,0 +1,152 @@
+import time
+import pygame
+
+from input_capture import capture_kind
+
+
+def now_ns():
+    """High-resolution monotonic timestamp in nanoseconds"""
+    return time.perf_counter_ns()
+
+
+def ns_to_ms(ns):
+    return ns / 1_000_000
+
+
+def elapsed_ms(start_ns, end_ns):
+    """Milliseconds between two perf_counter_ns stamps, rounded to 0.1 ms"""
+    if start_ns is None or end_ns is None:
+        return None
+    return round((end_ns - start_ns) / 1_000_000, 1)
+
+
+class FrameTimer:
+    """Stamp input events and display flips with perf_counter_ns.
+
+    pygame events carry no arrival time, and draining the queue once per frame
+    quantizes every response to the frame boundary. Instead of sleeping through
+    clock.tick(), wait_frame() sleeps in short slices and drains the event queue
+    after each one, so every event is stamped within about `poll_interval`
+    seconds of reaching SDL. flip() stamps the moment the new frame has been
+    handed to the display, which is used as stimulus onset. With an
+    input_capture.InputCapture as `capture`, responses it also saw get its
+    stamp instead, taken when the OS delivered them.
+    """
+    def __init__(self, poll_interval=0.001, capture=None):
+        self.poll_interval = poll_interval
+        self.capture = capture
+        self.last_flip_ns = None
+        self._pending = []
+        self._frame_start = now_ns()
+
+    def pump(self):
+        """Move queued pygame events into the pending list with their arrival stamp"""
+        events = pygame.event.get()
+        if events:
+            stamp = now_ns()
+            if self.capture is None:
+                self._pending.extend((event, stamp) for event in events)
+            else:
+                self._pending.extend((event, self._captured_stamp(event, stamp)) for event in events)
+
+    def _captured_stamp(self, event, stamp):
+        kind = capture_kind(event)
+        captured = self.capture.claim(kind, stamp) if kind else None
+        return stamp if captured is None else captured
+
+    def get_events(self):
+        """Return all (event, timestamp_ns) pairs since the last call"""
+        self.pump()
+        events = self._pending
+        self._pending = []
+        return events
+
+    def flip(self, rects=None):
+        """Update the display and return the timestamp of the flip"""
+        if rects is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(rects)
+        self.last_flip_ns = now_ns()
+        return self.last_flip_ns
+
+    def next_deadline_ns(self, fps):
+        """When the current wait_frame(fps) would return"""
+        return self._frame_start + 1_000_000_000 // fps
+
+    def wait_frame(self, fps, spin_ns=0):
+        """Drop-in for clock.tick(fps) that keeps stamping input while it waits.
+
+        With `spin_ns`, the last stretch before the deadline is busy-waited
+        instead of slept, like Clock.tick_busy_loop(), so the return lands
+        on the deadline rather than wherever the OS scheduler wakes us.
+        Returns the milliseconds since the previous call, like Clock.tick().
+        """
+        frame_ns = 1_000_000_000 // fps
+        deadline = self._frame_start + frame_ns
+        while True:
+            self.pump()
+            remaining = deadline - now_ns()
+            if remaining <= 0:
+                break
+            if remaining <= spin_ns:
+                while now_ns() < deadline:
+                    pass
+                break
+            time.sleep(min(self.poll_interval, (remaining - spin_ns) / 1_000_000_000))
+
+        now = now_ns()
+        elapsed = now - self._frame_start
+        # Don't try to catch up after a long frame, just start the next one now
+        self._frame_start = deadline if now - deadline < frame_ns else now
+        return ns_to_ms(elapsed)
+
+
+def display_refresh_rate():
+    """The display's refresh rate in Hz if this pygame can report it, else None"""
+    get_rate = getattr(pygame.display, "get_current_refresh_rate", None)
+    try:
+        rate = get_rate() if get_rate else 0
+    except pygame.error:
+        rate = 0
+    return rate or None
+
+
+class PresentationScheduler:
+    """Plans stimulus onset and offset to land on display flips.
+
+    A stimulus stays up for a whole number of frames: its offset is planned
+    at onset + round(duration / frame period) frames, and it is taken down
+    on the frame whose flip is nearest that time. The loop draws first and
+    then calls wait_flip(), which sleeps until just before the frame
+    deadline and busy-waits the rest, so flips land on a regular grid and
+    the measured onset/offset stamps are the flips themselves.
+    """
+    SPIN_NS = 2_000_000  # busy-wait the last 2 ms before each flip
+
+    def __init__(self, timer, fps=None, spin_ns=SPIN_NS):
+        self.timer = timer
+        self.fps = fps or display_refresh_rate() or 60
+        self.frame_ns = 1_000_000_000 // self.fps
+        self.spin_ns = spin_ns
+
+    def frames_for(self, duration_ms):
+        return max(1, round(duration_ms * 1_000_000 / self.frame_ns))
+
+    def onset(self, stimulus, flip_ns, duration_ms):
+        """Record the flip that first showed `stimulus` and plan its offset"""
+        stimulus.onset_ns = flip_ns
+        stimulus.planned_offset_ns = flip_ns + self.frames_for(duration_ms) * self.frame_ns
+
+    def next_flip_ns(self):
+        return max(self.timer.next_deadline_ns(self.fps), now_ns())
+
+    def offset_due(self, stimulus):
+        """True if the frame being drawn now should be the one without the stimulus"""
+        if stimulus.planned_offset_ns is None:
+            return False
+        return self.next_flip_ns() >= stimulus.planned_offset_ns - self.frame_ns // 2
+
+    def wait_flip(self):
+        """Wait for the next frame deadline; call right before flipping"""
+        return self.timer.wait_frame(self.fps, self.spin_ns)
@@ -0,0 +1,113 @@
+import os
+import sys
+import time
+from collections import deque
+
+import pygame
+
+# Response timestamps taken off the game thread. pygame's event queue can only
+# be pumped from the thread that owns the window, so it is still drained once
+# per frame (and between sleeps in FrameTimer.wait_frame), and a frame that
+# runs long delays every stamp behind it. With ADHD_INPUT_THREAD=1 and pynput
+# installed, pynput's listener threads receive SPACE presses and left clicks
+# straight from the OS as they happen and stamp them with perf_counter_ns;
+# FrameTimer then gives each matching pygame event the stamp of its OS event
+# instead of the time the frame got around to it:
+#   ADHD_INPUT_THREAD=1 python game2.py
+# pynput is only needed for this and isn't installed with the games
+# (pip install pynput); with the flag set and no pynput the games stop with
+# a message saying so. Stamps use perf_counter_ns, hires_timing.now_ns's
+# clock, without importing hires_timing (which imports this module).
+
+INPUT_ENV = "ADHD_INPUT_THREAD"
+MAX_LAG_NS = 500_000_000  # captured presses older than this never match a pygame event
+QUEUE_LIMIT = 1024
+
+try:
+    from pynput import keyboard, mouse
+except ImportError as e:  # not installed, or no display backend pynput can hook
+    keyboard = mouse = None
+    _pynput_error = e
+
+
+def capture_kind(event):
+    """Capture kind ("space" or "left") of pygame events the capture thread stamps, else None"""
+    if event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
+        return "space"
+    if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+        return "left"
+    return None
+
+
+class InputCapture:
+    """SPACE and left-click stamps from pynput's listener threads.
+
+    The listeners only append (kind, ns) to a bounded deque, which is safe
+    without a lock for one producer per listener and one consumer; claim()
+    runs on the game thread, moves everything new into its own list and
+    hands out the oldest unclaimed stamp of the kind, so each OS event
+    times at most one pygame event. OS events that never turn into pygame
+    events (the window wasn't focused) age out after MAX_LAG_NS. A held
+    SPACE's autorepeat presses, which pygame drops, are not queued: only
+    the first press after a release is stamped.
+    """
+    def __init__(self):
+        self._queue = deque(maxlen=QUEUE_LIMIT)
+        self._unclaimed = []
+        self._listeners = []
+        self._space_down = False  # touched only by the keyboard listener thread
+
+    def _on_press(self, key):
+        if key == keyboard.Key.space and not self._space_down:
+            self._space_down = True
+            self._queue.append(("space", time.perf_counter_ns()))
+
+    def _on_release(self, key):
+        if key == keyboard.Key.space:
+            self._space_down = False
+
+    def _on_click(self, x, y, button, pressed):
+        if pressed and button == mouse.Button.left:
+            self._queue.append(("left", time.perf_counter_ns()))
+
+    def start(self):
+        self._listeners = [keyboard.Listener(on_press=self._on_press, on_release=self._on_release),
+                           mouse.Listener(on_click=self._on_click)]
+        for listener in self._listeners:
+            listener.start()
+        return self
+
+    def stop(self):
+        for listener in self._listeners:
+            listener.stop()
+        self._listeners = []
+
+    def claim(self, kind, seen_ns):
+        """Stamp of the OS event behind a pygame event of `kind` seen at `seen_ns`, or None"""
+        queue = self._queue
+        while queue:
+            self._unclaimed.append(queue.popleft())
+        self._unclaimed = [(k, ns) for k, ns in self._unclaimed if seen_ns - ns <= MAX_LAG_NS]
+        for i, (k, ns) in enumerate(self._unclaimed):
+            if k == kind and ns <= seen_ns:
+                del self._unclaimed[i]
+                return ns
+        return None
+
+
+def start_capture():
+    """A running InputCapture if ADHD_INPUT_THREAD=1 and pynput works here, else None"""
+    if os.environ.get(INPUT_ENV, "0") in ("", "0"):
+        return None
+    if keyboard is None:
+        if getattr(_pynput_error, "name", None) == "pynput":
+            sys.exit(f"{INPUT_ENV} is set but pynput is not installed: pip install pynput, "
+                     f"or unset {INPUT_ENV} to stamp input per frame")
+        print(f"{INPUT_ENV} is set but pynput can't hook input here ({_pynput_error}); stamping input per frame",
+              file=sys.stderr)
+        return None
+    try:
+        return InputCapture().start()
+    except Exception as e:  # pynput backends raise their own errors when they can't hook
+        print(f"input capture thread unavailable ({e}); stamping input per frame", file=sys.stderr)
+        return None
@@ -0,0 +1,273 @@
+import csv
+import glob
+import json
+import os
+import struct
+import sys
+import time
+import uuid
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Write-ahead journal in front of a trial log sink. Every batch is appended to
+# <log>.wal as a checksummed record and fsynced before the sink sees it, so a
+# crash or power cut loses nothing that reached the journal:
+#   record = length (uint32 LE) | crc32 of kind + payload (uint32 LE) | kind (1 byte) | payload
+# The next run replays batches the sink never confirmed and cuts off a torn
+# last record. How each session ended goes to <log>.sessions.
+# Every writer of a log (several games can run at once without the log
+# service) has its own <log>.wal.<pid>-<id> and holds an exclusive lock on it
+# while open, so only journals whose process has gone are ever replayed.
+JOURNAL_ENV = "ADHD_JOURNAL"
+JOURNAL_SUFFIX = ".wal"
+STATUS_SUFFIX = ".sessions"
+
+ROWS = 1  # {"seq", "offset", "rows"}: a batch about to go to the sink
+APPLIED = 2  # {"seq", "end"}: the sink has the batch, ending at byte `end` if known
+COMPLETE = 3  # {"session"}: the session ran to the end
+DROPPED = 4  # {"seq"}: the sink refused the batch; TrialLogger retries it as a new one
+
+_RECORD = struct.Struct("<IIB")
+
+
+def journal_enabled():
+    return os.environ.get(JOURNAL_ENV, "1") != "0"
+
+
+def _pack(kind, payload):
+    body = bytes([kind]) + json.dumps(payload, separators=(",", ":")).encode()
+    return struct.pack("<II", len(body) - 1, zlib.crc32(body)) + body
+
+
+def read_journal(path):
+    """(records, valid_length): the intact records and where the first damaged one starts"""
+    records = []
+    if not os.path.exists(path):
+        return records, 0
+    with open(path, 'rb') as f:
+        data = f.read()
+    position = 0
+    while position + _RECORD.size <= len(data):
+        length, crc, kind = _RECORD.unpack_from(data, position)
+        end = position + _RECORD.size + length
+        body = data[position + 8:end]
+        if end > len(data) or zlib.crc32(body) != crc:
+            break
+        records.append((kind, json.loads(body[1:])))
+        position = end
+    return records, position
+
+
+def journal_files(log_filename):
+    """Every journal of the log: live writers' and ones left by crashed runs"""
+    return [path for path in glob.glob(glob.escape(log_filename + JOURNAL_SUFFIX) + "*")
+            if not path.endswith(".tmp")]
+
+
+def _try_lock(f):
+    """Take the exclusive lock on an open journal without waiting; False if a live writer holds it"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _claim(path):
+    """The journal at `path` opened and locked if its writer is gone, else None"""
+    try:
+        f = open(path, 'r+b')
+    except FileNotFoundError:
+        return None  # recovered and removed by another process meanwhile
+    if _try_lock(f):
+        try:
+            if os.path.samestat(os.fstat(f.fileno()), os.stat(path)):
+                return f
+        except FileNotFoundError:
+            pass
+    f.close()
+    return None
+
+
+def _discard(path, f):
+    """Empty, unlock and delete a journal this process holds; an empty journal is never replayed"""
+    f.truncate(0)
+    f.close()
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass  # a starting writer found it empty and removed it first
+
+
+def _encodable_rows(rows):
+    """The rows JSON can encode; the others are reported on stderr and left out"""
+    kept = []
+    for row in rows:
+        try:
+            json.dumps(row)
+        except (TypeError, ValueError) as e:
+            print(f"dropping a trial row the journal can't encode ({e}): {row!r}", file=sys.stderr)
+        else:
+            kept.append(row)
+    return kept
+
+
+class JournalSink:
+    """Wraps a sink so every batch is journalled and fsynced first.
+
+    One fsync per batch: TrialLogger already groups rows into batches on
+    its writer thread, so durability costs one sync per write rather than
+    per row and never blocks the frame loop. Sinks with position()/rollback() (CSVSink) are cut
+    back to the start of an unconfirmed batch before it is replayed, so a
+    crash between writing and confirming never duplicates rows; other sinks,
+    and logs another live writer is appending to, may see such a batch twice.
+    """
+    def __init__(self, sink, log_filename, header):
+        self.sink = sink
+        self.log_filename = log_filename
+        self.path = f"{log_filename}{JOURNAL_SUFFIX}.{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.status_path = log_filename + STATUS_SUFFIX
+        self.session_column = header.index("Session") if "Session" in header else None
+        self.recovered_rows = 0
+        self._file = None
+        self._seq = 0
+        self._sessions = {}  # session -> rows, in journal order
+        self._complete = set()
+
+    def open(self):
+        claimed, live = [], 0
+        for path in sorted(journal_files(self.log_filename)):
+            f = _claim(path)
+            if f is None:
+                live += 1
+            else:
+                claimed.append((path, f))
+
+        self.sink.open()
+        for path, f in claimed:
+            # Cutting the log back is only safe while nobody else appends to it
+            self._recover(f, rollback=live == 0 and len(claimed) == 1)
+            _discard(path, f)
+
+        # Created under another name and locked before it appears, so no
+        # starting writer mistakes it for a crashed run's journal
+        self._file = open(self.path + ".tmp", 'wb')
+        _try_lock(self._file)
+        os.replace(self.path + ".tmp", self.path)
+        self._fsync()
+
+    def _recover(self, f, rollback):
+        """Replay what a crashed writer's journal holds that its sink never confirmed"""
+        records, _ = read_journal(f.name)  # a torn tail is dropped with the file
+        batches = {}
+        applied = {}
+        for kind, payload in records:
+            if kind == ROWS:
+                batches[payload["seq"]] = payload
+            elif kind == APPLIED:
+                applied[payload["seq"]] = payload.get("end")
+            elif kind == DROPPED:
+                batches.pop(payload["seq"], None)
+            elif kind == COMPLETE:
+                self._complete.add(payload["session"])
+
+        size = self.sink.position() if hasattr(self.sink, "position") else None
+        for batch in batches.values():
+            self._count(batch["rows"])
+        pending = []
+        for seq in sorted(batches):
+            # The sink's own writes aren't fsynced, so a confirmed batch can
+            # still be missing from the end of the log after a power cut
+            done = seq in applied and (size is None or applied[seq] is None or applied[seq] <= size)
+            if pending or not done:
+                pending.append(batches[seq])
+        if pending:
+            offset = pending[0]["offset"]
+            if rollback and offset is not None and hasattr(self.sink, "rollback"):
+                self.sink.rollback(offset)
+            rows = [row for batch in pending for row in batch["rows"]]
+            self.sink.write_rows(rows)
+            self.recovered_rows += len(rows)
+        if records:
+            self._write_status("crashed")
+
+    def _count(self, rows):
+        if self.session_column is None:
+            return
+        for row in rows:
+            session = row[self.session_column] if len(row) > self.session_column else ""
+            self._sessions[session] = self._sessions.get(session, 0) + 1
+
+    def _write_status(self, unfinished):
+        """Append how each journalled session ended, then forget them"""
+        if self._sessions:
+            new = not os.path.exists(self.status_path)
+            ended = time.strftime("%Y-%m-%d %H:%M:%S")
+            with open(self.status_path, 'a', newline='') as f:
+                writer = csv.writer(f)
+                if new:
+                    writer.writerow(["Session", "Status", "Rows", "Recorded"])
+                for session, rows in self._sessions.items():
+                    status = "complete" if session in self._complete else unfinished
+                    writer.writerow([session, status, rows, ended])
+        self._sessions.clear()
+        self._complete.clear()
+
+    def _append(self, kind, payload, sync):
+        self._file.write(_pack(kind, payload))
+        if sync:
+            self._fsync()
+        else:
+            self._file.flush()
+
+    def _fsync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def write_rows(self, rows):
+        self._seq += 1
+        offset = self.sink.position() if hasattr(self.sink, "position") else None
+        try:
+            record = _pack(ROWS, {"seq": self._seq, "offset": offset, "rows": rows})
+        except (TypeError, ValueError):
+            # Not an I/O error, so retrying the batch would fail forever: the
+            # rows that can't be journalled go to neither journal nor log
+            rows = _encodable_rows(rows)
+            record = _pack(ROWS, {"seq": self._seq, "offset": offset, "rows": rows})
+        self._file.write(record)
+        self._fsync()
+        try:
+            self.sink.write_rows(rows)
+        except OSError:
+            if offset is not None and hasattr(self.sink, "rollback"):
+                self.sink.rollback(offset)
+            self._append(DROPPED, {"seq": self._seq}, sync=True)
+            raise
+        self._count(rows)
+        # No fsync: if this record is lost the batch is rolled back and replayed
+        end = self.sink.position() if hasattr(self.sink, "position") else None
+        self._append(APPLIED, {"seq": self._seq, "end": end}, sync=False)
+
+    def complete_session(self, session=None):
+        """Record that the current session (or `session`) finished normally"""
+        sessions = [session] if session is not None else list(self._sessions)[-1:]
+        for name in sessions:
+            self._complete.add(name)
+            self._append(COMPLETE, {"session": name}, sync=True)
+        if hasattr(self.sink, "complete_session"):
+            self.sink.complete_session(session)
+
+    def close(self):
+        self.sink.close()
+        if self._file:
+            self._write_status("quit")
+            _discard(self.path, self._file)
+            self._file = None
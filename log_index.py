@@ -0,0 +1,303 @@
+import argparse
+import csv
+import io
+import mmap
+import os
+import sys
+
+import log_segments
+from trial_logger import LOG_ENCODING
+
+# Sidecar byte-offset index for the append-only CSV logs. <log>.idx records
+# where each session's rows and each day's rows start, so readers can seek
+# straight to them instead of parsing the log from the top:
+#   python log_index.py nback_sessions.csv sessions
+#   python log_index.py adhd_log.csv rows --since 2025-08-01 --until 2025-08-12
+#
+# The index is a text file appended to as the log grows, one record per line:
+#   H,<offset>   where the first data row starts (changes if the header is upgraded)
+#   S,<offset>,<session>   a run of rows from one session starts here
+#   D,<offset>,<YYYY-mm-dd>   a run of rows from one day starts here
+#   E,<offset>   everything before this offset has been indexed
+# A run ends where the next record of the same kind starts. Log rows never
+# contain line breaks, so a log is indexed line by line. E is only written
+# alongside new S/D records and on close: re-indexing rows after a stale E
+# adds nothing, so the sidecar grows with sessions and days rather than rows.
+# The index covers the active file only; rows rotated into segments (see
+# log_segments.py) are found through the segment manifest's sessions and
+# time ranges, so queries still span the whole log.
+
+INDEX_ENV = "ADHD_LOG_INDEX"
+INDEX_SUFFIX = ".idx"
+
+
+def index_enabled():
+    return os.environ.get(INDEX_ENV, "1") != "0"
+
+
+def _data_start(log_path):
+    """Byte offset just past the header line, or None for an empty log"""
+    with open(log_path, 'rb') as f:
+        line = f.readline()
+    return len(line) if line.endswith(b"\n") else None
+
+
+class LogIndex:
+    """Session and day boundaries of one CSV log, kept in step with <log>.idx"""
+    def __init__(self, log_path):
+        self.log_path = log_path
+        self.path = log_path + INDEX_SUFFIX
+        self.session_column = None
+        self.time_column = None
+        self.data_start = None
+        self.end = None
+        self.sessions = []  # (offset, session)
+        self.days = []  # (offset, date)
+        self._last_session = None
+        self._last_day = None
+        self._pending = []
+        self._saved_end = None
+
+    def _columns(self, header):
+        self.session_column = header.index("Session") if "Session" in header else None
+        self.time_column = header.index("Timestamp") if "Timestamp" in header else None
+
+    def _reset(self, data_start):
+        self.data_start = self.end = data_start
+        self.sessions, self.days = [], []
+        self._last_session = self._last_day = None
+        self._pending = [f"H,{data_start}\n"]
+
+    def _load(self):
+        """Read the sidecar; False if it is missing or written for another header"""
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, newline='', encoding=LOG_ENCODING) as f:
+            for record in csv.reader(f):
+                if not record:
+                    continue
+                kind, offset = record[0], int(record[1])
+                if kind == "H":
+                    self.data_start = self.end = offset
+                elif kind == "S":
+                    self.sessions.append((offset, record[2]))
+                    self._last_session = record[2]
+                elif kind == "D":
+                    self.days.append((offset, record[2]))
+                    self._last_day = record[2]
+                elif kind == "E":
+                    self.end = offset
+        self._saved_end = self.end
+        return self.data_start is not None
+
+    def open(self):
+        """Load the sidecar, rebuilding it if stale, and index rows appended since"""
+        start = _data_start(self.log_path)
+        if start is None:
+            raise ValueError(f"{self.log_path} has no header line")
+        with open(self.log_path, newline='', encoding=LOG_ENCODING) as f:
+            self._columns(next(csv.reader(f), []))
+        if not self._load() or start != self.data_start or os.path.getsize(self.log_path) < self.end:
+            self._reset(start)
+        self.catch_up()
+        return self
+
+    def note(self, offset, row):
+        """Record the row written at byte `offset` of the log"""
+        session = row[self.session_column] if self.session_column is not None and len(row) > self.session_column else ""
+        if session != self._last_session:
+            self.sessions.append((offset, session))
+            self._pending.append(f"S,{offset},{session}\n")
+            self._last_session = session
+        if self.time_column is not None and len(row) > self.time_column:
+            day = str(row[self.time_column])[:10]
+            if day != self._last_day:
+                self.days.append((offset, day))
+                self._pending.append(f"D,{offset},{day}\n")
+                self._last_day = day
+
+    def commit(self, end, force=False):
+        """Mark everything before `end` as indexed, appending new records to the sidecar"""
+        self.end = end
+        if not self._pending and not (force and end != self._saved_end):
+            return
+        self._pending.append(f"E,{end}\n")
+        with open(self.path, 'a', newline='', encoding=LOG_ENCODING) as f:
+            f.writelines(self._pending)
+        self._pending = []
+        self._saved_end = end
+
+    def close(self):
+        self.commit(self.end, force=True)
+
+    def catch_up(self):
+        """Index complete rows appended to the log by anything other than our own note() calls"""
+        size = os.path.getsize(self.log_path)
+        if size <= self.end:
+            self.commit(self.end)
+            return
+        with open(self.log_path, 'rb') as f:
+            f.seek(self.end)
+            offset = self.end
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # a row still being written
+                self.note(offset, next(csv.reader([line.decode(LOG_ENCODING)]), []))
+                offset += len(line)
+        self.commit(offset, force=True)
+
+    def _runs(self, entries, wanted):
+        ends = [offset for offset, _ in entries[1:]] + [self.end]
+        return [(offset, end) for (offset, key), end in zip(entries, ends) if wanted(key)]
+
+    def session_runs(self, sessions):
+        """(start, end) byte ranges holding the given sessions' rows"""
+        sessions = set(sessions)
+        return self._runs(self.sessions, lambda session: session in sessions)
+
+    def day_runs(self, since=None, until=None):
+        """(start, end) byte ranges holding rows dated between `since` and `until` (YYYY-mm-dd, inclusive)"""
+        return self._runs(self.days, lambda day: (since is None or day >= since) and (until is None or day <= until))
+
+
+class IndexedLogReader:
+    """Memory-mapped reader over a CSV log that uses its LogIndex to seek.
+
+    Queries touch only the byte ranges the index points to, so reading the
+    latest sessions costs the same however long the history behind them is.
+    Rotated segments come first: only those whose manifest entry lists a
+    wanted session or overlaps the wanted days are read, and their rows
+    are filtered as they stream.
+    """
+    def __init__(self, log_path):
+        self.segments = log_segments.load_manifest(log_segments.segment_dir(log_path))["segments"]
+        self._segment_paths = log_segments.segment_files(log_path)[:len(self.segments)]
+        self.header, _ = log_segments.read_log(log_path)
+        self.index = self._file = self._map = None
+        if os.path.exists(log_path):  # rotated away and not yet recreated otherwise
+            self.index = LogIndex(log_path).open()
+            self._file = open(log_path, 'rb')
+            if os.path.getsize(log_path):
+                self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.session_column = self.header.index("Session") if "Session" in self.header else None
+        self.time_column = self.header.index("Timestamp") if "Timestamp" in self.header else None
+
+    def close(self):
+        if self.index is not None:
+            self.index.close()
+        if self._map is not None:
+            self._map.close()
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def sessions(self):
+        """Session names in order of first appearance"""
+        names = [session for entry in self.segments for session in entry["sessions"]]
+        if self.index is not None:
+            names += [session for _, session in self.index.sessions]
+        return list(dict.fromkeys(names))
+
+    def days(self):
+        days = set()
+        for entry, path in zip(self.segments, self._segment_paths):
+            first, last = (entry[key][:10] if entry[key] else None for key in ("first", "last"))
+            if first == last:
+                days.add(first)
+            else:  # a size-rotated segment can span days in between
+                days.update(self._day(row) for row in self._segment_rows(path))
+        if self.index is not None:
+            days.update(day for _, day in self.index.days)
+        return sorted(day for day in days if day)
+
+    def _day(self, row):
+        return row[self.time_column][:10] if self.time_column is not None else None
+
+    def _segment_rows(self, path):
+        width = len(self.header)
+        with log_segments.open_text(path) as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            for row in reader:
+                yield row + [""] * (width - len(row))
+
+    def iter_range(self, start, end):
+        """Parsed rows between two byte offsets of the active file, padded to the header's length"""
+        text = self._map[start:end].decode(LOG_ENCODING)
+        width = len(self.header)
+        for row in csv.reader(io.StringIO(text, newline='')):
+            yield row + [""] * (width - len(row))
+
+    def _iter_runs(self, runs):
+        for start, end in runs:
+            yield from self.iter_range(start, end)
+
+    def iter_sessions(self, sessions):
+        sessions = set(sessions)
+        for entry, path in zip(self.segments, self._segment_paths):
+            if sessions.intersection(entry["sessions"]) and self.session_column is not None:
+                yield from (row for row in self._segment_rows(path) if row[self.session_column] in sessions)
+        if self.index is not None:
+            yield from self._iter_runs(self.index.session_runs(sessions))
+
+    def iter_days(self, since=None, until=None):
+        def wanted(day):
+            return day is not None and (since is None or day >= since) and (until is None or day <= until)
+
+        for entry, path in zip(self.segments, self._segment_paths):
+            first = entry["first"][:10] if entry["first"] else None
+            last = entry["last"][:10] if entry["last"] else None
+            if first is None or (until is not None and first > until) or (since is not None and last < since):
+                continue
+            yield from (row for row in self._segment_rows(path) if wanted(self._day(row)))
+        if self.index is not None:
+            yield from self._iter_runs(self.index.day_runs(since, until))
+
+    def recent_sessions(self, count):
+        """Rows of the last `count` sessions in the log"""
+        return self.iter_sessions(self.sessions()[-count:])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Byte-offset index of a CSV trial log")
+    parser.add_argument("log")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("rebuild", help="rewrite the sidecar index from scratch")
+    commands.add_parser("sessions", help="list sessions with their byte offsets")
+    rows = commands.add_parser("rows", help="print the rows of some sessions or days")
+    rows.add_argument("--session", nargs="+", default=None)
+    rows.add_argument("--last", type=int, default=None, help="the most recent N sessions")
+    rows.add_argument("--since", default=None, help="YYYY-mm-dd")
+    rows.add_argument("--until", default=None, help="YYYY-mm-dd")
+    args = parser.parse_args(argv)
+
+    if args.command == "rebuild" and os.path.exists(args.log + INDEX_SUFFIX):
+        os.remove(args.log + INDEX_SUFFIX)
+    with IndexedLogReader(args.log) as reader:
+        if args.command == "rebuild" and reader.index is not None:
+            print(f"{len(reader.index.sessions)} session runs, {len(reader.index.days)} day runs "
+                  f"up to byte {reader.index.end}", file=sys.stderr)
+        elif args.command == "sessions":
+            for entry in reader.segments:
+                for session in entry["sessions"]:
+                    print(f"{entry['name']}\t{session}")
+            for offset, session in (reader.index.sessions if reader.index is not None else []):
+                print(f"{offset}\t{session}")
+        else:
+            if args.session or args.last:
+                selected = reader.iter_sessions(args.session) if args.session else reader.recent_sessions(args.last)
+            else:
+                selected = reader.iter_days(args.since, args.until)
+            writer = csv.writer(sys.stdout)
+            writer.writerow(reader.header)
+            writer.writerows(selected)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+import threading
+from datetime import datetime
+
+# Rotation of the append-only CSV logs into closed, compressed segments. When a
+# game opens its log and the rows in it started on an earlier day (or the file
+# passed SEGMENT_MAX_BYTES), the file is renamed into <stem>_segments/ and a
+# fresh one with just the header takes its place, so appends only ever touch
+# a small active file. Closed segments are compressed on a background thread
+# and listed in <stem>_segments/manifest.json with their time range, sessions
+# and row counts. read_log() streams the segments and then the active file as
+# one log:
+#   python log_segments.py adhd_log.csv list
+#   python log_segments.py nback_sessions.csv rotate
+SEGMENTS_ENV = "ADHD_SEGMENTS"  # "day" (default), "size", or "0" for no rotation
+COMPRESSION_ENV = "ADHD_SEGMENT_COMPRESSION"  # "gzip" (default) or "zstd"
+SEGMENT_MAX_BYTES = 16 * 1024 * 1024
+MANIFEST_FILE = "manifest.json"
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+EXTENSIONS = {"gzip": ".gz", "zstd": ".zst"}
+
+_manifest_lock = threading.Lock()
+_compress_lock = threading.Lock()  # one compress_pending() at a time, so each segment is compressed once
+
+
+def segment_dir(log_path):
+    stem = os.path.splitext(os.path.basename(log_path))[0]
+    return os.path.join(os.path.dirname(os.path.abspath(log_path)), stem + "_segments")
+
+
+def compression():
+    """The configured codec, falling back to gzip when zstandard isn't installed"""
+    codec = os.environ.get(COMPRESSION_ENV, "gzip")
+    if codec == "zstd" and zstandard is None:
+        return "gzip"
+    if codec not in EXTENSIONS:
+        raise ValueError(f"unknown {COMPRESSION_ENV} codec {codec!r}")
+    return codec
+
+
+def open_text(path):
+    """Text stream over a CSV log or a segment, decompressing by extension"""
+    if path.endswith(".gz"):
+        return gzip.open(path, 'rt', newline='')
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"{path} needs the zstandard package")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True),
+                                newline='')
+    return open(path, newline='')
+
+
+def load_manifest(directory):
+    path = os.path.join(directory, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {"segments": []}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_manifest(directory, manifest):
+    path = os.path.join(directory, MANIFEST_FILE)
+    with open(path + ".tmp", 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def _segment_file(directory, entry):
+    """Where a segment's rows are now: the raw file until compression has finished"""
+    raw = os.path.join(directory, entry["name"])
+    if entry.get("compression") and not os.path.exists(raw):
+        return raw + EXTENSIONS[entry["compression"]]
+    return raw
+
+
+def segment_files(log_path):
+    """Closed segments in order, then the active log if it exists"""
+    directory = segment_dir(log_path)
+    files = [_segment_file(directory, entry) for entry in load_manifest(directory)["segments"]]
+    if os.path.exists(log_path):
+        files.append(log_path)
+    return files
+
+
+def _describe(path):
+    """Manifest fields for a CSV file: header, rows, time range and sessions"""
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        session_col = header.index("Session") if "Session" in header else None
+        time_col = header.index("Timestamp") if "Timestamp" in header else None
+        rows = 0
+        first = last = None
+        sessions = {}
+        for row in reader:
+            rows += 1
+            if time_col is not None and time_col < len(row):
+                first = first or row[time_col]
+                last = row[time_col]
+            if session_col is not None and session_col < len(row) and row[session_col]:
+                sessions[row[session_col]] = None
+    return {"header": header, "rows": rows, "first": first, "last": last, "sessions": list(sessions)}
+
+
+def rotation_due(log_path, policy=None, today=None):
+    """True if the log has rows and they started before `today` or it is over the size cap"""
+    policy = policy or os.environ.get(SEGMENTS_ENV, "day")
+    if policy == "0" or not os.path.exists(log_path):
+        return False
+    if os.path.getsize(log_path) > SEGMENT_MAX_BYTES:
+        return True
+    if policy != "day":
+        return False
+    with open(log_path, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        row = next(reader, None)
+    if row is None or "Timestamp" not in header or header.index("Timestamp") >= len(row):
+        return False
+    today = today or datetime.now().strftime('%Y-%m-%d')
+    return row[header.index("Timestamp")][:10] < today
+
+
+def rotate(log_path, background=True):
+    """Close the active log as a segment; returns its manifest entry (None if it had no rows).
+
+    The caller recreates the active file (CSVSink does when it opens).
+    Compression runs on a daemon thread unless `background` is False; an
+    interrupted compression is finished by the next rotate_if_due().
+    """
+    info = _describe(log_path)
+    if not info["rows"]:
+        return None
+    directory = segment_dir(log_path)
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(log_path))[0]
+    days = "_".join(dict.fromkeys(value[:10] for value in (info["first"], info["last"]) if value)) or "undated"
+    name = f"{stem}_{days}.csv"
+    counter = 1
+    while any(os.path.exists(os.path.join(directory, name + ext)) for ext in ("", ".gz", ".zst")):
+        counter += 1
+        name = f"{stem}_{days}_{counter}.csv"
+
+    os.replace(log_path, os.path.join(directory, name))
+    from log_index import INDEX_SUFFIX
+    if os.path.exists(log_path + INDEX_SUFFIX):
+        os.remove(log_path + INDEX_SUFFIX)  # offsets into the file that just moved
+    entry = dict(info, name=name, bytes=os.path.getsize(os.path.join(directory, name)),
+                 compression=None, compressed_bytes=None)
+    with _manifest_lock:
+        manifest = load_manifest(directory)
+        manifest["segments"].append(entry)
+        _save_manifest(directory, manifest)
+
+    if background:
+        _compress_in_background(directory)
+    else:
+        compress_pending(directory)
+    return entry
+
+
+def _compress_in_background(directory):
+    threading.Thread(target=compress_pending, args=(directory,), name="log-segments", daemon=True).start()
+
+
+def _compress_file(source, target, codec):
+    with open(source, 'rb') as f, open(target + ".tmp", 'wb') as out:
+        if codec == "zstd":
+            zstandard.ZstdCompressor(level=10).copy_stream(f, out)
+        else:
+            with gzip.GzipFile(fileobj=out, mode='wb', compresslevel=6) as gz:
+                while True:
+                    block = f.read(1 << 20)
+                    if not block:
+                        break
+                    gz.write(block)
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(target + ".tmp", target)
+
+
+def compress_pending(directory):
+    """Compress every segment still stored raw and record it in the manifest.
+
+    Runs are serialized and each reads the manifest once it has the lock,
+    so a rotation's background run and a resumed one never both claim a
+    segment: the later run finds it compressed and its raw file gone.
+    """
+    with _compress_lock:
+        _compress_pending(directory)
+
+
+def _compress_pending(directory):
+    codec = compression()
+    for entry in load_manifest(directory)["segments"]:
+        raw = os.path.join(directory, entry["name"])
+        if entry.get("compression") or not os.path.exists(raw):
+            continue
+        target = raw + EXTENSIONS[codec]
+        _compress_file(raw, target, codec)
+        with _manifest_lock:
+            manifest = load_manifest(directory)
+            for saved in manifest["segments"]:
+                if saved["name"] == entry["name"]:
+                    saved["compression"] = codec
+                    saved["compressed_bytes"] = os.path.getsize(target)
+            _save_manifest(directory, manifest)
+        os.remove(raw)
+
+
+def rotate_if_due(log_path):
+    """Rotate at session start when the policy says so.
+
+    A log with a write-ahead journal left by a crash, or held by another
+    running writer, is left alone: journal offsets point into it, and it
+    rotates on a later start.
+    """
+    from journal import journal_files
+    if journal_files(log_path):
+        return None
+    if rotation_due(log_path):
+        return rotate(log_path)
+    directory = segment_dir(log_path)
+    if any(not entry.get("compression") for entry in load_manifest(directory)["segments"]):
+        _compress_in_background(directory)  # a previous run exited mid-compression
+    return None
+
+
+def read_log(log_path):
+    """(header, rows): the active file's header and every row of every segment in order.
+
+    Older segments may have a shorter header (columns are only ever
+    appended), so their rows are padded to the current width.
+    """
+    files = segment_files(log_path)
+    header = []
+    if files:
+        with open_text(files[-1]) as f:
+            header = next(csv.reader(f), [])
+
+    def rows():
+        width = len(header)
+        for path in files:
+            with open_text(path) as f:
+                reader = csv.reader(f)
+                next(reader, None)
+                for row in reader:
+                    yield row + [""] * (width - len(row)) if len(row) < width else row
+
+    return header, rows()
+
+
+def row_count(log_path):
+    """Rows in the whole log, numbered in the order read_log() returns them"""
+    count = sum(entry["rows"] for entry in load_manifest(segment_dir(log_path))["segments"])
+    if os.path.exists(log_path):
+        with open_text(log_path) as f:
+            count += max(0, sum(1 for _ in csv.reader(f)) - 1)
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Segments of a rotated CSV trial log")
+    parser.add_argument("log")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="print the manifest")
+    commands.add_parser("rotate", help="close the active file as a segment now")
+    commands.add_parser("cat", help="print the whole log across segments")
+    args = parser.parse_args(argv)
+
+    if args.command == "rotate":
+        entry = rotate(args.log, background=False)
+        print(f"rotated {entry['rows']} rows into {entry['name']}" if entry else "nothing to rotate",
+              file=sys.stderr)
+    elif args.command == "list":
+        writer = csv.writer(sys.stdout)
+        writer.writerow(["segment", "first", "last", "rows", "sessions", "bytes", "compressed_bytes"])
+        for entry in load_manifest(segment_dir(args.log))["segments"]:
+            writer.writerow([entry["name"], entry["first"], entry["last"], entry["rows"],
+                             len(entry["sessions"]), entry["bytes"], entry["compressed_bytes"]])
+    else:
+        header, rows = read_log(args.log)
+        writer = csv.writer(sys.stdout)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    main()
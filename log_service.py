@@ -0,0 +1,361 @@
+import argparse
+import glob
+import json
+import os
+import secrets
+import signal
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+from trial_logger import TrialLogger, local_sink
+
+# Single writer for the trial logs when several game processes run on one
+# machine. The service owns every log file it is sent rows for and writes them
+# through the usual sink stack (journal, index, rotation, SQLite), one
+# TrialLogger per log, so rows from different games never interleave mid-line
+# and only one process ever checks or writes a header:
+#   python log_service.py serve
+#   ADHD_LOG_SERVICE=1 python game2.py
+# ADHD_LOG_SERVICE is "1" for the default address or an explicit socket path
+# (pipe name on Windows). Games that can't reach the service write locally.
+# Connections are authenticated with a key kept in a file only the user can
+# read (AUTHKEY_FILE), since the service unpickles what clients send. Rows a
+# client still holds when it closes are spooled to <log>.spool-* files for
+# the log's next writer to replay, so the service stays the only writer.
+
+SERVICE_ENV = "ADHD_LOG_SERVICE"
+MAX_PENDING_ROWS = 10_000  # per log; above this clients are told to back off
+REPLY_TIMEOUT_S = 1.0
+BACKOFF_START_S = 0.1
+BACKOFF_MAX_S = 5.0
+AUTHKEY_FILE = os.path.join(os.path.expanduser("~"), ".adhd_log_service_key")
+SPOOL_SUFFIX = ".spool-"
+
+
+def default_address():
+    if sys.platform == "win32":
+        return r"\\.\pipe\adhd_log_service"
+    return os.path.join(tempfile.gettempdir(), f"adhd_log_service_{os.getuid()}.sock")
+
+
+def service_address():
+    """Address from ADHD_LOG_SERVICE, or None when the service isn't wanted"""
+    value = os.environ.get(SERVICE_ENV, "")
+    if value in ("", "0"):
+        return None
+    return default_address() if value == "1" else value
+
+
+def load_authkey(create=False):
+    """The shared connection key, made (readable by this user only) if `create` and missing"""
+    if create and not os.path.exists(AUTHKEY_FILE):
+        try:
+            fd = os.open(AUTHKEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass
+        else:
+            with os.fdopen(fd, 'w') as f:
+                f.write(secrets.token_hex(32))
+    with open(AUTHKEY_FILE) as f:
+        return f.read().strip().encode()
+
+
+def spool_rows(filename, records):
+    """Save records ({"rows": [...]} or {"complete": session}) for the log's next writer"""
+    path = f"{filename}{SPOOL_SUFFIX}{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    with open(path + ".tmp", 'w') as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)  # replayers never see a half-written spool
+    return path
+
+
+def claim_spools(filename):
+    """Yield (path, records) of each spool for `filename`, claimed so no other writer replays it.
+
+    The caller removes `path` once the records are written.
+    """
+    for path in sorted(glob.glob(glob.escape(filename) + SPOOL_SUFFIX + "*")):
+        if path.endswith((".tmp", ".replaying")):
+            continue
+        try:
+            os.rename(path, path + ".replaying")  # atomic: only one writer gets each spool
+        except FileNotFoundError:
+            continue
+        with open(path + ".replaying") as f:
+            yield path + ".replaying", [json.loads(line) for line in f if line.strip()]
+
+
+class SpoolReplaySink:
+    """Wraps a local sink so it first writes whatever clients spooled for the log"""
+    def __init__(self, sink, filename):
+        self.sink = sink
+        self.filename = filename
+
+    def open(self):
+        self.sink.open()
+        for path, records in claim_spools(self.filename):
+            for record in records:
+                if "rows" in record:
+                    self.sink.write_rows(record["rows"])
+                elif hasattr(self.sink, "complete_session"):
+                    self.sink.complete_session(record["complete"])
+            os.remove(path)
+
+    def write_rows(self, rows):
+        self.sink.write_rows(rows)
+
+    def complete_session(self, session=None):
+        if hasattr(self.sink, "complete_session"):
+            self.sink.complete_session(session)
+
+    def close(self):
+        self.sink.close()
+
+
+class LogService:
+    """Accepts connections and feeds each log's rows to its own TrialLogger.
+
+    Each client connection is served by one thread that handles its
+    messages in order, so a session's rows reach the log in the order its
+    game sent them. Replies tell the client whether the batch was taken.
+    Every message carries its client's id and a sequence number, and one
+    the service has already applied (resent after a lost reply) is
+    acknowledged without being applied again.
+    """
+    def __init__(self, address=None):
+        self.address = address or default_address()
+        self.loggers = {}  # absolute log path -> (TrialLogger, header, lock held while applying a message)
+        self._lock = threading.Lock()
+        self._applied = {}  # client id -> last sequence number applied
+        self._listener = None
+
+    def _logger(self, message):
+        path = os.path.abspath(message["log"])
+        with self._lock:
+            if path not in self.loggers:
+                sink = local_sink(path, message["header"], message["game"])
+                self.loggers[path] = (TrialLogger(sink), list(message["header"]), threading.Lock())
+            logger, header, lock = self.loggers[path]
+        if list(message["header"]) != header:
+            raise ValueError(f"{path} is open with a different header")
+        return logger, lock
+
+    def handle(self, message):
+        """Apply one client message; returns the reply"""
+        logger, lock = self._logger(message)
+        op = message["op"]
+        client, seq = message.get("client"), message.get("seq")
+        if op not in ("rows", "complete", "flush", "open"):
+            raise ValueError(f"unknown op {op!r}")
+        # A resend can arrive on a new connection while the first copy is
+        # still being applied, so checking and applying share the log's lock.
+        # Only queueing happens under it; flushes and spool replays (which
+        # wait for the writer thread) run after, without holding up the log.
+        with lock:
+            if seq is not None and seq <= self._applied.get(client, 0):
+                return {"ok": True}  # a resend of something already applied
+            if op == "rows":
+                if logger.pending() > MAX_PENDING_ROWS:
+                    return {"ok": False, "busy": True}
+                for row in message["rows"]:
+                    logger.log(row)
+            elif op == "complete":
+                logger.complete_session(message.get("session"))
+            if seq is not None:
+                self._applied[client] = seq
+        if op == "flush":
+            logger.flush()
+        elif op == "open":
+            self._replay_spool(os.path.abspath(message["log"]), logger)
+        return {"ok": True}
+
+    def _replay_spool(self, path, logger):
+        """Log rows clients spooled for `path` while they couldn't reach the service"""
+        for spool, records in claim_spools(path):
+            for record in records:
+                if "rows" in record:
+                    for row in record["rows"]:
+                        logger.log(row)
+                else:
+                    logger.complete_session(record["complete"])
+            logger.flush()
+            os.remove(spool)
+
+    def _serve_client(self, conn):
+        with conn:
+            while True:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    reply = self.handle(message)
+                except (KeyError, TypeError, ValueError, OSError) as e:
+                    reply = {"ok": False, "error": str(e)}
+                try:
+                    conn.send(reply)
+                except OSError:
+                    return
+
+    def serve_forever(self):
+        if sys.platform != "win32" and os.path.exists(self.address):
+            os.remove(self.address)  # left behind by a service that didn't shut down cleanly
+        self._listener = Listener(self.address, authkey=load_authkey(create=True))
+        try:
+            while True:
+                try:
+                    conn = self._listener.accept()
+                except AuthenticationError:
+                    continue  # a client without the key
+                threading.Thread(target=self._serve_client, args=(conn,), name="log-client", daemon=True).start()
+        finally:
+            self.close()
+
+    def close(self):
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+        with self._lock:
+            for logger, _, _ in self.loggers.values():
+                logger.close()
+            self.loggers.clear()
+
+
+class ServiceSink:
+    """Client sink that sends batches to the log service instead of the file.
+
+    Batches the service can't take (busy, unreachable) wait in an outbox
+    and go again later, each under the sequence number it was first sent
+    with, so a resend after a lost reply is never applied twice. Between
+    failures the sink backs off exponentially and only queues, so
+    TrialLogger's writer thread never stalls on a missing service.
+    Whatever is still unsent on close() is spooled for the log's next
+    writer instead of being written here.
+    """
+    def __init__(self, address, filename, header, game):
+        self.address = address
+        self.filename = os.path.abspath(filename)
+        self.header = list(header)
+        self.game = game
+        self.last_error = None
+        self.client = uuid.uuid4().hex
+        self._seq = 0
+        self._conn = None
+        self._outbox = []  # [message, sent]: rows and completion markers, in order
+        self._backoff = BACKOFF_START_S
+        self._retry_at = 0.0
+
+    def _message(self, op, **fields):
+        self._seq += 1
+        return dict(fields, op=op, log=self.filename, header=self.header, game=self.game,
+                    client=self.client, seq=self._seq)
+
+    def _request(self, message):
+        if self._conn is None:
+            self._conn = Client(self.address, authkey=load_authkey())
+        self._conn.send(message)
+        if not self._conn.poll(REPLY_TIMEOUT_S):
+            raise OSError("log service did not reply")
+        reply = self._conn.recv()
+        if not reply.get("ok"):
+            raise OSError(reply.get("error") or "log service is busy")
+
+    def _send(self, message):
+        """True if the service took the message; on failure back off and return False"""
+        if time.monotonic() < self._retry_at:
+            return False
+        try:
+            self._request(message)
+        except (OSError, EOFError, AuthenticationError) as e:
+            self.last_error = e
+            self._disconnect()
+            self._retry_at = time.monotonic() + self._backoff
+            self._backoff = min(self._backoff * 2, BACKOFF_MAX_S)
+            return False
+        self._backoff = BACKOFF_START_S
+        return True
+
+    def _disconnect(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except OSError:
+                pass
+            self._conn = None
+
+    def open(self):
+        pass  # connect_sink() has already opened the log with the service
+
+    def _drain(self):
+        while self._outbox:
+            entry = self._outbox[0]
+            entry[1] = True  # from now on its rows are fixed: a resend must match what may have arrived
+            if not self._send(entry[0]):
+                return
+            self._outbox.pop(0)
+
+    def write_rows(self, rows):
+        last = self._outbox[-1] if self._outbox else None
+        if last is not None and not last[1] and last[0]["op"] == "rows":
+            last[0]["rows"].extend(rows)
+        else:
+            self._outbox.append([self._message("rows", rows=list(rows)), False])
+        self._drain()
+
+    def complete_session(self, session=None):
+        self._outbox.append([self._message("complete", session=session), False])
+        self._drain()
+
+    def close(self):
+        self._retry_at = 0.0
+        self._drain()
+        if self._outbox:
+            records = [{"rows": message["rows"]} if message["op"] == "rows"
+                       else {"complete": message["session"]} for message, _ in self._outbox]
+            path = spool_rows(self.filename, records)
+            print(f"log service unavailable; {path} holds rows for the next writer of {self.filename}",
+                  file=sys.stderr)
+            self._outbox = []
+        self._disconnect()
+
+
+def connect_sink(filename, header, game):
+    """ServiceSink for the log if ADHD_LOG_SERVICE is set and the service answers, else None"""
+    address = service_address()
+    if address is None:
+        return None
+    sink = ServiceSink(address, filename, header, game)
+    try:
+        sink._request(sink._message("open"))
+    except (OSError, EOFError, AuthenticationError) as e:
+        print(f"log service at {address} unavailable ({e}); writing {filename} directly", file=sys.stderr)
+        return None
+    return sink
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Single-writer logging service for the games")
+    parser.add_argument("command", choices=["serve"])
+    parser.add_argument("--address", default=None, help="socket path (default: per-user temp file)")
+    args = parser.parse_args(argv)
+
+    service = LogService(args.address)
+    # serve_forever() closes every log on the way out, so stop through it
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"logging service on {service.address}", file=sys.stderr)
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,400 @@
+import random
+import time
+from datetime import datetime
+from hires_timing import elapsed_ms
+from trace_events import NULL_TRACER
+from streaming_stats import RTStats
+from nback_sequence import generate_sequence
+from trial_store import TrialStore
+
+# N-Back game logic shared by the pygame front end (game2.py) and the headless
+# simulator (nback_sim.py). Nothing in here opens a window or reads the wall
+# clock directly; time comes from GameState.clock.
+
+# Modern Color Palette
+BLACK = (15, 15, 23)
+WHITE = (255, 255, 255)
+GRAY = (100, 116, 139)
+LIGHT_GRAY = (148, 163, 184)
+DARK_GRAY = (30, 41, 59)
+GREEN = (34, 197, 94)
+RED = (239, 68, 68)
+BLUE = (59, 130, 246)
+YELLOW = (251, 191, 36)
+PURPLE = (147, 51, 234)
+ACCENT = (16, 185, 129)
+SURFACE = (30, 41, 59)
+BORDER = (71, 85, 105)
+
+# Game Configuration
+GRID_SIZE = 3
+LETTERS = [chr(i) for i in range(65, 75)]  # A-J
+stimulus_duration = 2000  # 2 seconds
+inter_stimulus_interval = 500  # 0.5 second break
+reaction_window = 1500
+trial_count = 30
+n_back = 1
+
+# RT classification thresholds used by calculate_adhd_metrics
+PREMATURE_RT_MS = 200  # faster than this counts as impulsive
+LATE_RT_MS = 1800  # slower than this counts as a late response
+
+# RTVariability is the SD of the last RT_VARIABILITY_WINDOW RTs, once there are RT_VARIABILITY_MIN_RTS
+RT_VARIABILITY_WINDOW = 5
+RT_VARIABILITY_MIN_RTS = 3
+RT_QUANTILES = (0.5, 0.9)
+
+# ImpulsivityScore points for a premature response and for a false alarm
+IMPULSIVITY_PREMATURE_WEIGHT = 2
+IMPULSIVITY_FALSE_ALARM_WEIGHT = 1
+
+# CSV Logging - Single file that keeps appending
+NBACK_LOG_FILE = "nback_sessions.csv"
+NBACK_LOG_HEADER = [
+    "Session", "Trial", "Letter", "Position", "IsMatch", "UserPressed",
+    "Correct", "RT", "Score", "Timestamp", "ResponseType", "Difficulty",
+    "TrialType", "PrevTrialCorrect", "ConsecutiveErrors", "RTVariability",
+    "PrematureResponse", "LateResponse", "AttentionLapse", "ImpulsivityScore",
+    "WorkingMemoryLoad", "DistractorPresent", "StimulusDuration", "InterTrialInterval",
+    "OnsetNs", "ResponseNs", "OffsetNs", "ExposureMs"
+]
+
+
+def monotonic_ms():
+    """Default game clock: milliseconds from a monotonic source"""
+    return time.monotonic_ns() // 1_000_000
+
+
+# Game State
+class GameState:
+    def __init__(self, clock=None, rng=None, session_id=None, n_back=n_back,
+                 trial_count=trial_count, stimulus_duration=stimulus_duration,
+                 inter_stimulus_interval=inter_stimulus_interval,
+                 premature_threshold=PREMATURE_RT_MS, late_threshold=LATE_RT_MS):
+        self.stimuli = TrialStore()
+        self.score = 0
+        self.hits = 0
+        self.misses = 0
+        self.false_alarms = 0
+        self.correct_rejections = 0
+        self.trial = 0
+        self.current_stimulus = None
+        self.feedback_text = ""
+        self.feedback_color = WHITE
+        self.feedback_time = 0
+        self.game_phase = "instructions"  # instructions, practice, playing, break, finished
+        self.phase_start_time = 0
+        self.practice_trials = []
+        self.practice_index = 0
+
+        # Session configuration
+        self.n_back = n_back
+        self.trial_count = trial_count
+        self.stimulus_duration = stimulus_duration
+        self.inter_stimulus_interval = inter_stimulus_interval
+        self.premature_threshold = premature_threshold
+        self.late_threshold = late_threshold
+
+        # Time source (milliseconds) and random source, swappable for simulation
+        self.clock = clock or monotonic_ms
+        self.rng = rng or random.Random()
+
+        # Whole-session trial sequence, solved on the first trial; taken from this
+        # nback_sequence.SequenceCache when set, else seeded from `rng`
+        self.sequence = None
+        self.sequence_cache = None
+
+        # Trial rows are handed to this logger (anything with a log(row) method)
+        self.filename = NBACK_LOG_FILE
+        self.logger = None
+        # Spans for trial generation and metrics go to this TraceRecorder
+        self.tracer = NULL_TRACER
+        # Decides when the stimulus comes off screen (a hires_timing.PresentationScheduler);
+        # None ends it once stimulus_duration has passed on `clock`
+        self.presentation = None
+        # Hold each trial's row until record_offset() knows when the stimulus went off screen
+        self.log_at_offset = False
+
+        # Generate session ID
+        self.session_id = session_id or datetime.now().strftime('%Y%m%d_%H%M%S')
+
+        # Additional ADHD research metrics
+        self.rt_stats = RTStats(RT_VARIABILITY_WINDOW, RT_QUANTILES)  # updated per trial, constant memory
+        self.consecutive_errors = 0
+        self.attention_lapses = 0
+        self.premature_responses = 0
+        self.late_responses = 0
+        self.pre_onset_presses = 0  # SPACE presses ignored because the stimulus wasn't shown yet
+
+class Stimulus:
+    def __init__(self, letter, position, is_match, trial_num, shown_time=0):
+        self.letter = letter
+        self.position = position
+        self.is_match = is_match
+        self.trial_num = trial_num
+        self.shown_time = shown_time
+        self.onset_ns = None  # perf_counter_ns of the flip that first showed the stimulus
+        self.offset_ns = None  # perf_counter_ns of the flip that removed it
+        self.planned_offset_ns = None  # when the presentation scheduler means to remove it
+        self.response_ns = None  # perf_counter_ns of the SPACE keypress
+        self.pending_row = None  # log row waiting for offset_ns
+        self.responded = False
+        self.reaction_time = None
+        self.correct = None
+        self.user_pressed = False
+        self.explanation = ""  # For practice mode
+
+def session_sequence(game_state):
+    """The session's trial sequence: from the cache if there is one, else solved from game_state.rng"""
+    options = {"n_letters": len(LETTERS), "n_positions": GRID_SIZE * GRID_SIZE}
+    if game_state.sequence_cache is not None:
+        return game_state.sequence_cache.take(game_state.trial_count, game_state.n_back, **options)
+    return generate_sequence(game_state.trial_count, game_state.n_back,
+                             seed=game_state.rng.getrandbits(64), **options)
+
+def generate_trial(game_state):
+    """Generate the next trial stimulus"""
+    if game_state.sequence is None:
+        game_state.sequence = session_sequence(game_state)
+    letter, position, is_match = game_state.sequence.trial(game_state.trial)
+    return Stimulus(LETTERS[letter], divmod(position, GRID_SIZE), is_match, game_state.trial, game_state.clock())
+
+def calculate_adhd_metrics(game_state, stimulus):
+    """Calculate ADHD-specific behavioral metrics"""
+
+    # Response classification
+    if stimulus.user_pressed and stimulus.is_match:
+        response_type = "Hit"
+    elif stimulus.user_pressed and not stimulus.is_match:
+        response_type = "FalseAlarm"
+    elif not stimulus.user_pressed and stimulus.is_match:
+        response_type = "Miss"
+    else:
+        response_type = "CorrectRejection"
+
+    # RT-based classifications
+    premature = False
+    late_response = False
+    attention_lapse = False
+
+    if stimulus.reaction_time:
+        if stimulus.reaction_time < game_state.premature_threshold:  # Too fast - impulsive
+            premature = True
+            game_state.premature_responses += 1
+        elif stimulus.reaction_time > game_state.late_threshold:  # Very slow
+            late_response = True
+            game_state.late_responses += 1
+
+        game_state.rt_stats.add(stimulus.reaction_time)
+
+    # Attention lapse detection (no response to target)
+    if stimulus.is_match and not stimulus.user_pressed:
+        attention_lapse = True
+        game_state.attention_lapses += 1
+
+    # Consecutive errors tracking
+    if not stimulus.correct:
+        game_state.consecutive_errors += 1
+    else:
+        game_state.consecutive_errors = 0
+
+    # RT Variability (using last 5 trials)
+    rt_variability = 0
+    if game_state.rt_stats.recent.count >= RT_VARIABILITY_MIN_RTS:
+        rt_variability = game_state.rt_stats.recent.stdev()
+
+    # Working memory load (distance from target)
+    wm_load = min(game_state.trial + 1, game_state.n_back)
+
+    # Trial difficulty (based on similarity to n-back stimulus)
+    difficulty = "Easy"
+    if game_state.trial >= game_state.n_back:
+        past_stimulus = game_state.stimuli[game_state.trial - game_state.n_back]
+        if stimulus.letter == past_stimulus.letter and stimulus.position != past_stimulus.position:
+            difficulty = "Hard"  # Same letter, different position
+        elif stimulus.letter != past_stimulus.letter and stimulus.position == past_stimulus.position:
+            difficulty = "Medium"  # Different letter, same position
+
+    # Impulsivity score (based on premature responses and false alarms)
+    impulsivity_score = 0
+    if premature:
+        impulsivity_score += IMPULSIVITY_PREMATURE_WEIGHT
+    if response_type == "FalseAlarm":
+        impulsivity_score += IMPULSIVITY_FALSE_ALARM_WEIGHT
+
+    # Previous trial correctness
+    prev_correct = True
+    if len(game_state.stimuli) > 1:
+        prev_correct = game_state.stimuli[-2].correct
+
+    return {
+        'response_type': response_type,
+        'difficulty': difficulty,
+        'trial_type': "Target" if stimulus.is_match else "NonTarget",
+        'prev_correct': prev_correct,
+        'consecutive_errors': game_state.consecutive_errors,
+        'rt_variability': round(rt_variability, 2),
+        'premature': premature,
+        'late_response': late_response,
+        'attention_lapse': attention_lapse,
+        'impulsivity_score': impulsivity_score,
+        'wm_load': wm_load,
+        'distractor_present': False,  # Can be expanded later
+        'stimulus_duration': game_state.stimulus_duration,
+        'inter_trial_interval': game_state.inter_stimulus_interval
+    }
+
+def build_trial_row(game_state, stimulus, metrics):
+    """Build one nback_sessions.csv row for a finished trial"""
+    return [
+        game_state.session_id,
+        game_state.trial + 1,
+        stimulus.letter,
+        f"({stimulus.position[0]},{stimulus.position[1]})",
+        "Yes" if stimulus.is_match else "No",
+        "Yes" if stimulus.user_pressed else "No",
+        "Yes" if stimulus.correct else "No",
+        stimulus.reaction_time if stimulus.reaction_time else "",
+        game_state.score,
+        datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        metrics['response_type'],
+        metrics['difficulty'],
+        metrics['trial_type'],
+        "Yes" if metrics['prev_correct'] else "No",
+        metrics['consecutive_errors'],
+        metrics['rt_variability'],
+        "Yes" if metrics['premature'] else "No",
+        "Yes" if metrics['late_response'] else "No",
+        "Yes" if metrics['attention_lapse'] else "No",
+        metrics['impulsivity_score'],
+        metrics['wm_load'],
+        "Yes" if metrics['distractor_present'] else "No",
+        metrics['stimulus_duration'],
+        metrics['inter_trial_interval'],
+        stimulus.onset_ns if stimulus.onset_ns is not None else "",
+        stimulus.response_ns if stimulus.response_ns is not None else "",
+        *_offset_fields(stimulus)
+    ]
+
+def _offset_fields(stimulus):
+    """OffsetNs and ExposureMs columns"""
+    if stimulus.offset_ns is None:
+        return ["", ""]
+    exposure = elapsed_ms(stimulus.onset_ns, stimulus.offset_ns)
+    return [stimulus.offset_ns, exposure if exposure is not None else ""]
+
+def record_offset(game_state, stimulus, offset_ns):
+    """Note when the stimulus left the screen and log its row if it was held for that.
+
+    offset_ns=None logs a held row with the offset columns empty (the game
+    ended with the stimulus still up).
+    """
+    stimulus.offset_ns = offset_ns
+    row = stimulus.pending_row
+    if row is None:
+        return
+    stimulus.pending_row = None
+    row[-2:] = _offset_fields(stimulus)
+    if game_state.logger:
+        game_state.logger.log(row)
+
+def handle_response(game_state, pressed_space, response_ns=None):
+    """Handle user response and update score"""
+    stimulus = game_state.current_stimulus
+    if pressed_space and response_ns is not None and (stimulus.onset_ns is None or response_ns < stimulus.onset_ns):
+        # Stamped before the stimulus's onset flip (e.g. while the frame waited
+        # for it): not a response to this stimulus, and its RT would be negative
+        game_state.pre_onset_presses += 1
+        return
+    stimulus.user_pressed = pressed_space
+    stimulus.responded = True
+
+    if pressed_space:
+        stimulus.response_ns = response_ns
+        if stimulus.onset_ns is not None and response_ns is not None:
+            stimulus.reaction_time = elapsed_ms(stimulus.onset_ns, response_ns)
+        else:
+            stimulus.reaction_time = game_state.clock() - stimulus.shown_time
+
+    # Determine correctness
+    if stimulus.is_match and pressed_space:
+        # Hit
+        stimulus.correct = True
+        game_state.hits += 1
+        game_state.score += 10
+        game_state.feedback_text = "HIT! +10"
+        game_state.feedback_color = GREEN
+    elif stimulus.is_match and not pressed_space:
+        # Miss
+        stimulus.correct = False
+        game_state.misses += 1
+        game_state.score -= 5
+        game_state.feedback_text = "MISS! -5"
+        game_state.feedback_color = RED
+    elif not stimulus.is_match and pressed_space:
+        # False Alarm
+        stimulus.correct = False
+        game_state.false_alarms += 1
+        game_state.score -= 5
+        game_state.feedback_text = "FALSE ALARM! -5"
+        game_state.feedback_color = RED
+    else:
+        # Correct Rejection
+        stimulus.correct = True
+        game_state.correct_rejections += 1
+        game_state.feedback_text = "CORRECT!"
+        game_state.feedback_color = GREEN
+
+    game_state.feedback_time = game_state.clock()
+
+    # Calculate ADHD metrics
+    with game_state.tracer.span("calculate_adhd_metrics", "trial", trial=stimulus.trial_num):
+        metrics = calculate_adhd_metrics(game_state, stimulus)
+
+    # Log to CSV - append to single file
+    row = build_trial_row(game_state, stimulus, metrics)
+    if game_state.log_at_offset and stimulus.offset_ns is None:
+        stimulus.pending_row = row
+    elif game_state.logger:
+        game_state.logger.log(row)
+
+def update_trial_phase(game_state, current_time):
+    """Advance the playing/break phase machine by one step.
+
+    Returns what happened: "finished", "started" (a new stimulus was generated),
+    "ended" (stimulus time ran out, break begins), "advanced" (break over, next
+    trial pending) or None when the current phase simply continues.
+    """
+    if game_state.game_phase == "playing":
+        if game_state.trial >= game_state.trial_count:
+            game_state.game_phase = "finished"
+            return "finished"
+
+        elif game_state.current_stimulus is None:
+            # Start new trial
+            with game_state.tracer.span("generate_trial", "trial", trial=game_state.trial):
+                game_state.current_stimulus = generate_trial(game_state)
+            game_state.stimuli.append(game_state.current_stimulus)
+            game_state.phase_start_time = current_time
+            return "started"
+
+        elif (game_state.presentation.offset_due(game_state.current_stimulus) if game_state.presentation
+              else current_time - game_state.phase_start_time >= game_state.stimulus_duration):
+            # Time up for current stimulus
+            if not game_state.current_stimulus.responded:
+                handle_response(game_state, False)
+
+            # Move to break phase
+            game_state.game_phase = "break"
+            game_state.phase_start_time = current_time
+            return "ended"
+
+    elif game_state.game_phase == "break":
+        if current_time - game_state.phase_start_time >= game_state.inter_stimulus_interval:
+            # Break over, prepare next trial
+            game_state.trial += 1
+            game_state.current_stimulus = None
+            game_state.game_phase = "playing"
+            return "advanced"
+
+    return None
@@ -0,0 +1,268 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# Whole-session N-Back sequences built up front. Every trial from n_back on is
+# one of four kinds relative to the stimulus n back: a target (same letter and
+# position), a letter lure (same letter, other position - "Hard"), a position
+# lure (other letter, same position - "Medium") or a plain non-target. The
+# session gets exact counts of each kind, and no run of targets or of
+# non-targets longer than max_run (the first n_back trials, which can't be
+# targets, don't count). Kind orders are drawn as a batch of random
+# permutations and screened for long runs in one numpy pass; long sessions
+# and strict limits, where few permutations pass, build the orders trial by
+# trial under the run limit instead. Letters and positions are then filled
+# in trial by trial across the whole batch, which satisfies the kinds by
+# construction. Valid sequences are kept in a cache
+# file so a session starts without waiting for the solver:
+#   python nback_sequence.py --n-back 2 --trials 30
+
+NON_TARGET, TARGET, LETTER_LURE, POSITION_LURE = range(4)
+
+TARGET_RATE = 0.4  # of the trials that have an n-back stimulus
+LURE_RATE = 0.1  # each of letter and position lures, likewise
+MAX_RUN = 4  # longest run of targets or of non-targets from trial n_back on
+BATCH = 512  # most candidate orders screened per numpy pass
+SCREEN_BATCHES = 4  # passes before building the missing orders trial by trial
+CACHE_FILE = "nback_sequences.npz"
+CACHE_FILL = 64  # sequences solved per cache refill
+
+
+def constraints(trial_count, n_back, target_rate=TARGET_RATE, lure_rate=LURE_RATE, max_run=MAX_RUN,
+                n_letters=10, n_positions=9):
+    """Exact per-kind counts for a session: a tuple usable as a cache key"""
+    slots = max(0, trial_count - n_back)
+    targets = round(slots * target_rate)
+    letter_lures = position_lures = min(round(slots * lure_rate), (slots - targets) // 2)
+    return (trial_count, n_back, targets, letter_lures, position_lures, max_run, n_letters, n_positions)
+
+
+def _check_feasible(key):
+    trial_count, n_back, targets, letter_lures, position_lures, max_run, n_letters, n_positions = key
+    slots = max(0, trial_count - n_back)
+    non_targets = slots - targets
+    if targets + letter_lures + position_lures > slots:
+        raise ValueError(f"{trial_count} trials can't hold {targets} targets and "
+                         f"{letter_lures + position_lures} lures at {n_back}-back")
+    if max_run < 1 or non_targets > (targets + 1) * max_run or targets > (non_targets + 1) * max_run:
+        raise ValueError(f"{targets} targets in {slots} trials can't keep runs to {max_run}")
+    if n_letters < 2 or n_positions < 2:
+        raise ValueError("lures need at least two letters and two positions")
+
+
+def _screen_runs(is_target, max_run):
+    """Boolean mask of candidate rows with no run of equal values longer than max_run"""
+    window = max_run + 1
+    if is_target.shape[1] < window:
+        return np.ones(len(is_target), dtype=bool)
+    counts = np.cumsum(is_target, axis=1, dtype=np.int32)
+    counts = np.concatenate([np.zeros((len(counts), 1), dtype=np.int32), counts], axis=1)
+    in_window = counts[:, window:] - counts[:, :-window]
+    return ~((in_window == 0) | (in_window == window)).any(axis=1)
+
+
+def _completable(targets, non_targets, last, run, max_run):
+    """Whether the remaining trials can still be placed within max_run, given the current run"""
+    same_left = np.where(last == 1, targets, non_targets)
+    other_left = np.where(last == 1, non_targets, targets)
+    return (same_left <= max_run - run + other_left * max_run) & (other_left <= max_run * (same_left + 1))
+
+
+def _sample_patterns(targets, non_targets, max_run, rng, count):
+    """`count` random target orders within the run limit, built trial by trial.
+
+    Each trial is a target with probability targets left / trials left,
+    unless that choice would leave the rest impossible to place, so a
+    feasible key never dead-ends. Runs over all rows at once.
+    """
+    slots = targets + non_targets
+    t = np.full(count, targets)
+    u = np.full(count, non_targets)
+    last = np.full(count, -1)
+    run = np.zeros(count, dtype=np.int64)
+    patterns = np.empty((count, slots), dtype=bool)
+    for i in range(slots):
+        run_if_target = np.where(last == 1, run + 1, 1)
+        run_if_not = np.where(last == 0, run + 1, 1)
+        can_target = (t > 0) & (run_if_target <= max_run) & _completable(t - 1, u, 1, run_if_target, max_run)
+        can_not = (u > 0) & (run_if_not <= max_run) & _completable(t, u - 1, 0, run_if_not, max_run)
+        pick = np.where(can_target & can_not, rng.random(count) * (t + u) < t, can_target)
+        run = np.where(pick, run_if_target, run_if_not)
+        last = pick.astype(np.int64)
+        t -= pick
+        u -= ~pick
+        patterns[:, i] = pick
+    return patterns
+
+
+def _solve_kinds(key, rng, wanted):
+    """`wanted` kind sequences (rows) meeting the counts and the run limit.
+
+    Random permutations screened in batches find sequences quickly under
+    loose limits; whatever they don't find (long sessions, strict limits)
+    is built trial by trial, which never fails on a feasible key.
+    """
+    trial_count, n_back, targets, letter_lures, position_lures, max_run = key[:6]
+    slots = max(0, trial_count - n_back)
+    pool = np.repeat(np.array([TARGET, LETTER_LURE, POSITION_LURE, NON_TARGET], dtype=np.int8),
+                     [targets, letter_lures, position_lures, slots - targets - letter_lures - position_lures])
+    found = []
+    batch = min(BATCH, 16 * wanted)
+    for _ in range(SCREEN_BATCHES):
+        order = np.argsort(rng.random((batch, slots)), axis=1)
+        kinds = pool[order]
+        found.append(kinds[_screen_runs(kinds == TARGET, max_run)])
+        if sum(len(rows) for rows in found) >= wanted:
+            break
+    kinds = np.concatenate(found)[:wanted]
+
+    missing = wanted - len(kinds)
+    if missing:
+        is_target = _sample_patterns(targets, slots - targets, max_run, rng, missing)
+        built = np.full((missing, slots), TARGET, dtype=np.int8)
+        lures = pool[targets:]
+        for row, mask in zip(built, ~is_target):
+            row[mask] = rng.permutation(lures)
+        kinds = np.concatenate([kinds, built])
+    head = np.full((wanted, trial_count - slots), NON_TARGET, dtype=np.int8)
+    return np.concatenate([head, kinds], axis=1)
+
+
+def _fill(kinds, key, rng):
+    """Letters and positions for each kind row; (count, 3, trials) int8 of kind/letter/position"""
+    count, trial_count = kinds.shape
+    n_back, n_letters, n_positions = key[1], key[6], key[7]
+    letters = np.empty((count, trial_count), dtype=np.int8)
+    positions = np.empty((count, trial_count), dtype=np.int8)
+    letters[:, :n_back] = rng.integers(0, n_letters, (count, min(n_back, trial_count)))
+    positions[:, :n_back] = rng.integers(0, n_positions, (count, min(n_back, trial_count)))
+    for i in range(n_back, trial_count):
+        kind = kinds[:, i]
+        same_letter = (kind == TARGET) | (kind == LETTER_LURE)
+        same_position = (kind == TARGET) | (kind == POSITION_LURE)
+        # Shifting by 1..n-1 draws uniformly from every value but the n-back one
+        other_letter = (letters[:, i - n_back] + rng.integers(1, n_letters, count)) % n_letters
+        other_position = (positions[:, i - n_back] + rng.integers(1, n_positions, count)) % n_positions
+        letters[:, i] = np.where(same_letter, letters[:, i - n_back], other_letter)
+        positions[:, i] = np.where(same_position, positions[:, i - n_back], other_position)
+    return np.stack([kinds, letters, positions], axis=1)
+
+
+def solve(key, rng, count=1):
+    """`count` random sequences meeting the constraints `key`, as (count, 3, trials) int8"""
+    _check_feasible(key)
+    return _fill(_solve_kinds(key, rng, count), key, rng)
+
+
+class TrialSequence:
+    """One session's trials: kind, letter index and position index per trial"""
+    def __init__(self, array):
+        self.kinds, self.letters, self.positions = (column.tolist() for column in array)
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def trial(self, index):
+        """(letter index, position index, is_match) of trial `index`"""
+        return self.letters[index], self.positions[index], self.kinds[index] == TARGET
+
+
+def generate_sequence(trial_count, n_back, seed=None, **options):
+    """A fresh TrialSequence; the same seed and options always give the same one"""
+    key = constraints(trial_count, n_back, **options)
+    return TrialSequence(solve(key, np.random.default_rng(seed))[0])
+
+
+class SequenceCache:
+    """Pre-solved sequences per constraint set, kept in an .npz file.
+
+    take() hands each cached sequence out once and solves a fresh batch of
+    CACHE_FILL when the pool for those constraints runs out, so only the
+    first session with new settings waits for the solver. The .npz is only
+    rewritten on a refill; how far into each pool take() has got is kept in
+    a small JSON file beside it (<path>.pos), so a sequence isn't handed out
+    again after a restart.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self._pools = {}
+        self._taken = {}  # pool name -> sequences handed out from its start
+        if path and os.path.exists(path):
+            try:
+                with np.load(path) as data:
+                    self._pools = {name: data[name] for name in data.files}
+            except (OSError, ValueError) as e:
+                print(f"ignoring unreadable sequence cache {path}: {e}", file=sys.stderr)
+            try:
+                with open(path + ".pos") as f:
+                    self._taken = json.load(f)
+            except (OSError, ValueError):
+                pass  # no positions yet: the pools are untouched
+
+    @staticmethod
+    def _name(key):
+        return "_".join(str(value) for value in key)
+
+    def take(self, trial_count, n_back, **options):
+        key = constraints(trial_count, n_back, **options)
+        name = self._name(key)
+        pool = self._pools.get(name)
+        taken = self._taken.get(name, 0)
+        if pool is None or taken >= len(pool):
+            pool = self._pools[name] = solve(key, np.random.default_rng(), CACHE_FILL)
+            taken = 0
+            self._save()
+        self._taken[name] = taken + 1
+        self._save_positions()
+        return TrialSequence(pool[taken])
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path + ".tmp", 'wb') as f:
+                np.savez(f, **self._pools)
+            os.replace(self.path + ".tmp", self.path)
+        except OSError as e:
+            print(f"could not save sequence cache {self.path}: {e}", file=sys.stderr)
+
+    def _save_positions(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path + ".pos.tmp", 'w') as f:
+                json.dump(self._taken, f)
+            os.replace(self.path + ".pos.tmp", self.path + ".pos")
+        except OSError as e:
+            print(f"could not save sequence cache positions {self.path}.pos: {e}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solve an N-Back trial sequence")
+    parser.add_argument("--n-back", type=int, default=1)
+    parser.add_argument("--trials", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--target-rate", type=float, default=TARGET_RATE)
+    parser.add_argument("--lure-rate", type=float, default=LURE_RATE)
+    parser.add_argument("--max-run", type=int, default=MAX_RUN)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    try:
+        sequence = generate_sequence(args.trials, args.n_back, args.seed, target_rate=args.target_rate,
+                                     lure_rate=args.lure_rate, max_run=args.max_run)
+    except ValueError as e:
+        parser.error(str(e))
+    elapsed = (time.perf_counter() - start) * 1000
+    names = {NON_TARGET: "-", TARGET: "T", LETTER_LURE: "L", POSITION_LURE: "P"}
+    print("".join(names[kind] for kind in sequence.kinds))
+    print(" ".join(f"{chr(65 + letter)}{position}" for letter, position in zip(sequence.letters, sequence.positions)))
+    print(f"solved in {elapsed:.1f} ms", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
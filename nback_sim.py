@@ -0,0 +1,190 @@
+import random
+from nback_core import GameState, handle_response, record_offset, update_trial_phase
+
+# Headless N-Back engine: runs the nback_core game logic on a virtual clock
+# with synthetic responders instead of a window and a keyboard.
+
+
+class VirtualClock:
+    """Millisecond clock that only moves when the simulation advances it"""
+    def __init__(self, start=0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance_to(self, t):
+        self.now = max(self.now, t)
+
+
+class RowCollector:
+    """Logger stand-in that keeps trial rows in memory"""
+    def __init__(self):
+        self.rows = []
+
+    def log(self, row):
+        self.rows.append(row)
+
+
+# Responders decide, for each stimulus, whether to press SPACE and after how
+# many milliseconds. respond() returns the RT in ms or None for no press.
+
+class GaussianResponder:
+    """Detects targets with `hit_rate`, false-alarms with `false_alarm_rate`, normal RTs"""
+    def __init__(self, rt_mean=550, rt_sd=120, hit_rate=0.85, false_alarm_rate=0.1, min_rt=100):
+        self.rt_mean = rt_mean
+        self.rt_sd = rt_sd
+        self.hit_rate = hit_rate
+        self.false_alarm_rate = false_alarm_rate
+        self.min_rt = min_rt
+
+    def respond(self, stimulus, game_state, rng):
+        p_press = self.hit_rate if stimulus.is_match else self.false_alarm_rate
+        if rng.random() >= p_press:
+            return None
+        return max(self.min_rt, rng.gauss(self.rt_mean, self.rt_sd))
+
+
+class ExGaussianResponder(GaussianResponder):
+    """Like GaussianResponder but with an exponential tail (mean `tau`) on every RT"""
+    def __init__(self, rt_mean=450, rt_sd=60, tau=150, **kwargs):
+        super().__init__(rt_mean, rt_sd, **kwargs)
+        self.tau = tau
+
+    def respond(self, stimulus, game_state, rng):
+        rt = super().respond(stimulus, game_state, rng)
+        if rt is None:
+            return None
+        return rt + rng.expovariate(1 / self.tau)
+
+
+class LapsingResponder:
+    """Wraps another responder and drops out entirely on `lapse_rate` of trials"""
+    def __init__(self, base, lapse_rate=0.1):
+        self.base = base
+        self.lapse_rate = lapse_rate
+
+    def respond(self, stimulus, game_state, rng):
+        if rng.random() < self.lapse_rate:
+            return None
+        return self.base.respond(stimulus, game_state, rng)
+
+
+class ImpulsiveResponder:
+    """Wraps another responder and fires early on `impulsive_rate` of trials regardless of match"""
+    def __init__(self, base, impulsive_rate=0.2, rt_low=80, rt_high=220):
+        self.base = base
+        self.impulsive_rate = impulsive_rate
+        self.rt_low = rt_low
+        self.rt_high = rt_high
+
+    def respond(self, stimulus, game_state, rng):
+        if rng.random() < self.impulsive_rate:
+            return rng.uniform(self.rt_low, self.rt_high)
+        return self.base.respond(stimulus, game_state, rng)
+
+
+RESPONDERS = {
+    "gaussian": lambda: GaussianResponder(),
+    "exgauss": lambda: ExGaussianResponder(),
+    "lapsing": lambda: LapsingResponder(GaussianResponder(), 0.15),
+    "impulsive": lambda: ImpulsiveResponder(GaussianResponder(), 0.2),
+}
+
+
+def run_session(responder, seed=0, frame_ms=None, keep_rows=True, **config):
+    """Play one full N-Back session headlessly and return its results.
+
+    `config` is passed through to GameState (n_back, trial_count,
+    stimulus_duration, inter_stimulus_interval, premature_threshold,
+    late_threshold). With `frame_ms` unset the
+    clock jumps straight from one scheduled event to the next; with it set,
+    every event is delayed to the next frame boundary the way the live game
+    loop would see it.
+    """
+    rng = random.Random(seed)
+    clock = VirtualClock()
+    game_state = GameState(clock=clock, rng=random.Random(rng.getrandbits(64)),
+                           session_id=f"sim_{seed}", **config)
+    collector = RowCollector()
+    if keep_rows:
+        game_state.logger = collector
+    # Rows carry the stimulus offset, so they are logged when it ends
+    game_state.log_at_offset = True
+
+    # Skip instructions, go straight to the real game like pressing ENTER
+    game_state.game_phase = "playing"
+    game_state.phase_start_time = clock.now
+    response_at = None
+
+    while True:
+        now = clock.now
+        stimulus = game_state.current_stimulus
+
+        # Responses are processed before the phase machine, as in the event loop
+        if response_at is not None and now >= response_at:
+            if game_state.game_phase == "playing" and not stimulus.responded:
+                handle_response(game_state, True, int(response_at * 1_000_000))
+            response_at = None
+
+        step = update_trial_phase(game_state, now)
+        if step == "finished":
+            break
+        if step == "advanced":
+            continue
+        if step == "ended":
+            record_offset(game_state, game_state.stimuli[-1], int(now * 1_000_000))
+        if step == "started":
+            stimulus = game_state.current_stimulus
+            stimulus.onset_ns = int(now * 1_000_000)
+            rt = responder.respond(stimulus, game_state, rng)
+            if rt is not None:
+                response_at = now + rt
+
+        # Jump to the next thing that can happen
+        if game_state.game_phase == "playing":
+            next_time = game_state.phase_start_time + game_state.stimulus_duration
+        else:
+            next_time = game_state.phase_start_time + game_state.inter_stimulus_interval
+        if response_at is not None:
+            next_time = min(next_time, response_at)
+        if frame_ms:
+            frames = -(-(next_time - now) // frame_ms)
+            next_time = now + max(1, frames) * frame_ms
+        clock.advance_to(next_time)
+
+    return summarize_session(game_state, seed, collector.rows)
+
+
+def summarize_session(game_state, seed=None, rows=None):
+    """Session-level results in a flat dict"""
+    rt_summary = game_state.rt_stats.summary()
+    total = game_state.hits + game_state.misses + game_state.false_alarms + game_state.correct_rejections
+    return {
+        'session_id': game_state.session_id,
+        'seed': seed,
+        'trials': total,
+        'score': game_state.score,
+        'hits': game_state.hits,
+        'misses': game_state.misses,
+        'false_alarms': game_state.false_alarms,
+        'correct_rejections': game_state.correct_rejections,
+        'accuracy': (game_state.hits + game_state.correct_rejections) / total if total else 0,
+        'rt_mean': rt_summary['rt_mean'],
+        'rt_sd': rt_summary['rt_sd'],
+        'rt_p50': rt_summary['rt_p50'],
+        'rt_p90': rt_summary['rt_p90'],
+        'premature_responses': game_state.premature_responses,
+        'late_responses': game_state.late_responses,
+        'attention_lapses': game_state.attention_lapses,
+        'rows': rows,
+    }
+
+
+if __name__ == "__main__":
+    import time
+    start = time.perf_counter()
+    result = run_session(RESPONDERS["gaussian"](), seed=1)
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"{result['trials']} trials, score {result['score']}, "
+          f"accuracy {result['accuracy']:.0%} in {elapsed:.1f} ms")
@@ -0,0 +1,259 @@
+import os
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import csv
+import itertools
+import sys
+import time
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+import analytics
+import log_segments
+from nback_core import (
+    NBACK_LOG_FILE, PREMATURE_RT_MS, LATE_RT_MS, RT_VARIABILITY_WINDOW, RT_VARIABILITY_MIN_RTS,
+    IMPULSIVITY_PREMATURE_WEIGHT, IMPULSIVITY_FALSE_ALARM_WEIGHT
+)
+
+# Re-derives the per-trial columns of nback_sessions.csv that calculate_adhd_metrics
+# computed with fixed thresholds, from the raw IsMatch, UserPressed, RT and
+# trial order. Every parameter set in a sweep is evaluated over the same loaded
+# columns at once, e.g.
+#   python recompute.py --premature-ms 150 200 250 --late-ms 1500 1800 --rt-window 5 8
+#   python recompute.py --premature-ms 150 --rewrite nback_sessions_150ms.csv
+# Difficulty and WorkingMemoryLoad depend on the session's N rather than on
+# any threshold and are left as logged.
+
+RECOMPUTE_COLUMNS = {
+    "Session": "str", "Trial": "float", "IsMatch": "bool", "UserPressed": "bool", "RT": "float",
+}
+
+DEFAULT_PARAMS = {
+    "premature_threshold": PREMATURE_RT_MS,
+    "late_threshold": LATE_RT_MS,
+    "rt_window": RT_VARIABILITY_WINDOW,
+    "rt_min_count": RT_VARIABILITY_MIN_RTS,
+    "premature_weight": IMPULSIVITY_PREMATURE_WEIGHT,
+    "false_alarm_weight": IMPULSIVITY_FALSE_ALARM_WEIGHT,
+}
+
+SUMMARY_FIELDS = ["trials", "premature_responses", "late_responses", "attention_lapses",
+                  "impulsivity_score", "rt_variability_mean"]
+
+
+class RecomputeEngine:
+    """Loaded trial columns in (session, trial) order, ready to re-derive metrics.
+
+    Everything that doesn't depend on a parameter (response types,
+    correctness runs, session boundaries) is computed once here; evaluate()
+    then handles a whole list of parameter sets as (sets, trials) arrays.
+    Windowed RT SDs are cached per window and minimum count, so sweeps over
+    the RT thresholds reuse them.
+    """
+    def __init__(self, columns):
+        self.sessions, codes = analytics.group_sessions(columns["Session"])
+        self.order = np.lexsort((columns["Trial"], codes))
+        self.codes = codes[self.order]
+        self.is_match = columns["IsMatch"][self.order]
+        self.pressed = columns["UserPressed"][self.order]
+        rt = columns["RT"][self.order]
+        self.n = len(self.order)
+
+        index = np.arange(self.n)
+        starts = np.ones(self.n, dtype=bool)
+        starts[1:] = self.codes[1:] != self.codes[:-1]
+        self.session_first = np.maximum.accumulate(np.where(starts, index, 0))
+
+        # calculate_adhd_metrics only counts truthy RTs
+        with np.errstate(invalid='ignore'):
+            self.has_rt = ~np.isnan(rt) & (rt != 0)
+        self.rt = np.where(self.has_rt, rt, np.nan)
+        self.correct = self.is_match == self.pressed
+        self.false_alarm = ~self.is_match & self.pressed
+        self.attention_lapse = self.is_match & ~self.pressed
+
+        prev_correct = np.ones(self.n, dtype=bool)
+        prev_correct[1:] = self.correct[:-1]
+        prev_correct[starts] = True
+        self.prev_correct = prev_correct
+
+        # Errors since the last correct trial of the same session
+        last_correct = np.maximum.accumulate(np.where(self.correct, index, -1))
+        self.consecutive_errors = index - np.maximum(last_correct, self.session_first - 1)
+
+        self.response_type = np.select(
+            [self.is_match & self.pressed, self.false_alarm, self.attention_lapse],
+            ["Hit", "FalseAlarm", "Miss"], "CorrectRejection")
+        self.trial_type = np.where(self.is_match, "Target", "NonTarget")
+        self._variability = {}
+
+    def rt_variability(self, window, min_count):
+        """RTVariability for every trial: sample SD of the session's last `window`
+        RTs up to and including this trial, 0 until `min_count` of them exist"""
+        key = (window, min_count)
+        if key in self._variability:
+            return self._variability[key]
+
+        rt_rows = np.flatnonzero(self.has_rt)
+        values = self.rt[rt_rows]
+        rt_codes = self.codes[rt_rows]
+        windows = sliding_window_view(np.concatenate([np.full(window - 1, np.nan), values]), window)
+        window_codes = sliding_window_view(np.concatenate([np.full(window - 1, -1), rt_codes]), window)
+        in_session = window_codes == rt_codes[:, None]
+        windows = np.where(in_session, windows, 0.0)
+        count = in_session.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = windows.sum(axis=1) / count
+            squares = np.where(in_session, (windows - mean[:, None]) ** 2, 0.0).sum(axis=1)
+            sd = np.where(count >= max(min_count, 2), np.sqrt(squares / (count - 1)), 0.0)
+
+        # Trials without an RT repeat the value after the session's latest RT
+        latest = np.cumsum(self.has_rt) - 1  # index into rt_rows, -1 before the first RT
+        if len(rt_rows):
+            clipped = np.maximum(latest, 0)
+            valid = (latest >= 0) & (rt_rows[clipped] >= self.session_first)
+            result = np.where(valid, sd[clipped], 0.0)
+        else:
+            result = np.zeros(self.n)
+        self._variability[key] = result
+        return result
+
+    def evaluate(self, param_sets):
+        """Threshold-dependent columns for each parameter set, as {name: (sets, trials) array}"""
+        def column(name):
+            return np.array([params[name] for params in param_sets], dtype=np.float64)[:, None]
+
+        with np.errstate(invalid='ignore'):
+            premature = self.has_rt & (self.rt < column("premature_threshold"))
+            late = self.has_rt & ~premature & (self.rt > column("late_threshold"))
+        impulsivity = (premature * column("premature_weight")
+                       + self.false_alarm * column("false_alarm_weight"))
+        variability = np.stack([self.rt_variability(params["rt_window"], params["rt_min_count"])
+                                for params in param_sets])
+        return {
+            "PrematureResponse": premature,
+            "LateResponse": late,
+            "ImpulsivityScore": impulsivity,
+            "RTVariability": np.round(variability, 2),
+        }
+
+    def fixed(self):
+        """Parameter-free derived columns, as {name: (trials,) array}"""
+        return {
+            "ResponseType": self.response_type,
+            "TrialType": self.trial_type,
+            "Correct": self.correct,
+            "PrevTrialCorrect": self.prev_correct,
+            "ConsecutiveErrors": self.consecutive_errors,
+            "AttentionLapse": self.attention_lapse,
+        }
+
+    def unsort(self, values):
+        """Put (…, trials) values back into file row order"""
+        result = np.empty_like(values)
+        result[..., self.order] = values
+        return result
+
+    def summarize(self, derived):
+        """Per parameter set and session totals, as {name: (sets, sessions) array}"""
+        sets = next(iter(derived.values())).shape[0]
+        groups = len(self.sessions)
+        flat = (np.arange(sets)[:, None] * groups + self.codes).ravel()
+
+        def grouped(values):
+            return np.bincount(flat, np.broadcast_to(values, (sets, self.n)).ravel(),
+                               minlength=sets * groups).reshape(sets, groups)
+
+        trials = grouped(np.ones(self.n))
+        return {
+            "trials": trials,
+            "premature_responses": grouped(derived["PrematureResponse"]),
+            "late_responses": grouped(derived["LateResponse"]),
+            "attention_lapses": grouped(self.attention_lapse),
+            "impulsivity_score": grouped(derived["ImpulsivityScore"]),
+            "rt_variability_mean": grouped(derived["RTVariability"]) / trials,
+        }
+
+
+def _format(value):
+    if isinstance(value, (bool, np.bool_)):
+        return "Yes" if value else "No"
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        return int(value)
+    return value
+
+
+def rewrite_log(path, out_path, engine, derived, index=0):
+    """Copy the log at `path` (all of its segments) with derived columns replaced by parameter set `index`"""
+    columns = dict(engine.fixed())
+    columns.update((name, values[index]) for name, values in derived.items())
+    columns = {name: engine.unsort(values).tolist() for name, values in columns.items()}
+    header, rows = log_segments.read_log(path)
+    with open(out_path, 'w', newline='') as out:
+        positions = [(header.index(name), columns[name]) for name in columns if name in header]
+        writer = csv.writer(out)
+        writer.writerow(header)
+        for i, row in enumerate(rows):
+            for position, values in positions:
+                row[position] = _format(values[i])
+            writer.writerow(row)
+
+
+def build_param_sets(args):
+    """Every combination of the swept values, as parameter dicts"""
+    sweep = {
+        "premature_threshold": args.premature_ms,
+        "late_threshold": args.late_ms,
+        "rt_window": args.rt_window,
+        "rt_min_count": args.rt_min,
+        "premature_weight": args.premature_weight,
+        "false_alarm_weight": args.false_alarm_weight,
+    }
+    names = list(sweep)
+    return [dict(zip(names, values)) for values in itertools.product(*(sweep[name] for name in names))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-derive N-Back trial metrics under new thresholds")
+    parser.add_argument("--file", default=NBACK_LOG_FILE)
+    parser.add_argument("--premature-ms", type=float, nargs="+", default=[PREMATURE_RT_MS])
+    parser.add_argument("--late-ms", type=float, nargs="+", default=[LATE_RT_MS])
+    parser.add_argument("--rt-window", type=int, nargs="+", default=[RT_VARIABILITY_WINDOW])
+    parser.add_argument("--rt-min", type=int, nargs="+", default=[RT_VARIABILITY_MIN_RTS])
+    parser.add_argument("--premature-weight", type=float, nargs="+", default=[IMPULSIVITY_PREMATURE_WEIGHT])
+    parser.add_argument("--false-alarm-weight", type=float, nargs="+", default=[IMPULSIVITY_FALSE_ALARM_WEIGHT])
+    parser.add_argument("--workers", type=int, default=0, help="log parsing processes, as in analytics.py")
+    parser.add_argument("--rewrite", default=None,
+                        help="write a copy of the log with the first parameter set's columns here")
+    parser.add_argument("--out", default="-", help="per-session summary CSV (default: stdout)")
+    args = parser.parse_args(argv)
+
+    param_sets = build_param_sets(args)
+    start = time.perf_counter()
+    engine = RecomputeEngine(analytics.load_log(args.file, RECOMPUTE_COLUMNS, workers=args.workers))
+    derived = engine.evaluate(param_sets)
+    summary = engine.summarize(derived)
+    elapsed = time.perf_counter() - start
+
+    if args.rewrite:
+        rewrite_log(args.file, args.rewrite, engine, derived)
+
+    out = sys.stdout if args.out == "-" else open(args.out, "w", newline="")
+    try:
+        writer = csv.writer(out)
+        writer.writerow(list(DEFAULT_PARAMS) + ["session"] + SUMMARY_FIELDS)
+        for k, params in enumerate(param_sets):
+            for g, session in enumerate(engine.sessions):
+                writer.writerow([_format(params[name]) for name in DEFAULT_PARAMS] + [session]
+                                + [_format(round(float(summary[field][k, g]), 4)) for field in SUMMARY_FIELDS])
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print(f"{engine.n} trials x {len(param_sets)} parameter sets in {elapsed:.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+import argparse
+import csv
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from operator import itemgetter
+
+# Optional SQLite backend for the trial logs. Each game gets its own table
+# with its own columns; session_id, timestamp and trial_type are named the
+# same in both so the indexes and session_summary work across games. Picked
+# with ADHD_STORE=sqlite (or csv,sqlite to keep writing the CSVs as well),
+# and existing CSVs are loaded with
+#   python sqlite_store.py import --nback nback_sessions.csv --alien adhd_log.csv
+# Rows of a CSV log are numbered across its rotated segments and active file;
+# imported_rows keeps the ranges of those numbers already in the database,
+# whether imported or written live next to the CSV, so an import only loads
+# rows that aren't there yet.
+
+DB_ENV = "ADHD_DB"
+DB_FILE = "adhd_sessions.db"
+IMPORT_BATCH_ROWS = 50_000
+INDEXED_COLUMNS = ("session_id", "timestamp", "trial_type")
+
+# CSV column -> (SQL column, SQL type); INTEGER columns listed in BOOL_COLUMNS hold Yes/No as 1/0
+SCHEMAS = {
+    "nback": {
+        "table": "nback_trials",
+        "rt": "rt",
+        "columns": {
+            "Session": ("session_id", "TEXT"), "Trial": ("trial", "INTEGER"),
+            "Letter": ("letter", "TEXT"), "Position": ("position", "TEXT"),
+            "IsMatch": ("is_match", "INTEGER"), "UserPressed": ("user_pressed", "INTEGER"),
+            "Correct": ("correct", "INTEGER"), "RT": ("rt", "REAL"), "Score": ("score", "INTEGER"),
+            "Timestamp": ("timestamp", "TEXT"), "ResponseType": ("response_type", "TEXT"),
+            "Difficulty": ("difficulty", "TEXT"), "TrialType": ("trial_type", "TEXT"),
+            "PrevTrialCorrect": ("prev_trial_correct", "INTEGER"),
+            "ConsecutiveErrors": ("consecutive_errors", "INTEGER"),
+            "RTVariability": ("rt_variability", "REAL"),
+            "PrematureResponse": ("premature_response", "INTEGER"),
+            "LateResponse": ("late_response", "INTEGER"),
+            "AttentionLapse": ("attention_lapse", "INTEGER"),
+            "ImpulsivityScore": ("impulsivity_score", "REAL"),
+            "WorkingMemoryLoad": ("working_memory_load", "INTEGER"),
+            "DistractorPresent": ("distractor_present", "INTEGER"),
+            "StimulusDuration": ("stimulus_duration", "INTEGER"),
+            "InterTrialInterval": ("inter_trial_interval", "INTEGER"),
+            "OnsetNs": ("onset_ns", "INTEGER"), "ResponseNs": ("response_ns", "INTEGER"),
+            "OffsetNs": ("offset_ns", "INTEGER"), "ExposureMs": ("exposure_ms", "REAL"),
+        },
+    },
+    "alien": {
+        "table": "alien_trials",
+        "rt": "reaction_time_ms",
+        "columns": {
+            "Timestamp": ("timestamp", "TEXT"), "Stimulus": ("trial_type", "TEXT"),
+            "Action": ("action", "TEXT"), "Correct": ("correct", "INTEGER"),
+            "Reaction_Time_ms": ("reaction_time_ms", "REAL"), "Onset_ns": ("onset_ns", "INTEGER"),
+            "Response_ns": ("response_ns", "INTEGER"), "Session": ("session_id", "TEXT"),
+        },
+    },
+}
+BOOL_COLUMNS = {"is_match", "user_pressed", "correct", "prev_trial_correct", "premature_response",
+                "late_response", "attention_lapse", "distractor_present"}
+
+SUMMARY_SQL = """
+CREATE TABLE IF NOT EXISTS session_summary (
+    game TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    trials INTEGER NOT NULL,
+    correct INTEGER NOT NULL,
+    rt_count INTEGER NOT NULL,
+    rt_sum REAL NOT NULL,
+    rt_sum_sq REAL NOT NULL,
+    first_timestamp TEXT,
+    last_timestamp TEXT,
+    PRIMARY KEY (game, session_id)
+);
+CREATE VIEW IF NOT EXISTS session_stats AS
+SELECT game, session_id, trials, correct, CAST(correct AS REAL) / trials AS accuracy, rt_count,
+       rt_sum / NULLIF(rt_count, 0) AS rt_mean,
+       (rt_sum_sq - rt_sum * rt_sum / NULLIF(rt_count, 0)) / NULLIF(rt_count - 1, 0) AS rt_variance,
+       first_timestamp, last_timestamp
+FROM session_summary;
+CREATE TABLE IF NOT EXISTS imported_rows (
+    path TEXT NOT NULL,
+    first_row INTEGER NOT NULL,
+    end_row INTEGER NOT NULL,
+    game TEXT NOT NULL,
+    recorded_at TEXT NOT NULL,
+    PRIMARY KEY (path, first_row)
+);
+"""
+
+UPSERT_SUMMARY_SQL = """
+INSERT INTO session_summary VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (game, session_id) DO UPDATE SET
+    trials = trials + excluded.trials,
+    correct = correct + excluded.correct,
+    rt_count = rt_count + excluded.rt_count,
+    rt_sum = rt_sum + excluded.rt_sum,
+    rt_sum_sq = rt_sum_sq + excluded.rt_sum_sq,
+    first_timestamp = min(coalesce(first_timestamp, excluded.first_timestamp),
+                          coalesce(excluded.first_timestamp, first_timestamp)),
+    last_timestamp = max(coalesce(last_timestamp, excluded.last_timestamp),
+                         coalesce(excluded.last_timestamp, last_timestamp))
+"""
+
+
+def default_db_path(log_filename):
+    """ADHD_DB if set, else DB_FILE beside the CSV log"""
+    return os.environ.get(DB_ENV) or os.path.join(os.path.dirname(os.path.abspath(log_filename)), DB_FILE)
+
+
+def connect(db_path):
+    """Open the database in WAL mode and create any missing tables and indexes"""
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")  # WAL stays consistent; only the last commits can be lost on power failure
+    with conn:
+        for schema in SCHEMAS.values():
+            table = schema["table"]
+            columns = ", ".join(f"{name} {kind}" for name, kind in schema["columns"].values())
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, {columns}, source TEXT)")
+            _add_new_columns(conn, table, schema)
+            _create_indexes(conn, table)
+        conn.executescript(SUMMARY_SQL)
+    return conn
+
+
+def _add_new_columns(conn, table, schema):
+    """Columns added to the log since the table was created; old rows read NULL"""
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for name, kind in list(schema["columns"].values()) + [("source", "TEXT")]:
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {kind}")
+
+
+def _row_ranges(conn, path):
+    return conn.execute("SELECT first_row, end_row FROM imported_rows WHERE path = ? ORDER BY first_row",
+                        (path,)).fetchall()
+
+
+def _record_rows(conn, path, game, ranges):
+    """Add [first, end) row ranges of the log at `path` and merge them with the ones recorded"""
+    merged = []
+    for first, end in sorted(_row_ranges(conn, path) + list(ranges)):
+        if merged and first <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([first, end])
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    conn.execute("DELETE FROM imported_rows WHERE path = ?", (path,))
+    conn.executemany("INSERT INTO imported_rows VALUES (?, ?, ?, ?, ?)",
+                     [(path, first, end, game, now) for first, end in merged])
+
+
+def _create_indexes(conn, table):
+    for column in INDEXED_COLUMNS:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_{column} ON {table} ({column})")
+
+
+def _drop_indexes(conn, table):
+    for column in INDEXED_COLUMNS:
+        conn.execute(f"DROP INDEX IF EXISTS {table}_{column}")
+
+
+def _placeholder(name):
+    """SQL for one inserted value; SQLite's column affinity turns numeric text into numbers"""
+    if name in BOOL_COLUMNS:
+        return "CASE ? WHEN 'Yes' THEN 1 WHEN 'No' THEN 0 END"
+    return "NULLIF(?, '')"
+
+
+class _RowMapper:
+    """Turns CSV rows laid out as `header` into parameters for a game's INSERT.
+
+    Values go to SQLite as the CSV text and are converted by the statement
+    itself, which keeps per-row work in Python to a tuple of strings.
+    """
+    def __init__(self, game, header, source=None):
+        schema = SCHEMAS[game]
+        self.game = game
+        self.source = source
+        self.table = schema["table"]
+        self.width = len(header)
+        fields = [(header.index(csv_name), name)
+                  for csv_name, (name, kind) in schema["columns"].items() if csv_name in header]
+        self.names = [name for _, name in fields]
+        self._get = itemgetter(*(i for i, _ in fields))
+        self.insert_sql = (f"INSERT INTO {self.table} ({', '.join(self.names)}, source) "
+                           f"VALUES ({', '.join(_placeholder(name) for name in self.names)}, ?)")
+        self._session = self.names.index("session_id")
+        self._correct = self.names.index("correct")
+        self._rt = self.names.index(schema["rt"])
+        self._timestamp = self.names.index("timestamp")
+
+    def record(self, row):
+        if len(row) < self.width:
+            row = row + [""] * (self.width - len(row))
+        return self._get(row) + (self.source,)
+
+    def summaries(self, records):
+        """session_summary rows covering just `records`"""
+        sessions = {}
+        for record in records:
+            summary = sessions.get(record[self._session])
+            if summary is None:
+                summary = sessions[record[self._session]] = [0, 0, 0, 0.0, 0.0, None, None]
+            summary[0] += 1
+            summary[1] += record[self._correct] == "Yes"
+            rt = record[self._rt]
+            if rt not in ("", None):
+                rt = float(rt)
+                summary[2] += 1
+                summary[3] += rt
+                summary[4] += rt * rt
+            timestamp = record[self._timestamp]
+            if timestamp:
+                if summary[5] is None or timestamp < summary[5]:
+                    summary[5] = timestamp
+                if summary[6] is None or timestamp > summary[6]:
+                    summary[6] = timestamp
+        return [(self.game, session, *summary) for session, summary in sessions.items()]
+
+
+class SQLiteSink:
+    """TrialLogger sink writing each batch to SQLite in one transaction.
+
+    The batch's rows and its increments to session_summary commit together,
+    so the summary always matches the trial table. Database errors are
+    re-raised as OSError so TrialLogger keeps the batch and retries it.
+    With `log_filename` (the CSV written alongside), each batch also records
+    which rows of that log it holds, so importing the CSV later skips them.
+    """
+    def __init__(self, db_path, game, header, log_filename=None):
+        self.db_path = db_path
+        self.log_path = os.path.abspath(log_filename) if log_filename else None
+        self.mapper = _RowMapper(game, list(header), self.log_path)
+        self._conn = None
+        self._next_row = None
+
+    def open(self):
+        self._conn = connect(self.db_path)
+        if self.log_path:
+            import log_segments
+            self._next_row = log_segments.row_count(self.log_path)
+
+    def write_rows(self, rows):
+        records = [self.mapper.record(row) for row in rows]
+        try:
+            with self._conn:
+                self._conn.executemany(self.mapper.insert_sql, records)
+                self._conn.executemany(UPSERT_SUMMARY_SQL, self.mapper.summaries(records))
+                if self.log_path:
+                    _record_rows(self._conn, self.log_path, self.mapper.game,
+                                 [(self._next_row, self._next_row + len(records))])
+        except sqlite3.Error as e:
+            raise OSError(f"{self.db_path}: {e}") from e
+        if self.log_path:
+            self._next_row += len(records)
+
+    def close(self):
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+
+def rebuild_summary(conn, game):
+    """Recompute session_summary for one game from its trial table"""
+    schema = SCHEMAS[game]
+    rt = schema["rt"]
+    with conn:
+        conn.execute("DELETE FROM session_summary WHERE game = ?", (game,))
+        conn.execute(f"""
+            INSERT INTO session_summary
+            SELECT ?, session_id, count(*), total(correct), count({rt}), total({rt}), total({rt} * {rt}),
+                   min(timestamp), max(timestamp)
+            FROM {schema["table"]} GROUP BY session_id""", (game,))
+
+
+def import_csv(conn, path, game, force=False, session_gap_s=None):
+    """Bulk-load the rows of one game's CSV log that aren't in the database yet; returns how many.
+
+    A rotated log is read across its segments, compressed ones included.
+    Rows already imported, or written live by a SQLiteSink next to the
+    CSV, are skipped, so a log that has grown only loads its new rows.
+    `force` first deletes every row loaded from this log and loads it all
+    again. adhd_log.csv rows without a Session get one inferred from
+    timestamp gaps, as in analytics.py.
+    """
+    source = os.path.abspath(path)
+    table = SCHEMAS[game]["table"]
+    if force:
+        with conn:
+            conn.execute(f"DELETE FROM {table} WHERE source = ?", (source,))
+            conn.execute("DELETE FROM imported_rows WHERE path = ?", (source,))
+
+    # Only the importer needs NumPy; the games' sink doesn't
+    import numpy as np
+    import analytics
+    import log_segments
+    header, rows = log_segments.read_log(path)
+    with analytics.gc_paused():
+        rows = list(rows)
+    covered = np.zeros(len(rows), dtype=bool)
+    for first, end in _row_ranges(conn, source):
+        covered[first:end] = True
+    new = np.flatnonzero(~covered)
+    if not len(new):
+        return 0
+
+    if game == "alien":
+        # Inferred over the whole log so new rows continue the sessions before them
+        if "Session" not in header:
+            header = header + ["Session"]
+        session_col, timestamp_col = header.index("Session"), header.index("Timestamp")
+        sessions = np.array([row[session_col] if session_col < len(row) else "" for row in rows], dtype=str)
+        timestamps = np.array([row[timestamp_col] for row in rows], dtype=str)
+        inferred = analytics.infer_sessions(sessions, timestamps, session_gap_s or analytics.SESSION_GAP_S)
+        rows = [row + [""] * (len(header) - len(row)) for row in rows]
+        for row, session in zip(rows, inferred.tolist()):
+            row[session_col] = session
+    rows = [rows[i] for i in new.tolist()]
+    breaks = np.flatnonzero(np.diff(new) != 1) + 1
+    ranges = [(int(run[0]), int(run[-1]) + 1) for run in np.split(new, breaks)]
+
+    mapper = _RowMapper(game, header, source)
+    # A failed import is simply re-run, and indexes are cheaper to build once at the end of a big one
+    rebuild_indexes = len(rows) >= IMPORT_BATCH_ROWS
+    conn.execute("PRAGMA synchronous=OFF")
+    try:
+        with conn:
+            if rebuild_indexes:
+                _drop_indexes(conn, mapper.table)
+            for start in range(0, len(rows), IMPORT_BATCH_ROWS):
+                conn.executemany(mapper.insert_sql,
+                                 [mapper.record(row) for row in rows[start:start + IMPORT_BATCH_ROWS]])
+            _record_rows(conn, source, game, ranges)
+            if rebuild_indexes:
+                _create_indexes(conn, mapper.table)
+    finally:
+        conn.execute("PRAGMA synchronous=NORMAL")
+    rebuild_summary(conn, game)
+    return len(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SQLite store for the game logs")
+    commands = parser.add_subparsers(dest="command", required=True)
+    load = commands.add_parser("import", help="bulk-load existing CSV logs")
+    load.add_argument("--db", default=DB_FILE)
+    load.add_argument("--nback", default=None, help="nback_sessions.csv to load")
+    load.add_argument("--alien", default=None, help="adhd_log.csv to load")
+    load.add_argument("--force", action="store_true", help="delete the rows loaded from these logs and load them again")
+    show = commands.add_parser("summary", help="print per-session stats")
+    show.add_argument("--db", default=DB_FILE)
+    show.add_argument("--game", choices=list(SCHEMAS), default=None)
+    args = parser.parse_args(argv)
+
+    conn = connect(args.db)
+    try:
+        if args.command == "import":
+            if not args.nback and not args.alien:
+                parser.error("give --nback and/or --alien")
+            for game, path in (("nback", args.nback), ("alien", args.alien)):
+                if path:
+                    start = time.perf_counter()
+                    count = import_csv(conn, path, game, args.force)
+                    status = f"{count} new rows" if count else "already imported"
+                    print(f"{path}: {status} in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+        else:
+            query = "SELECT * FROM session_stats"
+            params = ()
+            if args.game:
+                query += " WHERE game = ?"
+                params = (args.game,)
+            cursor = conn.execute(query + " ORDER BY first_timestamp", params)
+            writer = csv.writer(sys.stdout)
+            writer.writerow([column[0] for column in cursor.description])
+            writer.writerows(cursor)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
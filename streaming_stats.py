@@ -0,0 +1,198 @@
+import math
+from bisect import bisect_right, insort
+
+# Constant-time, constant-memory summaries of a stream of values, used for the
+# reaction times of a session so long or continuous runs never keep the whole
+# history around or recompute statistics from scratch.
+
+
+class RunningStats:
+    """Count, mean, variance, min and max of everything added (Welford)"""
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (x - self.mean)
+        if self.min is None or x < self.min:
+            self.min = x
+        if self.max is None or x > self.max:
+            self.max = x
+
+    def variance(self):
+        """Sample variance, None with fewer than two values"""
+        if self.count < 2:
+            return None
+        return max(0.0, self._m2 / (self.count - 1))
+
+    def stdev(self):
+        variance = self.variance()
+        return math.sqrt(variance) if variance is not None else None
+
+
+class WindowedStats:
+    """Mean and sample variance of the last `size` values, kept in a ring buffer.
+
+    Adding a value to a full window swaps it for the oldest one with Welford's
+    replace update. Each time the ring wraps the sums are recomputed from the
+    buffer, so rounding error can't build up over a long session; that costs
+    O(size) once every `size` values.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self._values = [0.0] * size
+        self._pos = 0
+
+    def add(self, x):
+        if self.count < self.size:
+            self.count += 1
+            delta = x - self.mean
+            self.mean += delta / self.count
+            self._m2 += delta * (x - self.mean)
+        else:
+            old = self._values[self._pos]
+            old_mean = self.mean
+            self.mean += (x - old) / self.size
+            self._m2 += (x - old) * (x - self.mean + old - old_mean)
+
+        self._values[self._pos] = x
+        self._pos = (self._pos + 1) % self.size
+        if self._pos == 0 and self.count == self.size:
+            self._resync()
+
+    def _resync(self):
+        self.mean = math.fsum(self._values) / self.size
+        self._m2 = math.fsum((v - self.mean) ** 2 for v in self._values)
+
+    def values(self):
+        """Window contents, oldest first"""
+        if self.count < self.size:
+            return self._values[:self.count]
+        return self._values[self._pos:] + self._values[:self._pos]
+
+    def variance(self):
+        """Sample variance of the window, None with fewer than two values"""
+        if self.count < 2:
+            return None
+        return max(0.0, self._m2 / (self.count - 1))
+
+    def stdev(self):
+        variance = self.variance()
+        return math.sqrt(variance) if variance is not None else None
+
+
+class P2Quantile:
+    """Streaming estimate of the `p` quantile with the P-square algorithm.
+
+    Keeps five markers whatever the stream length (Jain & Chlamtac, 1985). The
+    first five values are kept exactly, and until then value() interpolates
+    between them like statistics.quantiles(method="inclusive").
+    """
+    def __init__(self, p):
+        if not 0 < p < 1:
+            raise ValueError(f"quantile must be between 0 and 1, got {p}")
+        self.p = p
+        self.count = 0
+        self._heights = []
+        self._positions = [1, 2, 3, 4, 5]
+        self._desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self._increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x):
+        self.count += 1
+        q = self._heights
+        if self.count <= 5:
+            insort(q, x)
+            return
+
+        n = self._positions
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = bisect_right(q, x) - 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        desired = self._desired
+        for i in range(5):
+            desired[i] += self._increments[i]
+
+        # Move the middle markers towards their desired positions
+        for i in (1, 2, 3):
+            d = desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                if not q[i - 1] < height < q[i + 1]:
+                    # Parabolic step would break marker order, fall back to linear
+                    height = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    def value(self):
+        """Current estimate, None before the first value"""
+        if self.count == 0:
+            return None
+        if self.count <= 5:
+            q = self._heights
+            pos = self.p * (self.count - 1)
+            lower = int(pos)
+            if lower + 1 >= self.count:
+                return q[lower]
+            return q[lower] + (q[lower + 1] - q[lower]) * (pos - lower)
+        return self._heights[2]
+
+
+class RTStats:
+    """Live reaction-time statistics for one session.
+
+    `session` covers every RT so far, `recent` the last `window` RTs (the
+    RTVariability window) and `quantiles` maps each requested probability to
+    its P2Quantile.
+    """
+    def __init__(self, window=5, quantiles=(0.5, 0.9)):
+        self.session = RunningStats()
+        self.recent = WindowedStats(window)
+        self.quantiles = {p: P2Quantile(p) for p in quantiles}
+
+    def add(self, rt):
+        self.session.add(rt)
+        self.recent.add(rt)
+        for estimator in self.quantiles.values():
+            estimator.add(rt)
+
+    @property
+    def count(self):
+        return self.session.count
+
+    def quantile(self, p):
+        return self.quantiles[p].value()
+
+    def summary(self):
+        """Session-level aggregates as a flat dict; None where there is no data yet"""
+        session = self.session
+        summary = {
+            'rt_count': session.count,
+            'rt_mean': session.mean if session.count else None,
+            'rt_sd': session.stdev(),
+            'rt_min': session.min,
+            'rt_max': session.max,
+            'rt_recent_sd': self.recent.stdev(),
+        }
+        for p, estimator in self.quantiles.items():
+            summary[f"rt_p{round(p * 100)}"] = estimator.value()
+        return summary
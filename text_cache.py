@@ -0,0 +1,107 @@
+from collections import OrderedDict
+import pygame
+
+# Text rendering caches shared by both games. font.render() rasterizes the
+# whole string every call; most on-screen text is the same from frame to frame.
+
+
+class TextCache:
+    """Bounded LRU cache of rendered text Surfaces keyed by (font, text, color, antialias).
+
+    Returned Surfaces are shared between callers and must not be drawn on.
+    """
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._surfaces = OrderedDict()
+
+    def render(self, font, text, color, antialias=True):
+        key = (font, text, tuple(color), antialias)
+        surf = self._surfaces.get(key)
+        if surf is not None:
+            self.hits += 1
+            self._surfaces.move_to_end(key)
+            return surf
+
+        self.misses += 1
+        surf = font.render(text, antialias, color)
+        self._surfaces[key] = surf
+        if len(self._surfaces) > self.maxsize:
+            self._surfaces.popitem(last=False)
+            self.evictions += 1
+        return surf
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def clear(self):
+        self._surfaces.clear()
+
+    def __len__(self):
+        return len(self._surfaces)
+
+
+class GlyphAtlas:
+    """Per-character glyph Surfaces for one font and color.
+
+    Strings that change every frame (countdowns, score counters) would churn
+    through a TextCache; drawing them glyph by glyph only ever renders each
+    character once. Glyphs are placed by their advance width, so kerning is
+    not applied.
+    """
+    def __init__(self, font, color, antialias=True):
+        self.font = font
+        self.color = color
+        self.antialias = antialias
+        self.height = font.get_height()
+        self._glyphs = {}
+
+    def _glyph(self, char):
+        glyph = self._glyphs.get(char)
+        if glyph is None:
+            glyph = self.font.render(char, self.antialias, self.color)
+            self._glyphs[char] = glyph
+        return glyph
+
+    def size(self, text):
+        return sum(self._glyph(char).get_width() for char in text), self.height
+
+    def get_rect(self, text, **kwargs):
+        """Rect of `text` with pygame.Rect keyword positioning, like Surface.get_rect()"""
+        rect = pygame.Rect((0, 0), self.size(text))
+        for name, value in kwargs.items():
+            setattr(rect, name, value)
+        return rect
+
+    def draw(self, surface, text, pos):
+        """Blit `text` with its top-left corner at `pos`; returns the covered Rect"""
+        x, y = pos
+        start_x = x
+        for char in text:
+            glyph = self._glyph(char)
+            surface.blit(glyph, (x, y))
+            x += glyph.get_width()
+        return pygame.Rect(start_x, y, x - start_x, self.height)
+
+
+# Shared cache for both games
+text_cache = TextCache()
+_atlases = {}
+
+
+def render_text(font, text, color, antialias=True):
+    """Cached font.render(text, antialias, color)"""
+    return text_cache.render(font, text, color, antialias)
+
+
+def glyph_atlas(font, color, antialias=True):
+    """Shared GlyphAtlas for a font/color pair"""
+    key = (font, tuple(color), antialias)
+    atlas = _atlases.get(key)
+    if atlas is None:
+        atlas = GlyphAtlas(font, color, antialias)
+        _atlases[key] = atlas
+    return atlas
@@ -0,0 +1,145 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Span tracing for both games, exported as Chrome trace-event JSON that opens
+# in chrome://tracing or ui.perfetto.dev. Turn it on with ADHD_TRACE=1; spans
+# go into a fixed-size ring buffer, so a long session keeps only its most
+# recent `capacity` events, and are written out once when the game exits.
+
+TRACE_ENV = "ADHD_TRACE"
+TRACE_CAPACITY = 200_000  # events; the oldest are dropped first
+PHASE_TRACK = 1  # pseudo thread id for game_phase spans, which cross frame boundaries
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "cat", "args", "start")
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.complete(self.name, self.start, time.perf_counter_ns(), self.cat, self.args)
+        return False
+
+
+class TraceRecorder:
+    """Records complete ("X") and instant ("i") trace events into a ring buffer.
+
+    Events are stored as plain tuples with perf_counter_ns timestamps and only
+    converted to JSON in dump(). Recording is safe from several threads; each
+    event is tagged with the recording thread so the logger's writer thread
+    shows up as its own track.
+    """
+    def __init__(self, enabled=None, capacity=TRACE_CAPACITY):
+        if enabled is None:
+            enabled = os.environ.get(TRACE_ENV, "0") not in ("", "0")
+        self.enabled = enabled
+        self.origin_ns = time.perf_counter_ns()
+        self.events = deque(maxlen=capacity)
+        self.recorded = 0
+        self.track_names = {PHASE_TRACK: "game_phase"}
+        self._phase = None
+        self._phase_start_ns = 0
+
+    def span(self, name, cat="game", **args):
+        """Context manager recording one complete event; free when tracing is off"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, cat, args or None)
+
+    def complete(self, name, start_ns, end_ns, cat="game", args=None, tid=None):
+        """Record a span measured by the caller with perf_counter_ns"""
+        if not self.enabled:
+            return
+        if tid is None:
+            tid = self._thread_id()
+        self.events.append(("X", name, cat, start_ns, end_ns - start_ns, tid, args))
+        self.recorded += 1
+
+    def instant(self, name, cat="game", tid=None, **args):
+        if not self.enabled:
+            return
+        if tid is None:
+            tid = self._thread_id()
+        self.events.append(("i", name, cat, time.perf_counter_ns(), 0, tid, args or None))
+        self.recorded += 1
+
+    def phase(self, name):
+        """Note the current game phase; a change closes the previous phase's span"""
+        if not self.enabled or name == self._phase:
+            return
+        now = time.perf_counter_ns()
+        self._end_phase(now)
+        self.instant("phase_change", "phase", tid=PHASE_TRACK, to=name, previous=self._phase)
+        self._phase = name
+        self._phase_start_ns = now
+
+    def _end_phase(self, now):
+        if self._phase is not None:
+            self.complete(self._phase, self._phase_start_ns, now, "phase", tid=PHASE_TRACK)
+            self._phase = None
+
+    def _thread_id(self):
+        thread = threading.current_thread()
+        tid = thread.ident
+        if tid not in self.track_names:
+            self.track_names[tid] = thread.name
+        return tid
+
+    def dropped(self):
+        """Events pushed out of the ring buffer so far"""
+        return self.recorded - len(self.events)
+
+    def to_json(self):
+        pid = os.getpid()
+        trace = [{"ph": "M", "name": "thread_name", "pid": pid, "tid": tid, "args": {"name": name}}
+                 for tid, name in list(self.track_names.items())]
+        for ph, name, cat, start_ns, dur_ns, tid, args in list(self.events):
+            event = {"ph": ph, "name": name, "cat": cat, "pid": pid, "tid": tid,
+                     "ts": (start_ns - self.origin_ns) / 1000}
+            if ph == "X":
+                event["dur"] = dur_ns / 1000
+            else:
+                event["s"] = "t"
+            if args:
+                event["args"] = args
+            trace.append(event)
+        return {"traceEvents": trace, "displayTimeUnit": "ms",
+                "otherData": {"recorded": self.recorded, "dropped": self.dropped()}}
+
+    def dump(self, log_filename, session_id, game):
+        """Write the trace beside `log_filename`; returns the path, or None when off"""
+        if not self.enabled:
+            return None
+        self._end_phase(time.perf_counter_ns())
+        if not self.events:
+            return None
+        path = os.path.join(os.path.dirname(os.path.abspath(log_filename)),
+                            f"trace_{game}_{session_id}.json")
+        with open(path, 'w') as f:
+            json.dump(self.to_json(), f, separators=(",", ":"))
+        return path
+
+
+# Shared by code that is handed no recorder of its own
+NULL_TRACER = TraceRecorder(enabled=False, capacity=1)
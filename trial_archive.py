@@ -0,0 +1,350 @@
+import os
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import csv
+import json
+import mmap
+import struct
+import sys
+import time
+
+import numpy as np
+
+import analytics
+import log_segments
+from nback_core import NBACK_LOG_HEADER
+
+# Columnar binary archive of the trial logs. Every column is stored with a
+# fixed-width NumPy dtype, one chunk per session, so readers map the file and
+# view columns in place instead of parsing text:
+#   python trial_archive.py pack nback_sessions.csv nback_sessions.adhdarc
+#   python trial_archive.py unpack nback_sessions.adhdarc nback_copy.csv
+#
+# Layout: MAGIC, then each chunk's columns back to back (8-byte aligned), then
+# a JSON footer with the schema, enum dictionaries and chunk offsets, its
+# length as a little-endian uint64 and MAGIC again.
+
+MAGIC = b"ADHDARC1"
+ALIGN = 8
+INT_MISSING = -2**15  # empty integer fields, the smallest value a "short" holds
+NS_MISSING = -1  # empty perf_counter_ns fields
+
+# Column kind -> (dtype, values per row)
+KINDS = {
+    "int": ("<i4", 1),
+    "short": ("<i2", 1),  # small counts and millisecond durations
+    "ns": ("<i8", 1),
+    "float": ("<f8", 1),  # empty fields are NaN
+    "bool": ("|b1", 1),  # "Yes"/"No"
+    "char": ("|S1", 1),
+    "position": ("|i1", 2),  # "(col,row)"
+    "timestamp": ("<M8[s]", 1),  # "YYYY-mm-dd HH:MM:SS", empty is NaT
+    "enum": ("|u1", 1),  # index into the footer's dictionary for the column
+}
+
+# CSV column -> kind; "session" marks the column that selects the chunk
+ARCHIVE_SCHEMAS = {
+    "nback": {
+        "Session": "session", "Trial": "int", "Letter": "char", "Position": "position",
+        "IsMatch": "bool", "UserPressed": "bool", "Correct": "bool", "RT": "float", "Score": "int",
+        "Timestamp": "timestamp", "ResponseType": "enum", "Difficulty": "enum", "TrialType": "enum",
+        "PrevTrialCorrect": "bool", "ConsecutiveErrors": "short", "RTVariability": "float",
+        "PrematureResponse": "bool", "LateResponse": "bool", "AttentionLapse": "bool",
+        "ImpulsivityScore": "short", "WorkingMemoryLoad": "short", "DistractorPresent": "bool",
+        "StimulusDuration": "short", "InterTrialInterval": "short", "OnsetNs": "ns", "ResponseNs": "ns",
+        "OffsetNs": "ns", "ExposureMs": "float",
+    },
+    "alien": {
+        "Timestamp": "timestamp", "Stimulus": "enum", "Action": "enum", "Correct": "bool",
+        "Reaction_Time_ms": "float", "Onset_ns": "ns", "Response_ns": "ns", "Session": "session",
+    },
+}
+assert list(ARCHIVE_SCHEMAS["nback"]) == NBACK_LOG_HEADER
+
+
+def _encode(values, kind, dictionary):
+    """CSV text values of one column -> array of the kind's dtype"""
+    if kind == "bool":
+        return np.array(values, dtype=object) == "Yes"
+    if kind == "float":
+        array = np.array(values, dtype=object)
+        array[array == ""] = "nan"
+        return array.astype(np.float64)
+    if kind in ("int", "short", "ns"):
+        array = np.array(values, dtype=object)
+        array[array == ""] = NS_MISSING if kind == "ns" else INT_MISSING
+        return array.astype(KINDS[kind][0])
+    # The remaining kinds have few distinct values: parse each once
+    distinct, inverse = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+    inverse = inverse.ravel()
+    if kind == "char":
+        return np.array([value.encode() for value in distinct.tolist()], dtype="S1")[inverse]
+    if kind == "position":
+        return np.array([[int(part) for part in value.strip("()").split(",")] for value in distinct.tolist()],
+                        dtype=np.int8).reshape(-1, 2)[inverse]
+    if kind == "timestamp":
+        return distinct.astype("datetime64[s]")[inverse]
+    if kind == "enum":
+        for value in distinct.tolist():
+            if value not in dictionary:
+                if len(dictionary) >= 256:
+                    raise ValueError(f"more than 256 distinct values in an enum column: {value!r}")
+                dictionary[value] = len(dictionary)
+        return np.array([dictionary[value] for value in distinct.tolist()], dtype=np.uint8)[inverse]
+    raise ValueError(f"unknown column kind {kind!r}")
+
+
+def _format_number(value):
+    """CSV text for a float, dropping the '.0' the logs never write for whole numbers"""
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _decode(array, kind, dictionary):
+    """Column array -> list of Python values as the games log them ("" when empty)"""
+    if kind == "bool":
+        return ["Yes" if value else "No" for value in array.tolist()]
+    if kind == "float":
+        return ["" if value != value else _format_number(value) for value in array.tolist()]
+    if kind in ("int", "short", "ns"):
+        missing = NS_MISSING if kind == "ns" else INT_MISSING
+        return ["" if value == missing else value for value in array.tolist()]
+    if kind == "char":
+        return [value.decode() for value in array.tolist()]
+    if kind == "position":
+        return [f"({a},{b})" for a, b in array.tolist()]
+    if kind == "timestamp":
+        return ["" if value == "NaT" else value.replace("T", " ")
+                for value in np.datetime_as_string(array).tolist()]
+    if kind == "enum":
+        return [dictionary[code] for code in array.tolist()]
+    raise ValueError(f"unknown column kind {kind!r}")
+
+
+def _layout(schema, rows, start):
+    """{column: byte offset} for a chunk of `rows` trials starting at `start`, and its end"""
+    offsets = {}
+    position = start
+    for name, kind in schema.items():
+        if kind == "session":
+            continue
+        position += -position % ALIGN
+        offsets[name] = position
+        dtype, width = KINDS[kind]
+        position += np.dtype(dtype).itemsize * width * rows
+    return offsets, position
+
+
+class ArchiveWriter:
+    """Writes an archive one session chunk at a time; the footer goes out on close()"""
+    def __init__(self, path, game):
+        self.path = path
+        self.game = game
+        self.schema = ARCHIVE_SCHEMAS[game]
+        self.enums = {name: {} for name, kind in self.schema.items() if kind == "enum"}
+        self.chunks = []
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        self._position = len(MAGIC)
+
+    def encode(self, name, values):
+        """CSV text values of column `name` -> the array write_session() expects"""
+        return _encode(values, self.schema[name], self.enums.get(name))
+
+    def write_session(self, session, arrays):
+        """Append one session; `arrays` maps every stored column to its encoded values"""
+        first = next(name for name, kind in self.schema.items() if kind != "session")
+        rows = len(arrays[first])
+        start = self._position + -self._position % ALIGN
+        offsets, self._position = _layout(self.schema, rows, start)
+        for name, offset in offsets.items():
+            dtype, width = KINDS[self.schema[name]]
+            array = np.ascontiguousarray(arrays[name], dtype=dtype)
+            if array.size != rows * width:
+                raise ValueError(f"{name} has {array.size // width} values, expected {rows}")
+            self._file.write(b"\0" * (offset - self._file.tell()))
+            self._file.write(array.tobytes())
+        self.chunks.append([session, rows, start])
+
+    def close(self):
+        footer = json.dumps({
+            "version": 1,
+            "game": self.game,
+            "columns": self.schema,
+            "enums": {name: list(dictionary) for name, dictionary in self.enums.items()},
+            "chunks": self.chunks,  # [session, rows, start offset]
+        }).encode()
+        self._file.write(b"\0" * (self._position - self._file.tell()))
+        self._file.write(footer)
+        self._file.write(struct.pack("<Q", len(footer)))
+        self._file.write(MAGIC)
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class TrialArchive:
+    """Read-only, memory-mapped view of an archive.
+
+    Column arrays returned by column() and iter_sessions() point straight
+    into the mapping, so nothing is read from disk until it is touched, and
+    a view that outlives close() keeps the mapping alive.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        size = len(self._map)
+        if self._map[:len(MAGIC)] != MAGIC or self._map[size - len(MAGIC):] != MAGIC:
+            raise ValueError(f"{path} is not a trial archive")
+        (footer_len,) = struct.unpack_from("<Q", self._map, size - len(MAGIC) - 8)
+        footer_start = size - len(MAGIC) - 8 - footer_len
+        footer = json.loads(self._map[footer_start:footer_start + footer_len])
+        self.game = footer["game"]
+        self.schema = footer["columns"]
+        self.enums = footer["enums"]
+        self.chunks = [(session, rows, _layout(self.schema, rows, start)[0])
+                       for session, rows, start in footer["chunks"]]
+        self.sessions = [chunk[0] for chunk in self.chunks]
+        self.rows = sum(chunk[1] for chunk in self.chunks)
+
+    def close(self):
+        try:
+            self._map.close()
+        except BufferError:
+            pass  # column views still reference it; it goes when they do
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def _view(self, chunk, name):
+        _, rows, offsets = chunk
+        dtype, width = KINDS[self.schema[name]]
+        array = np.frombuffer(self._map, dtype=dtype, count=rows * width, offset=offsets[name])
+        return array.reshape(-1, width) if width > 1 else array
+
+    def _chunks(self, sessions=None):
+        if sessions is None:
+            return self.chunks
+        wanted = set(sessions)
+        return [chunk for chunk in self.chunks if chunk[0] in wanted]
+
+    def _stored(self, columns):
+        names = [name for name, kind in self.schema.items() if kind != "session"]
+        return names if columns is None else [name for name in columns if name in names]
+
+    def iter_sessions(self, columns=None, sessions=None):
+        """Yield (session, {name: array view}) per chunk; enums stay as codes"""
+        names = self._stored(columns)
+        for chunk in self._chunks(sessions):
+            yield chunk[0], {name: self._view(chunk, name) for name in names}
+
+    def column(self, name, sessions=None):
+        """One column over the chosen sessions (a copy when it spans several chunks)"""
+        views = [self._view(chunk, name) for chunk in self._chunks(sessions)]
+        if len(views) == 1:
+            return views[0]
+        return np.concatenate(views) if views else np.empty(0, dtype=KINDS[self.schema[name]][0])
+
+    def decode(self, name, array):
+        """Column values as the CSV would hold them"""
+        return _decode(array, self.schema[name], self.enums.get(name))
+
+    def iter_trials(self, columns=None, sessions=None):
+        """Yield one dict per trial with CSV-style values, a session chunk at a time"""
+        names = list(self.schema) if columns is None else list(columns)
+        stored = self._stored(names)
+        for session, views in self.iter_sessions(stored, sessions):
+            decoded = {name: self.decode(name, views[name]) for name in stored}
+            rows = len(next(iter(decoded.values()))) if decoded else 0
+            for i in range(rows):
+                yield {name: session if self.schema[name] == "session" else decoded[name][i]
+                       for name in names}
+
+
+def csv_to_archive(csv_path, archive_path, game, session_gap_s=analytics.SESSION_GAP_S):
+    """Pack a game's CSV log; returns (rows, sessions).
+
+    Rows are grouped by session in order of first appearance and keep their
+    order within it; a rotated log is packed with all of its segments.
+    adhd_log.csv rows without a Session get the one analytics.infer_sessions
+    gives them.
+    """
+    schema = ARCHIVE_SCHEMAS[game]
+    header, rows = log_segments.read_log(csv_path)
+    with analytics.gc_paused():
+        rows = list(rows)
+        width = len(header)
+        fields = list(zip(*rows)) if rows else [()] * width
+    columns = {name: np.array(fields[header.index(name)] if name in header else [""] * len(rows),
+                              dtype=object) for name in schema}
+    del rows, fields
+
+    session_name = next(name for name, kind in schema.items() if kind == "session")
+    sessions = columns[session_name].astype(str)
+    if game == "alien":
+        sessions = analytics.infer_sessions(sessions, columns["Timestamp"].astype(str), session_gap_s)
+    names, codes = analytics.group_sessions(sessions)
+    order = np.argsort(codes, kind='stable')
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(names)))])
+
+    with ArchiveWriter(archive_path, game) as writer:
+        stored = {name: writer.encode(name, columns[name])[order]
+                  for name, kind in schema.items() if kind != "session"}
+        for g, session in enumerate(names.tolist()):
+            writer.write_session(session, {name: array[bounds[g]:bounds[g + 1]]
+                                           for name, array in stored.items()})
+    return len(order), len(names)
+
+
+def archive_to_csv(archive_path, csv_path):
+    """Write an archive back out in the game's CSV schema; returns the row count"""
+    with TrialArchive(archive_path) as archive, open(csv_path, 'w', newline='') as out:
+        writer = csv.writer(out)
+        header = list(archive.schema)
+        writer.writerow(header)
+        for session, views in archive.iter_sessions():
+            decoded = [[session] * len(next(iter(views.values()))) if archive.schema[name] == "session"
+                       else archive.decode(name, views[name]) for name in header]
+            writer.writerows(zip(*decoded))
+        return archive.rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Columnar archive of the game logs")
+    commands = parser.add_subparsers(dest="command", required=True)
+    pack = commands.add_parser("pack", help="CSV log -> archive")
+    pack.add_argument("csv")
+    pack.add_argument("archive")
+    pack.add_argument("--game", choices=list(ARCHIVE_SCHEMAS), default=None,
+                      help="schema (default: from the CSV header)")
+    unpack = commands.add_parser("unpack", help="archive -> CSV log")
+    unpack.add_argument("archive")
+    unpack.add_argument("csv")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if args.command == "pack":
+        game = args.game
+        if game is None:
+            game = "nback" if "IsMatch" in analytics.read_header(args.csv) else "alien"
+        rows, sessions = csv_to_archive(args.csv, args.archive, game)
+        print(f"{rows} trials in {sessions} sessions -> {args.archive} "
+              f"({os.path.getsize(args.archive)} bytes) in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+    else:
+        rows = archive_to_csv(args.archive, args.csv)
+        print(f"{rows} trials -> {args.csv} in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+import atexit
+import csv
+import io
+import locale
+import os
+import queue
+import threading
+import time
+from trace_events import NULL_TRACER
+
+# Storage backends for the trial logs, comma separated: csv, sqlite
+STORE_ENV = "ADHD_STORE"
+
+# What open() in text mode used for the logs
+LOG_ENCODING = locale.getpreferredencoding(False)
+
+# Markers passed through the queue alongside rows
+_STOP = object()
+
+
+class _SessionComplete:
+    def __init__(self, session):
+        self.session = session
+
+
+class _FlushRequest:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+def ensure_csv_header(filename, header):
+    """Create `filename` with `header`, or upgrade an older header in place.
+
+    Returns True if the file was created. When columns have been appended to the
+    schema since the file was written, only the header line is replaced; older
+    rows keep their shorter length and read back with the new columns empty.
+    """
+    header = list(header)
+    if not os.path.exists(filename) or os.path.getsize(filename) == 0:
+        with open(filename, 'w', newline='') as f:
+            csv.writer(f).writerow(header)
+        return True
+
+    with open(filename, newline='') as f:
+        existing = next(csv.reader(f), [])
+        if existing == header:
+            return False
+        if header[:len(existing)] != existing:
+            raise ValueError(f"{filename} has an incompatible header: {existing}")
+        tmp_name = filename + ".tmp"
+        with open(tmp_name, 'w', newline='') as out:
+            csv.writer(out).writerow(header)
+            for line in f:
+                out.write(line)
+    os.replace(tmp_name, filename)
+    return False
+
+
+class CSVSink:
+    """Append rows to a CSV file, writing the header when the file is new.
+
+    Rows are encoded here and appended as bytes so each row's offset is known;
+    with a LogIndex those offsets keep the log's sidecar index current. With
+    `rotate`, opening first closes the file as a segment if log_segments'
+    policy says it is due.
+    """
+    def __init__(self, filename, header, index=False, rotate=False):
+        self.filename = filename
+        self.header = list(header)
+        self.index = None
+        self._use_index = index
+        self._rotate = rotate
+        self._file = None
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+
+    def open(self):
+        if self._rotate:
+            from log_segments import rotate_if_due
+            rotate_if_due(self.filename)
+        ensure_csv_header(self.filename, self.header)
+        if self._use_index:
+            from log_index import LogIndex
+            self.index = LogIndex(self.filename).open()
+        self._file = open(self.filename, 'ab')
+
+    def _encode(self, row):
+        self._writer.writerow(row)
+        line = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return line.encode(LOG_ENCODING)
+
+    def write_rows(self, rows):
+        lines = [self._encode(row) for row in rows]
+        offset = self._file.tell()
+        self._file.write(b"".join(lines))
+        self._file.flush()
+        if self.index is not None:
+            for row, line in zip(rows, lines):
+                self.index.note(offset, row)
+                offset += len(line)
+            self.index.commit(offset)
+
+    def position(self):
+        """Byte offset the next row will be written at"""
+        return self._file.tell()
+
+    def rollback(self, offset):
+        """Cut the log back to `offset`, dropping whatever was written after it"""
+        if offset >= self._file.tell():
+            return
+        self._file.truncate(offset)
+        self._file.seek(0, os.SEEK_END)
+        if self.index is not None:
+            from log_index import LogIndex
+            self.index = LogIndex(self.filename).open()
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+        if self.index is not None:
+            self.index.close()
+            self.index = None
+
+
+class TeeSink:
+    """Hands every batch to several sinks.
+
+    A sink that fails keeps its rows in its own backlog and gets them again
+    with the next batch, so a retry never duplicates rows in the sinks that
+    succeeded. The last failure is kept in `last_error`.
+    """
+    def __init__(self, sinks):
+        self.sinks = list(sinks)
+        self.last_error = None
+        self._backlogs = [[] for _ in self.sinks]
+
+    def open(self):
+        for sink in self.sinks:
+            sink.open()
+
+    def write_rows(self, rows):
+        for sink, backlog in zip(self.sinks, self._backlogs):
+            backlog.extend(rows)
+            try:
+                sink.write_rows(backlog)
+            except OSError as e:
+                self.last_error = e
+                continue
+            backlog.clear()
+
+    def close(self):
+        for sink, backlog in zip(self.sinks, self._backlogs):
+            if backlog:
+                try:
+                    sink.write_rows(backlog)
+                except OSError as e:
+                    self.last_error = e
+            sink.close()
+
+    def complete_session(self, session=None):
+        for sink in self.sinks:
+            if hasattr(sink, "complete_session"):
+                sink.complete_session(session)
+
+
+def make_sink(filename, header, game):
+    """Sink for one game's trial log.
+
+    With ADHD_LOG_SERVICE set and the service running, rows go to the
+    service (see log_service.py), which writes them with local_sink();
+    otherwise this process writes them itself, starting with any rows
+    service clients spooled for the log.
+    """
+    from log_service import SpoolReplaySink, connect_sink
+    return connect_sink(filename, header, game) or SpoolReplaySink(local_sink(filename, header, game), filename)
+
+
+def local_sink(filename, header, game, journal=None):
+    """Sink writing one game's trial log in this process, built from the backends named in ADHD_STORE.
+
+    The default is the CSV file alone; "sqlite" writes to the SQLite store
+    instead and "csv,sqlite" to both. Unless ADHD_JOURNAL=0 (or `journal` is
+    False), batches go through the log's write-ahead journal first.
+    """
+    sinks = []
+    kinds = [kind.strip() for kind in os.environ.get(STORE_ENV, "csv").split(",")]
+    for kind in kinds:
+        if kind == "csv":
+            from log_index import index_enabled
+            sinks.append(CSVSink(filename, header, index=index_enabled(), rotate=True))
+        elif kind == "sqlite":
+            from sqlite_store import SQLiteSink, default_db_path
+            sinks.append(SQLiteSink(default_db_path(filename), game, header,
+                                    log_filename=filename if "csv" in kinds else None))
+        elif kind:
+            raise ValueError(f"unknown {STORE_ENV} backend {kind!r}")
+    if not sinks:
+        raise ValueError(f"{STORE_ENV} names no backend")
+    sink = sinks[0] if len(sinks) == 1 else TeeSink(sinks)
+    from journal import JournalSink, journal_enabled
+    if journal is None:
+        journal = journal_enabled()
+    return JournalSink(sink, filename, header) if journal else sink
+
+
+class TrialLogger:
+    """Queue trial rows from the game loop and write them in batches on a background thread.
+
+    log() only puts the row on an in-memory queue, so the frame loop never waits
+    on disk. The writer thread hands rows to the sink once `batch_size` rows are
+    waiting or the oldest queued row is `flush_interval` seconds old, and drains
+    everything on close().
+    """
+    def __init__(self, sink, batch_size=64, flush_interval=0.5, tracer=None):
+        self.sink = sink
+        self.tracer = tracer or NULL_TRACER
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+        self.batches_written = 0
+        self.last_error = None
+        self._queue = queue.SimpleQueue()
+        self._closed = False
+
+        self.sink.open()
+        self._thread = threading.Thread(target=self._run, name="trial-logger", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(self, row):
+        """Queue one row for writing"""
+        if not self._closed:
+            self._queue.put(row)
+
+    def complete_session(self, session=None):
+        """Mark the session finished once the rows queued before this have been written"""
+        if not self._closed:
+            self._queue.put(_SessionComplete(session))
+
+    def pending(self):
+        """Rows (and markers) queued but not yet taken by the writer thread"""
+        return self._queue.qsize()
+
+    def flush(self, timeout=None):
+        """Block until every row queued so far has been handed to the sink"""
+        if self._closed:
+            return
+        request = _FlushRequest()
+        self._queue.put(request)
+        request.done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        """Write any pending rows and stop the writer thread"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self.sink.close()
+
+    def _write(self, batch):
+        try:
+            with self.tracer.span("write_rows", "io", rows=len(batch)):
+                self.sink.write_rows(batch)
+        except OSError as e:
+            # Keep the rows and retry on the next flush rather than dropping data
+            self.last_error = e
+            return batch
+        self.rows_written += len(batch)
+        self.batches_written += 1
+        return []
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if not batch else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                if batch:
+                    self._write(batch)
+                return
+
+            if isinstance(item, _FlushRequest):
+                if batch:
+                    batch = self._write(batch)
+                item.done.set()
+            elif isinstance(item, _SessionComplete):
+                if batch:
+                    batch = self._write(batch)
+                if not batch and hasattr(self.sink, "complete_session"):
+                    try:
+                        self.sink.complete_session(item.session)
+                    except OSError as e:
+                        self.last_error = e
+            elif item is not None:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(item)
+
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                batch = self._write(batch)
+                if batch:
+                    deadline = time.monotonic() + self.flush_interval
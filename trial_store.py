@@ -0,0 +1,201 @@
+import numpy as np
+
+# Struct-of-arrays store for a session's N-Back trials (GameState.stimuli).
+# A Stimulus object costs around a kilobyte once its attribute dict is
+# counted; here a finished trial is 40 bytes across typed NumPy columns, so
+# continuous-performance and multi-block sessions with thousands of trials
+# stay small. Only the trial in play is kept as a live Stimulus (the game
+# mutates it while it is on screen); it is packed into the columns when the
+# next trial is appended. Indexing an older trial returns a TrialView that
+# reads the columns in place, so any n-back lookback is O(1).
+
+INITIAL_CAPACITY = 64
+NS_MISSING = -1  # same sentinel as trial_archive's ns columns
+RT_MISSING = np.iinfo(np.int32).min
+
+# Bits of the flags column
+MATCH = 1
+RESPONDED = 2
+USER_PRESSED = 4
+CORRECT = 8
+SCORED = 16  # `correct` has been decided (it is None before the response is handled)
+
+# Column -> (dtype, values per trial). letter, position and the ns columns
+# have trial_archive's "char", "position" and "ns" dtypes, so they can go to
+# ArchiveWriter.write_session() without conversion.
+COLUMNS = {
+    "letter": ("|S1", 1),
+    "position": ("|i1", 2),  # (col, row) on the grid, as draw_grid() reads it
+    "flags": ("|u1", 1),
+    "rt_us": ("<i4", 1),  # reaction time in microseconds
+    "shown_ms": ("<i8", 1),  # GameState.clock() when the trial was generated
+    "onset_ns": ("<i8", 1),
+    "response_ns": ("<i8", 1),
+    "offset_ns": ("<i8", 1),
+}
+
+
+def _ns(value):
+    return NS_MISSING if value is None else value
+
+
+def _ns_value(value):
+    return None if value == NS_MISSING else value
+
+
+class TrialView:
+    """Read-only Stimulus look-alike for a packed trial"""
+    __slots__ = ("_store", "trial_num")
+
+    pending_row = None
+    planned_offset_ns = None
+    explanation = ""
+
+    def __init__(self, store, index):
+        self._store = store
+        self.trial_num = index
+
+    def _flag(self, bit):
+        return bool(self._store._columns["flags"][self.trial_num] & bit)
+
+    @property
+    def letter(self):
+        return self._store._columns["letter"][self.trial_num].decode()
+
+    @property
+    def position(self):
+        col, row = self._store._columns["position"][self.trial_num].tolist()
+        return (col, row)
+
+    @property
+    def is_match(self):
+        return self._flag(MATCH)
+
+    @property
+    def responded(self):
+        return self._flag(RESPONDED)
+
+    @property
+    def user_pressed(self):
+        return self._flag(USER_PRESSED)
+
+    @property
+    def correct(self):
+        return self._flag(CORRECT) if self._flag(SCORED) else None
+
+    @property
+    def reaction_time(self):
+        rt_us = int(self._store._columns["rt_us"][self.trial_num])
+        return None if rt_us == RT_MISSING else rt_us / 1000
+
+    @property
+    def shown_time(self):
+        return int(self._store._columns["shown_ms"][self.trial_num])
+
+    @property
+    def onset_ns(self):
+        return _ns_value(int(self._store._columns["onset_ns"][self.trial_num]))
+
+    @property
+    def response_ns(self):
+        return _ns_value(int(self._store._columns["response_ns"][self.trial_num]))
+
+    @property
+    def offset_ns(self):
+        return _ns_value(int(self._store._columns["offset_ns"][self.trial_num]))
+
+
+class TrialStore:
+    """List-like GameState.stimuli backed by typed columns.
+
+    Supports len(), append(), iteration and indexing (negative too); the
+    last trial comes back as the live Stimulus, earlier ones as TrialViews.
+    """
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self._columns = {name: np.zeros((capacity, width) if width > 1 else capacity, dtype=dtype)
+                         for name, (dtype, width) in COLUMNS.items()}
+        self._length = 0
+        self._live = None  # Stimulus of the last trial, not final until the next append
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("trial index out of range")
+        if index == self._length - 1 and self._live is not None:
+            return self._live
+        return TrialView(self, index)
+
+    def __iter__(self):
+        for index in range(self._length):
+            yield self[index]
+
+    def append(self, stimulus):
+        if self._live is not None:
+            self._pack(self._length - 1, self._live)
+        if self._length == len(self._columns["flags"]):
+            self._grow()
+        self._length += 1
+        self._live = stimulus
+
+    def _grow(self):
+        for name, array in self._columns.items():
+            larger = np.zeros((len(array) * 2,) + array.shape[1:], dtype=array.dtype)
+            larger[:len(array)] = array
+            self._columns[name] = larger
+
+    def _pack(self, index, stimulus):
+        columns = self._columns
+        columns["letter"][index] = stimulus.letter.encode()
+        columns["position"][index] = stimulus.position
+        columns["flags"][index] = (MATCH * bool(stimulus.is_match) | RESPONDED * bool(stimulus.responded)
+                                   | USER_PRESSED * bool(stimulus.user_pressed)
+                                   | CORRECT * bool(stimulus.correct) | SCORED * (stimulus.correct is not None))
+        columns["rt_us"][index] = (RT_MISSING if stimulus.reaction_time is None
+                                   else round(stimulus.reaction_time * 1000))
+        columns["shown_ms"][index] = stimulus.shown_time
+        columns["onset_ns"][index] = _ns(stimulus.onset_ns)
+        columns["response_ns"][index] = _ns(stimulus.response_ns)
+        columns["offset_ns"][index] = _ns(stimulus.offset_ns)
+
+    def columns(self):
+        """{name: array} views of the stored trials, without copying.
+
+        The trial still in play is packed as it stands first. Trials never
+        change once the next one is appended, so a view stays correct for
+        the rows it covers even after the store grows into new arrays.
+        """
+        if self._live is not None:
+            self._pack(self._length - 1, self._live)
+        return {name: array[:self._length] for name, array in self._columns.items()}
+
+    def analytics_columns(self, session, premature_threshold, late_threshold):
+        """The columns analytics.nback_metrics() reads from the log, derived in bulk.
+
+        Premature/late responses, lapses and impulsivity are classified the
+        way nback_core.calculate_adhd_metrics classifies each trial.
+        """
+        from nback_core import IMPULSIVITY_FALSE_ALARM_WEIGHT, IMPULSIVITY_PREMATURE_WEIGHT
+        columns = self.columns()
+        flags = columns["flags"]
+        match = (flags & MATCH) != 0
+        pressed = (flags & USER_PRESSED) != 0
+        rt = np.where(columns["rt_us"] == RT_MISSING, np.nan, columns["rt_us"] / 1000)
+        has_rt = ~np.isnan(rt) & (rt != 0)
+        premature = has_rt & (rt < premature_threshold)
+        late = has_rt & ~premature & (rt > late_threshold)
+        return {
+            "Session": np.full(len(flags), session),
+            "IsMatch": match,
+            "UserPressed": pressed,
+            "Correct": (flags & CORRECT) != 0,
+            "RT": rt,
+            "PrematureResponse": premature,
+            "LateResponse": late,
+            "AttentionLapse": match & ~pressed,
+            "ImpulsivityScore": (IMPULSIVITY_PREMATURE_WEIGHT * premature
+                                 + IMPULSIVITY_FALSE_ALARM_WEIGHT * (pressed & ~match)).astype(np.float64),
+        }